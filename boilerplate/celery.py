@@ -3,9 +3,14 @@ import os
 from celery import Celery
 from django.conf import settings
 
+from commons.utils.compression import register_lz4
+
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'boilerplate.settings')
 
+# lz4 is optional, without it only zlib and bzip2 compression are available
+register_lz4()
+
 app = Celery('boilerplate', broker=settings.REDIS_URL, backend=settings.REDIS_URL)
 
 app.config_from_object('django.conf:settings', namespace='CELERY')
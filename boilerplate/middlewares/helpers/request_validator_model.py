@@ -1,4 +1,5 @@
 from pymodm import EmbeddedMongoModel, MongoModel, fields
+from pymongo import ASCENDING, IndexModel
 
 from commons.utils.default_model_manager import DefaultManager
 
@@ -24,8 +25,14 @@ class Params(EmbeddedMongoModel):
 
 class RequestValidationConfig(MongoModel):
     '''Mongo model for request validation config.
+
+    Configs are read on every request and rarely edited, so their queries are cached. Configs edited directly in
+    mongo are picked up within `query_cache_timeout` seconds.
     '''
 
+    query_cache_timeout = 300
+    query_cache_local_ttl = 30
+
     routeName = fields.CharField(required=True)
     method = fields.CharField(required=True)
     isActive = fields.BooleanField(required=True)
@@ -36,4 +43,7 @@ class RequestValidationConfig(MongoModel):
 
     class Meta:
         collection_name = "RequestValidationConfig"
+        indexes = [
+            IndexModel([('routeName', ASCENDING), ('method', ASCENDING)], background=True)
+        ]
         final = True
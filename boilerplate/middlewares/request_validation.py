@@ -6,6 +6,7 @@ from jsonschema import Draft4Validator
 
 from bson.objectid import ObjectId
 from commons.utils.http_error import BadRequest
+from commons.utils.timing import timed
 from django.urls import resolve
 
 from .helpers import RequestValidationConfig
@@ -433,9 +434,13 @@ def request_validator(request_info):
         'method': request_info['method']
     }
 
-    request_config = RequestValidationConfig.objects.get_one(queries=config_query)
+    with timed('validation-config'):
+        request_config = RequestValidationConfig.objects.get_one(queries=config_query)
 
-    if request_config:
+    if not request_config:
+        return True
+
+    with timed('validation'):
         response = {}
         query_param_schema = request_config.get('queryParams')
         url_param_schema = request_config.get('urlParams')
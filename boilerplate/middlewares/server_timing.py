@@ -0,0 +1,71 @@
+import time
+
+from django.conf import settings
+
+from commons.utils.loggers import error_logger
+from commons.utils.metrics import Histogram, HistogramBuffer
+from commons.utils.timing import start_phases, stop_phases
+
+request_phase_latency = Histogram(
+    'http_request_phase_seconds',
+    'Time spent by requests of a route in a phase: validation-config, validation, upstream, mongo, serialize and '
+    'total.'
+)
+
+
+class ServerTimingMiddleware:
+    '''Middleware for timing the phases of a request.
+
+    Phases are timed by the `commons.utils.timing.timed` hooks in request validation, `request_client`,
+    `DefaultManager` and the JSON responses. The timings are sent back in a `Server-Timing` header and recorded
+    into per route histograms. Observations are buffered in the process and flushed to redis in one round trip
+    every SERVER_TIMING_FLUSH_INTERVAL seconds, so a request only pays for a few perf_counter calls.
+
+    Attributes:
+        get_response: handler method of next middleware or view
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.buffer = HistogramBuffer(settings.SERVER_TIMING_FLUSH_INTERVAL)
+
+    def __call__(self, request):
+        '''Handler method for middleware
+
+        Args:
+            request: Django's request object.
+
+        Returns:
+            Response passed by next middleware or view with a Server-Timing header.
+        '''
+
+        token = start_phases()
+        started_at = time.perf_counter()
+
+        try:
+            response = self.get_response(request)
+        finally:
+            total = (time.perf_counter() - started_at) * 1000
+            phases = stop_phases(token)
+
+        if settings.SERVER_TIMING_HEADER:
+            response['Server-Timing'] = ', '.join(
+                [f'{phase};dur={milliseconds:.1f}' for phase, (milliseconds, count) in phases.items()] +
+                [f'total;dur={total:.1f}']
+            )
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        route = resolver_match.url_name if resolver_match and resolver_match.url_name else 'unmatched'
+
+        self.record(route, phases, total)
+
+        return response
+
+    def record(self, route, phases, total):
+        try:
+            for phase, (milliseconds, count) in phases.items():
+                self.buffer.add(request_phase_latency, milliseconds, route=route, phase=phase)
+
+            self.buffer.add(request_phase_latency, total, route=route, phase='total')
+        except Exception:
+            error_logger.exception('SERVER_TIMING_FLUSH_ERROR')
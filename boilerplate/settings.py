@@ -14,7 +14,11 @@ import os
 
 from boilerplate import PROJECT_BASE_DIR
 from celery.schedules import crontab
+from kombu import Queue
 from pymodm import connect
+from pymongo import monitoring
+
+from commons.utils.mongo_monitoring import CommandMonitor
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = PROJECT_BASE_DIR
@@ -35,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'boilerplate.middlewares.server_timing.ServerTimingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'boilerplate.middlewares.request_validation.RequestValidationMiddleware',
     'boilerplate.middlewares.handle_exception.HandleExceptionMiddleware'
@@ -60,6 +65,19 @@ DATABASE_SETTINGS = {
 
 mongo_credentials = DATABASE_SETTINGS['mongodb']
 
+# mongo commands slower than this are logged with their filter shape, with MONGO_SLOW_QUERY_EXPLAIN a sample of
+# each shape is also stored for the explain_slow_queries command
+MONGO_SLOW_QUERY_MS = int(os.environ.get('MONGO_SLOW_QUERY_MS', 100))
+MONGO_SLOW_QUERY_EXPLAIN = os.environ.get('MONGO_SLOW_QUERY_EXPLAIN', 'false').lower() == 'true'
+MONGO_METRICS_FLUSH_INTERVAL = int(os.environ.get('MONGO_METRICS_FLUSH_INTERVAL', 10))
+
+# listeners only apply to clients created after they are registered
+monitoring.register(CommandMonitor(
+    slow_ms=MONGO_SLOW_QUERY_MS,
+    sample=MONGO_SLOW_QUERY_EXPLAIN,
+    flush_interval=MONGO_METRICS_FLUSH_INTERVAL
+))
+
 connect(
     'mongodb://{userpass}{mongo_host}:{mongo_port}/{db}'.format(
         mongo_host=mongo_credentials.get('HOST'),
@@ -99,6 +117,10 @@ REDIS_URL = (
     f"/{str(os.environ.get('REDIS_DBNAME', 14))}"
 )
 
+# pool of the pub/sub subscriptions (slot streams and cache invalidation), separate from the cache pool
+REDIS_SUBSCRIBER_MAX_CONNECTIONS = int(os.environ.get('REDIS_SUBSCRIBER_MAX_CONNECTIONS', 200))
+REDIS_SUBSCRIBER_HEALTH_CHECK_INTERVAL = 30
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
@@ -116,19 +138,176 @@ CACHES = {
 CELERY_ENABLE_UTC = True
 CELERY_TIMEZONE = os.environ.get('TIMEZONE', 'UTC')
 CELERY_RESULT_BACKEND = REDIS_URL
-CELERY_ACCEPT_CONTENT = ['application/json']
-CELERY_RESULT_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['application/json', 'application/x-msgpack']
+CELERY_RESULT_SERIALIZER = os.environ.get('CELERY_RESULT_SERIALIZER', 'json')
+CELERY_RESULT_COMPRESSION = os.environ.get('CELERY_RESULT_COMPRESSION') or None
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_CACHE_BACKEND = 'default'
 
+# every workload has its own queue and worker pool, see start.sh, so OTP emails never wait behind the hourly
+# sweep and slow SMTP sessions never hold up fetching
+CELERY_TASK_QUEUES = (
+    Queue('otp', routing_key='otp'),
+    Queue('fetch', routing_key='fetch'),
+    Queue('match', routing_key='match'),
+    Queue('notify', routing_key='notify'),
+)
+CELERY_TASK_DEFAULT_QUEUE = 'match'
+CELERY_TASK_ROUTES = {
+    'vaccine.tasks.send_otp_email': {'queue': 'otp'},
+    'vaccine.tasks.fetch_vaccine_availability': {'queue': 'fetch'},
+    'vaccine.tasks.refresh_district_catalogue': {'queue': 'fetch'},
+    'vaccine.tasks.send_vaccine_alert': {'queue': 'match'},
+    'vaccine.tasks.drain_slot_events': {'queue': 'match'},
+    # matches and sends in the same task, direct delivery (ALERT_DIGEST_WINDOW=0) waits on SMTP and webhooks
+    'vaccine.tasks.deliver_slot_events': {'queue': 'notify'},
+    'vaccine.tasks._report_task': {'queue': 'match'},
+    'vaccine.tasks.alert_open_sessions': {'queue': 'notify'},
+    'vaccine.tasks.send_alert_digests': {'queue': 'notify'},
+    'vaccine.tasks.send_email_outbox': {'queue': 'notify'},
+}
+
 CELERY_BEAT_SCHEDULE = {
     'send_vaccine_alert': {
         'task': 'vaccine.tasks.send_vaccine_alert',
         'schedule': crontab(minute=10)
+    },
+    'drain_slot_events': {
+        'task': 'vaccine.tasks.drain_slot_events',
+        'schedule': 60.0
+    },
+    'send_alert_digests': {
+        'task': 'vaccine.tasks.send_alert_digests',
+        'schedule': 15.0
+    },
+    'send_email_outbox': {
+        'task': 'vaccine.tasks.send_email_outbox',
+        'schedule': 60.0
+    },
+    'refresh_district_catalogue': {
+        'task': 'vaccine.tasks.refresh_district_catalogue',
+        'schedule': crontab(hour=2, minute=30)
     }
 }
 
 ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY')
 
+# bearer token of the admin endpoints, which are disabled without it
+ADMIN_API_TOKEN = os.environ.get('ADMIN_API_TOKEN')
+ADMIN_PAGE_MAX_LIMIT = 500
+
 GMAIL_USER = os.environ.get('GMAIL_USER')
 GMAIL_PASSWORD = os.environ.get('GMAIL_PASSWORD')
+
+# seconds after which a queued OTP email is discarded instead of sent
+OTP_EMAIL_EXPIRES = int(os.environ.get('OTP_EMAIL_EXPIRES', 10 * 60))
+
+# sender accounts of alert emails in order of use, GMAIL_ACCOUNTS adds overflow accounts as user:password,...
+GMAIL_DAILY_QUOTA = int(os.environ.get('GMAIL_DAILY_QUOTA', 500))
+GMAIL_ACCOUNTS = [
+    {'user': user, 'password': password, 'daily_quota': GMAIL_DAILY_QUOTA}
+    for user, password in [(GMAIL_USER, GMAIL_PASSWORD)] + [
+        tuple(account.split(':', 1)) for account in os.environ.get('GMAIL_ACCOUNTS', '').split(',') if ':' in account
+    ]
+]
+
+NOTIFIER_BACKENDS = {
+    'email': {
+        'BACKEND': 'commons.utils.notifiers.OutboxNotifier',
+        'OPTIONS': {
+            'accounts': GMAIL_ACCOUNTS,
+            'name': 'email',
+            'max_age': int(os.environ.get('EMAIL_OUTBOX_MAX_AGE', 6 * 60 * 60)),
+            'burst': int(os.environ.get('EMAIL_SEND_BURST', 10))
+        }
+    },
+    'smtp': {
+        'BACKEND': 'commons.utils.notifiers.SMTPNotifier',
+        'OPTIONS': {
+            'user': GMAIL_USER,
+            'password': GMAIL_PASSWORD,
+            'batch_size': int(os.environ.get('SMTP_NOTIFIER_BATCH_SIZE', 100)),
+            'concurrency': int(os.environ.get('SMTP_NOTIFIER_CONCURRENCY', 2))
+        }
+    },
+    'webhook': {
+        'BACKEND': 'commons.utils.notifiers.WebhookNotifier',
+        'OPTIONS': {
+            'url': os.environ.get('ALERT_WEBHOOK_URL'),
+            'headers': {'Authorization': os.environ.get('ALERT_WEBHOOK_AUTHORIZATION', '')},
+            'batch_size': int(os.environ.get('WEBHOOK_NOTIFIER_BATCH_SIZE', 100)),
+            'concurrency': int(os.environ.get('WEBHOOK_NOTIFIER_CONCURRENCY', 16))
+        }
+    },
+    'file': {
+        'BACKEND': 'commons.utils.notifiers.FileNotifier',
+        'OPTIONS': {
+            'path': os.environ.get('ALERT_FILE_SINK', os.path.join(BASE_DIR, 'log', 'alerts.ndjson'))
+        }
+    }
+}
+
+# names of NOTIFIER_BACKENDS every vaccine alert is dispatched to
+ALERT_NOTIFIERS = os.environ.get('ALERT_NOTIFIERS', 'email').split(',')
+
+# send request phase timings to clients, the per route histograms are recorded either way
+SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', 'true').lower() == 'true'
+SERVER_TIMING_FLUSH_INTERVAL = int(os.environ.get('SERVER_TIMING_FLUSH_INTERVAL', 10))
+
+# bearer token of the /metrics scrape endpoint, which is disabled without it
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+REFERENCE_RESPONSE_MAX_AGE = int(os.environ.get('REFERENCE_RESPONSE_MAX_AGE', 86400))
+
+DISTRICT_CATALOGUE_SNAPSHOT = os.path.join(BASE_DIR, 'vaccine', 'data', 'districts.json')
+# district lists outlive one daily refresh, so a state failing to refresh keeps its last list for a day
+DISTRICT_CATALOGUE_TIMEOUT = int(os.environ.get('DISTRICT_CATALOGUE_TIMEOUT', 2 * 86400))
+DISTRICT_CATALOGUE_LOCAL_TTL = int(os.environ.get('DISTRICT_CATALOGUE_LOCAL_TTL', 300))
+
+PINCODE_TABLE_PATH = os.path.join(BASE_DIR, 'vaccine', 'data', 'pincodes.bin')
+
+# pincodes fetched by one sweep task, sweep messages carry only the pincodes
+SWEEP_CHUNK_SIZE = int(os.environ.get('SWEEP_CHUNK_SIZE', 5))
+
+# serializer and compression (zlib, bz2 or lz4) of sweep messages, compare them with benchmark_task_serializers
+SWEEP_TASK_SERIALIZER = os.environ.get('SWEEP_TASK_SERIALIZER', 'msgpack')
+SWEEP_TASK_COMPRESSION = os.environ.get('SWEEP_TASK_COMPRESSION') or None
+
+CALENDAR_SNAPSHOT_TIMEOUT = int(os.environ.get('CALENDAR_SNAPSHOT_TIMEOUT', 2 * 60 * 60))
+# sessions open in the last sweep of a pincode, compared against to detect openings, outlive the snapshot
+CALENDAR_OPEN_SESSIONS_TIMEOUT = int(os.environ.get('CALENDAR_OPEN_SESSIONS_TIMEOUT', 7 * 24 * 60 * 60))
+CALENDAR_CACHE_TIMEOUT = int(os.environ.get('CALENDAR_CACHE_TIMEOUT', 60))
+# calendars of hot pincodes and districts kept in process memory, for at most CALENDAR_LOCAL_STALENESS seconds
+CALENDAR_LOCAL_CACHE_SIZE = int(os.environ.get('CALENDAR_LOCAL_CACHE_SIZE', 1000))
+CALENDAR_LOCAL_STALENESS = int(os.environ.get('CALENDAR_LOCAL_STALENESS', 5))
+CALENDAR_COALESCE_TIMEOUT = 5
+CALENDAR_BATCH_CONCURRENCY = int(os.environ.get('CALENDAR_BATCH_CONCURRENCY', 8))
+CALENDAR_BATCH_MAX_LOOKUPS = 20
+CALENDAR_BATCH_MAX_WEEKS = 4
+
+GEO_INDEX_CELL_SIZE = 0.1
+GEO_INDEX_REFRESH_SECONDS = int(os.environ.get('GEO_INDEX_REFRESH_SECONDS', 60))
+GEO_SEARCH_MAX_RADIUS_KM = 50
+
+SLOT_STREAM_MAX_CHANNELS = 20
+SLOT_STREAM_HEARTBEAT = 15
+SLOT_STREAM_MAX_DURATION = int(os.environ.get('SLOT_STREAM_MAX_DURATION', 300))
+
+SLOT_EVENT_STREAM_MAXLEN = int(os.environ.get('SLOT_EVENT_STREAM_MAXLEN', 100000))
+SLOT_EVENT_READ_COUNT = int(os.environ.get('SLOT_EVENT_READ_COUNT', 500))
+SLOT_EVENT_MAX_PENDING = int(os.environ.get('SLOT_EVENT_MAX_PENDING', 20000))
+SLOT_EVENT_CLAIM_IDLE_MS = 5 * 60 * 1000
+SLOT_EVENT_MAX_DELIVERIES = 5
+SLOT_EVENT_DELIVERY_BUDGET = 50
+
+# expected (subscriber, session) alerts per notifier per day and the tolerated share of skipped alerts
+ALERT_DEDUP_CAPACITY = int(os.environ.get('ALERT_DEDUP_CAPACITY', 10000000))
+ALERT_DEDUP_ERROR_RATE = float(os.environ.get('ALERT_DEDUP_ERROR_RATE', 0.001))
+
+# seconds for which matched slots of a subscriber are collected into one alert, 0 sends every match right away
+ALERT_DIGEST_WINDOW = int(os.environ.get('ALERT_DIGEST_WINDOW', 120))
+ALERT_DIGEST_RETRY_DELAY = 300
+# seconds a worker may hold a claimed digest before it is due again, and claims after which it is dead lettered
+ALERT_DIGEST_LEASE = 600
+ALERT_DIGEST_MAX_ATTEMPTS = 5
+ALERT_DIGEST_FLUSH_COUNT = 500
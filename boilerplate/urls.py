@@ -15,8 +15,11 @@ Including another URLconf
 '''
 from django.urls import include, path, re_path
 
+from commons.views import metrics_view
+
 urlpatterns = [
     path('vaccine/', include('vaccine.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 handler400 = 'commons.views.http_bad_request_view'
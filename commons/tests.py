@@ -0,0 +1,492 @@
+import base64
+import json
+from datetime import datetime
+from unittest import mock
+
+from bson.objectid import ObjectId
+from bson.tz_util import utc
+from django.test import SimpleTestCase
+
+from commons.utils.bloom import RedisBloomFilter
+from commons.utils.default_model_manager import DefaultManager, invalidates_query_cache
+from commons.utils.http_error import BadRequest
+from commons.utils.notifiers.outbox import SendQuota, SMTPAccount
+from commons.utils.pagination import create_cursor_pagination_url, decode_cursor, encode_cursor
+from commons.utils.query_cache import get_query_cache
+from commons.utils.tiered_cache import InvalidationListener, LocalCache, invalidation_listener
+
+
+class FakeRedis(object):
+    '''In memory stand-in for the few redis commands used by the utilities under test.
+    '''
+
+    def __init__(self):
+        self.bits = {}
+        self.values = {}
+        self.expiries = {}
+        self.messages = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def getbit(self, key, position):
+        return self.bits.get((key, position), 0)
+
+    def setbit(self, key, position, value):
+        self.bits[(key, position)] = value
+
+    def expire(self, key, seconds):
+        self.expiries[key] = seconds
+
+    def get(self, key):
+        value = self.values.get(key)
+        return None if value is None else str(value).encode()
+
+    def exists(self, key):
+        return int(key in self.values)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+        if ex is not None:
+            self.expiries[key] = ex
+
+    def incrby(self, key, amount):
+        self.values[key] = int(self.values.get(key, 0)) + amount
+        return self.values[key]
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def hget(self, key, field):
+        value = self.values.get(key, {}).get(field)
+        return None if value is None else value.encode()
+
+    def hset(self, key, field, value):
+        self.values.setdefault(key, {})[field] = value
+
+    def publish(self, channel, message):
+        self.messages.append((channel, json.loads(message)))
+
+
+class FailingRedis(FakeRedis):
+
+    def hget(self, key, field):
+        raise ConnectionError('redis is down')
+
+    def delete(self, key):
+        raise ConnectionError('redis is down')
+
+
+class FakePipeline(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((getattr(self.client, name), args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        replies = [command(*args, **kwargs) for command, args, kwargs in self.commands]
+        self.commands = []
+        return replies
+
+
+class RedisBloomFilterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.client = FakeRedis()
+        self.bloom = RedisBloomFilter('bloom', 1000, 0.01, 60, client=self.client)
+
+    def test_sizing(self):
+        # about 9.6 bits and 7 hashes per item at 1%
+        self.assertEqual(self.bloom.size, 9586)
+        self.assertEqual(self.bloom.hashes, 7)
+
+    def test_size_is_capped(self):
+        bloom = RedisBloomFilter('bloom', 10 ** 10, 0.0001, 60, client=self.client)
+
+        self.assertEqual(bloom.size, 2 ** 32)
+
+    def test_positions_are_stable_and_in_range(self):
+        positions = self.bloom.positions('user@example.com:1:abc')
+
+        self.assertEqual(positions, self.bloom.positions('user@example.com:1:abc'))
+        self.assertEqual(len(positions), self.bloom.hashes)
+        self.assertTrue(all(0 <= position < self.bloom.size for position in positions))
+
+    def test_added_items_are_found(self):
+        items = [f'user{index}@example.com:{index}:session' for index in range(200)]
+
+        self.assertEqual(self.bloom.contains_many(items), [False] * len(items))
+
+        self.bloom.add_many(items)
+
+        self.assertEqual(self.bloom.contains_many(items), [True] * len(items))
+        self.assertEqual(self.client.expiries['bloom'], 60)
+
+    def test_false_positive_rate(self):
+        self.bloom.add_many([f'added{index}' for index in range(1000)])
+
+        false_positives = sum(self.bloom.contains_many([f'other{index}' for index in range(2000)]))
+
+        self.assertLess(false_positives / 2000, 0.03)
+
+    def test_empty_batches_skip_redis(self):
+        self.assertEqual(self.bloom.contains_many([]), [])
+
+        self.bloom.add_many([])
+
+        self.assertEqual(self.client.bits, {})
+        self.assertEqual(self.client.expiries, {})
+
+
+class FixedDatetime(datetime):
+    current = datetime(2021, 5, 10, 12, 0)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+@mock.patch('commons.utils.notifiers.outbox.datetime', FixedDatetime)
+class SendQuotaTests(SimpleTestCase):
+
+    def setUp(self):
+        FixedDatetime.current = datetime(2021, 5, 10, 12, 0)
+        self.client = FakeRedis()
+        self.first = SMTPAccount('first@example.com', 'secret', 1440)
+        self.second = SMTPAccount('second@example.com', 'secret', 500)
+        self.quota = SendQuota([self.first, self.second], self.client)
+
+    def test_remaining_counts_sends_and_cool_downs(self):
+        self.assertEqual(self.quota.remaining(), {'first@example.com': 1440, 'second@example.com': 500})
+
+        self.quota.consume(self.first, 40)
+        self.quota.consume(self.first, 0)
+        self.quota.cool_down(self.second, 300)
+
+        self.assertEqual(self.quota.remaining(), {'first@example.com': 1400, 'second@example.com': 0})
+        self.assertEqual(self.client.expiries['notify:quota-cooldown:second@example.com'], 300)
+
+    def test_exhausted_accounts_have_nothing_left(self):
+        self.quota.exhaust(self.second)
+
+        self.assertEqual(self.quota.remaining()['second@example.com'], 0)
+        self.assertEqual(self.client.values['notify:quota:second@example.com:20210510'], 500)
+
+    def test_counts_reset_daily(self):
+        self.quota.consume(self.first, 1000)
+        FixedDatetime.current = datetime(2021, 5, 11, 0, 30)
+
+        self.assertEqual(self.quota.remaining()['first@example.com'], 1440)
+
+    def test_allowances_spread_the_quota_over_the_day(self):
+        # 720 minutes left: 1440 / 720 = 2 sends per minute, 500 / 720 rounds up to 1
+        self.assertEqual(self.quota.allowances(1), {'first@example.com': 2, 'second@example.com': 1})
+        self.assertEqual(self.quota.allowances(5), {'first@example.com': 10, 'second@example.com': 4})
+
+    def test_allowances_never_exceed_the_remaining_quota(self):
+        FixedDatetime.current = datetime(2021, 5, 10, 23, 59, 30)
+        self.quota.consume(self.second, 497)
+
+        self.assertEqual(self.quota.allowances(5), {'first@example.com': 1440, 'second@example.com': 3})
+
+    def test_allowances_of_accounts_cooling_down(self):
+        self.quota.cool_down(self.first, 60)
+
+        self.assertEqual(self.quota.allowances(5)['first@example.com'], 0)
+
+
+class CursorTests(SimpleTestCase):
+
+    def token(self, value):
+        return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+    def test_round_trip(self):
+        object_id = ObjectId()
+
+        for position in [
+            (datetime(2021, 5, 10, 12, 30, tzinfo=utc), object_id),
+            (560001, object_id),
+            ('someone@example.com', object_id),
+            (None, object_id),
+        ]:
+            token = encode_cursor(position)
+
+            self.assertNotIn('=', token)
+            self.assertEqual(decode_cursor(token), position)
+
+    def test_first_and_last_pages(self):
+        self.assertIsNone(encode_cursor(None))
+        self.assertIsNone(decode_cursor(None))
+        self.assertIsNone(decode_cursor(''))
+        self.assertIsNone(create_cursor_pagination_url('/users', None))
+
+    def test_pagination_url_carries_the_cursor(self):
+        token = encode_cursor((1, ObjectId()))
+
+        self.assertEqual(
+            create_cursor_pagination_url('/users', token, 20, {'role': 'admin'}),
+            f'/users?limit=20&role=admin&cursor={token}',
+        )
+
+    def test_invalid_tokens(self):
+        for token in ('!!!!', 'bm90IGpzb24', base64.urlsafe_b64encode(b'\xff\xfe').decode()):
+            with self.assertRaises(BadRequest):
+                decode_cursor(token)
+
+    def test_malformed_positions(self):
+        object_id = {'$oid': str(ObjectId())}
+
+        for position in ({'a': 1}, [1], [1, object_id, 2], 'position', 12):
+            with self.assertRaises(BadRequest):
+                decode_cursor(self.token(position))
+
+    def test_operators_are_rejected(self):
+        object_id = {'$oid': str(ObjectId())}
+
+        for position in ([{'$gt': ''}, object_id], [1, {'$ne': None}], [[1, 2], object_id]):
+            with self.assertRaises(BadRequest):
+                decode_cursor(self.token(position))
+
+
+class CachedModel(object):
+    query_cache_timeout = 60
+    _mongometa = mock.Mock(collection_name='cached')
+
+
+class CachedManager(object):
+    model = CachedModel
+
+    @invalidates_query_cache
+    def write(self, fail=False):
+        if fail:
+            raise ValueError('write failed')
+
+        return 'written'
+
+
+@mock.patch.object(invalidation_listener, 'ensure_started', lambda: None)
+@mock.patch.object(invalidation_listener, 'connected', True)
+@mock.patch.dict('commons.utils.query_cache.query_caches', clear=True)
+class QueryCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.client = FakeRedis()
+
+        for target in ('commons.utils.query_cache.get_redis_client', 'commons.utils.tiered_cache.get_redis_client'):
+            patcher = mock.patch(target, return_value=self.client)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_models_opt_in(self):
+        self.assertIsNone(get_query_cache(object))
+        self.assertIs(get_query_cache(CachedModel), get_query_cache(CachedModel))
+
+    def test_hit_and_miss(self):
+        query_cache = get_query_cache(CachedModel)
+        document = {'_id': ObjectId(), 'email': 'user@example.com'}
+        loader = mock.Mock(return_value=document)
+
+        self.assertEqual(query_cache.get_or_load('get_one', {'email': 'user@example.com'}, None, loader), document)
+        self.assertEqual(query_cache.get_or_load('get_one', {'email': 'user@example.com'}, None, loader), document)
+        self.assertEqual(loader.call_count, 1)
+
+        # a different projection is a different query
+        query_cache.get_or_load('get_one', {'email': 'user@example.com'}, {'email': 1}, loader)
+        self.assertEqual(loader.call_count, 2)
+
+    def test_results_are_copies(self):
+        query_cache = get_query_cache(CachedModel)
+        result = query_cache.get_or_load('get_one', {}, None, lambda: {'tags': ['a']})
+        result['tags'].append('b')
+
+        self.assertEqual(query_cache.get_or_load('get_one', {}, None, None), {'tags': ['a']})
+
+    def test_redis_serves_other_processes(self):
+        query_cache = get_query_cache(CachedModel)
+        object_id = ObjectId()
+        query_cache.get_or_load('get_by_id', {'_id': object_id}, None, lambda: {'_id': object_id})
+
+        # as in a process whose local tier is empty
+        query_cache.local.clear()
+        loader = mock.Mock()
+
+        self.assertEqual(query_cache.get_or_load('get_by_id', {'_id': object_id}, None, loader), {'_id': object_id})
+        loader.assert_not_called()
+        self.assertEqual(self.client.expiries['query-cache:cached'], 60)
+
+    def test_missing_documents_are_cached(self):
+        query_cache = get_query_cache(CachedModel)
+        loader = mock.Mock(return_value=None)
+
+        self.assertIsNone(query_cache.get_or_load('get_one', {'email': 'nobody@example.com'}, None, loader))
+        self.assertIsNone(query_cache.get_or_load('get_one', {'email': 'nobody@example.com'}, None, loader))
+
+        query_cache.local.clear()
+
+        self.assertIsNone(query_cache.get_or_load('get_one', {'email': 'nobody@example.com'}, None, loader))
+        self.assertEqual(loader.call_count, 1)
+
+    def test_writes_invalidate(self):
+        query_cache = get_query_cache(CachedModel)
+        loader = mock.Mock(return_value={'email': 'user@example.com'})
+        query_cache.get_or_load('get_one', {}, None, loader)
+
+        self.assertEqual(CachedManager().write(), 'written')
+
+        self.assertNotIn('query-cache:cached', self.client.values)
+        self.assertEqual(self.client.messages[-1][1]['cache'], 'query-cache:cached')
+        self.assertIsNone(self.client.messages[-1][1]['keys'])
+
+        query_cache.get_or_load('get_one', {}, None, loader)
+        self.assertEqual(loader.call_count, 2)
+
+    def test_failed_writes_invalidate(self):
+        query_cache = get_query_cache(CachedModel)
+        loader = mock.Mock(return_value={'email': 'user@example.com'})
+        query_cache.get_or_load('get_one', {}, None, loader)
+
+        with self.assertRaises(ValueError):
+            CachedManager().write(fail=True)
+
+        query_cache.get_or_load('get_one', {}, None, loader)
+        self.assertEqual(loader.call_count, 2)
+
+    def test_every_write_method_invalidates(self):
+        wrapper_code = invalidates_query_cache(lambda self: None).__code__
+
+        for name in (
+            'insert_one', 'insert_many', 'update_one', 'find_one_and_update', 'update_by_id', 'update_many',
+            'remove', 'remove_one'
+        ):
+            self.assertIs(getattr(DefaultManager, name).__code__, wrapper_code, name)
+
+    def test_redis_errors_fall_back_to_the_loader(self):
+        query_cache = get_query_cache(CachedModel)
+        loader = mock.Mock(return_value={'email': 'user@example.com'})
+        failing_client = FailingRedis()
+
+        with mock.patch('commons.utils.query_cache.get_redis_client', return_value=failing_client):
+            self.assertEqual(query_cache.get_or_load('get_one', {}, None, loader), {'email': 'user@example.com'})
+            self.assertEqual(query_cache.get_or_load('get_one', {}, None, loader), {'email': 'user@example.com'})
+            self.assertEqual(loader.call_count, 2)
+
+            # the write itself is not failed by the cache
+            self.assertEqual(CachedManager().write(), 'written')
+
+    def test_failed_fills_keep_the_local_result(self):
+        query_cache = get_query_cache(CachedModel)
+        loader = mock.Mock(return_value={'email': 'user@example.com'})
+
+        with mock.patch.object(self.client, 'pipeline', side_effect=ConnectionError('redis is down')):
+            query_cache.get_or_load('get_one', {}, None, loader)
+
+        query_cache.get_or_load('get_one', {}, None, loader)
+        self.assertEqual(loader.call_count, 1)
+
+
+@mock.patch.object(invalidation_listener, 'ensure_started', lambda: None)
+@mock.patch.object(invalidation_listener, 'connected', True)
+@mock.patch('commons.utils.tiered_cache.time.monotonic', return_value=100.0)
+class LocalCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.local = LocalCache('local-test', 2, 10)
+
+    def test_entries_expire_after_the_staleness_bound(self, monotonic):
+        self.local.set('calendar', {'centers': []})
+        monotonic.return_value = 109.0
+
+        self.assertEqual(self.local.get('calendar'), (True, {'centers': []}))
+
+        monotonic.return_value = 110.0
+
+        self.assertEqual(self.local.get('calendar'), (False, None))
+        self.assertNotIn('calendar', self.local.entries)
+
+    def test_shorter_timeouts_win(self, monotonic):
+        self.local.set('calendar', {'centers': []}, timeout=3)
+        monotonic.return_value = 103.0
+
+        self.assertEqual(self.local.get('calendar'), (False, None))
+
+    def test_least_recently_used_entries_are_evicted(self, monotonic):
+        self.local.set('first', 1)
+        self.local.set('second', 2)
+        self.local.get('first')
+        self.local.set('third', 3)
+
+        self.assertEqual(list(self.local.entries), ['first', 'third'])
+
+    def test_values_read_during_an_invalidation_are_dropped(self, monotonic):
+        generation = self.local.generation
+        self.local.delete(['calendar'])
+        self.local.set('calendar', 'stale', generation=generation)
+
+        self.assertEqual(self.local.get('calendar'), (False, None))
+
+        self.local.set('calendar', 'fresh', generation=self.local.generation)
+
+        self.assertEqual(self.local.get('calendar'), (True, 'fresh'))
+
+    def test_bypassed_while_disconnected(self, monotonic):
+        self.local.set('calendar', 'cached')
+
+        with mock.patch.object(invalidation_listener, 'connected', False):
+            self.assertEqual(self.local.get('calendar'), (False, None))
+
+        self.assertEqual(self.local.get('calendar'), (True, 'cached'))
+
+
+class InvalidationListenerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.client = FakeRedis()
+        self.listener = InvalidationListener()
+        self.listener.origin = 'this-process'
+        self.local = LocalCache('listener-test', 10, 60)
+        self.listener.register(self.local)
+        self.local.set('first', 1)
+        self.local.set('second', 2)
+
+    def invalidation(self, keys, origin='other-process', cache='listener-test'):
+        return json.dumps({'cache': cache, 'keys': keys, 'origin': origin}).encode()
+
+    def test_invalidations_of_other_processes_drop_keys(self):
+        self.listener.handle(self.invalidation(['first']))
+
+        self.assertEqual(list(self.local.entries), ['second'])
+        self.assertEqual(self.local.generation, 1)
+
+        self.listener.handle(self.invalidation(None))
+
+        self.assertEqual(self.local.entries, {})
+
+    def test_own_invalidations_are_skipped(self):
+        self.listener.handle(self.invalidation(None, origin='this-process'))
+
+        self.assertEqual(len(self.local.entries), 2)
+        self.assertEqual(self.local.generation, 0)
+
+    def test_unknown_caches_and_malformed_messages_are_ignored(self):
+        self.listener.handle(self.invalidation(None, cache='other-cache'))
+        self.listener.handle(b'not json')
+
+        self.assertEqual(len(self.local.entries), 2)
+
+    def test_published_invalidations_carry_the_origin(self):
+        with mock.patch.object(self.listener, 'ensure_started'), \
+                mock.patch('commons.utils.tiered_cache.get_redis_client', return_value=self.client):
+            self.listener.publish('listener-test', ['first'])
+
+        self.assertEqual(
+            self.client.messages,
+            [('cache:invalidate', {'cache': 'listener-test', 'keys': ['first'], 'origin': 'this-process'})]
+        )
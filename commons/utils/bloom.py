@@ -0,0 +1,80 @@
+import hashlib
+import math
+
+from commons.utils.redis_manager import get_redis_client
+
+MAX_BITMAP_SIZE = 2 ** 32
+
+
+class RedisBloomFilter(object):
+    '''Bloom filter kept in a redis bitmap.
+
+    The bitmap is sized for `capacity` items at a false positive rate of `error_rate`, so memory is fixed up front
+    (about 1.8 bytes per item at 0.1%) instead of growing with the items stored. Bit positions come from double
+    hashing one blake2b digest, and every bulk operation is a single pipelined round trip.
+
+    Attributes:
+        key: redis key of the bitmap.
+        size: number of bits in the bitmap.
+        hashes: number of bits set per item.
+        ttl: seconds after the last write at which the bitmap expires.
+        client: redis client.
+    '''
+
+    def __init__(self, key, capacity, error_rate, ttl, client=None):
+        self.key = key
+        self.size = min(int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))), MAX_BITMAP_SIZE)
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.ttl = ttl
+        self.client = client or get_redis_client()
+
+    def positions(self, item):
+        '''Returns the bit positions of an item.
+        '''
+
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def contains_many(self, items):
+        '''Checks items against the filter.
+
+        Args:
+            items: list of strings.
+
+        Returns:
+            List of booleans, True if the item was probably added before and False if it definitely was not.
+        '''
+
+        if not items:
+            return []
+
+        pipeline = self.client.pipeline(transaction=False)
+
+        for item in items:
+            for position in self.positions(item):
+                pipeline.getbit(self.key, position)
+
+        bits = pipeline.execute()
+
+        return [all(bits[index:index + self.hashes]) for index in range(0, len(bits), self.hashes)]
+
+    def add_many(self, items):
+        '''Adds items to the filter and refreshes its expiry.
+
+        Args:
+            items: list of strings.
+        '''
+
+        if not items:
+            return
+
+        pipeline = self.client.pipeline(transaction=False)
+
+        for item in items:
+            for position in self.positions(item):
+                pipeline.setbit(self.key, position, 1)
+
+        pipeline.expire(self.key, self.ttl)
+        pipeline.execute()
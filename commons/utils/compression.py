@@ -0,0 +1,17 @@
+from kombu import compression
+
+
+def register_lz4():
+    '''Registers lz4 frame compression with kombu under the `lz4` alias when the lz4 package is installed.
+
+    Returns:
+        True if lz4 can be used as a task or result compression.
+    '''
+
+    try:
+        import lz4.frame
+    except ImportError:
+        return False
+
+    compression.register(lz4.frame.compress, lz4.frame.decompress, 'application/x-lz4', aliases=['lz4'])
+    return True
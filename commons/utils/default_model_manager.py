@@ -1,10 +1,40 @@
+import functools
+
 from bson.objectid import ObjectId
 from pymodm.manager import Manager
+from pymongo import ASCENDING
 from pymongo.collection import ReturnDocument
 
+from commons.utils.query_cache import get_query_cache
+from commons.utils.timing import timed
+
+
+def invalidates_query_cache(method):
+    '''Decorator of the write methods of DefaultManager, drops the cached queries of the model once the write is done.
+    '''
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            query_cache = get_query_cache(self.model)
+
+            if query_cache:
+                query_cache.invalidate()
+
+    return wrapper
+
 
 class DefaultManager(Manager):
+    '''Manager with the common queries of the models.
 
+    Models opt in to a read-through cache of `get_by_id` and `get_one` by setting `query_cache_timeout`, see
+    `commons.utils.query_cache.QueryCache`. Every write method drops the cached queries of the model. Only the
+    queries which reach mongo are timed in the `mongo` phase.
+    '''
+
+    @timed('mongo')
     def get_all(self, filters=None, queries=None, projection=None, limit=None, offset=None, sort=None):
         '''Lists all model documents matching method args
 
@@ -44,6 +74,88 @@ class DefaultManager(Manager):
             resources = resources.limit(limit)
         return list(resources.values())
 
+    @timed('mongo')
+    def get_keyset_page(self, limit, queries=None, projection=None, sort_key='_id', after=None):
+        '''Lists a page of model documents ordered by a sort key, starting after a position.
+
+        Pages are found by seeking to the position in the sort key's index instead of skipping the documents of
+        the previous pages, so every page costs the same at any depth. Documents sharing a sort key value are
+        ordered by _id.
+
+        Args:
+            limit: integer number of documents in the page.
+            queries: dictionary of parameters to find the required documents.
+            projection: dict of projection.
+            sort_key: field the documents are ordered by, ascending.
+            after: (optional) position returned with the previous page.
+
+        Returns:
+            A tuple of the list of model dictionaries and the position after the last one, None on the last page.
+        '''
+
+        query = dict(queries or {})
+
+        if after is not None:
+            sort_value, last_id = after
+
+            if sort_key == '_id':
+                position = {'_id': {'$gt': last_id}}
+            else:
+                position = {
+                    '$or': [
+                        {sort_key: {'$gt': sort_value}},
+                        {sort_key: sort_value, '_id': {'$gt': last_id}}
+                    ]
+                }
+
+            query = {'$and': [query, position]} if query else position
+
+        sort = [('_id', ASCENDING)] if sort_key == '_id' else [(sort_key, ASCENDING), ('_id', ASCENDING)]
+
+        # the sort key and _id make up the position so they are always fetched
+        hide_id = False
+        resources = self.model.objects.raw(query)
+
+        if projection:
+            projection = dict(projection)
+            hide_id = not projection.pop('_id', True)
+
+            if any(projection.values()):
+                projection[sort_key] = 1
+
+            if projection:
+                resources = resources.project(projection)
+
+        documents = list(resources.order_by(sort).limit(limit + 1).values())
+        next_position = None
+
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_position = (documents[-1].get(sort_key), documents[-1]['_id'])
+
+        if hide_id:
+            for document in documents:
+                document.pop('_id', None)
+
+        return documents, next_position
+
+    def iter_keyset(self, queries=None, projection=None, sort_key='_id', batch_size=500):
+        '''Yields all model documents matching the query in pages of `batch_size`, see `get_keyset_page`.
+        '''
+
+        position = None
+
+        while True:
+            documents, position = self.get_keyset_page(
+                batch_size, queries=queries, projection=projection, sort_key=sort_key, after=position
+            )
+
+            for document in documents:
+                yield document
+
+            if position is None:
+                return
+
     def get_by_id(self, _id, projection=None):
         '''Lists a single model document matching ObjectId.
 
@@ -57,14 +169,13 @@ class DefaultManager(Manager):
             A single model dictionary matching the ObjectId.
         '''
 
-        result = self.model.objects.raw({'_id': ObjectId(_id)})
-        if projection:
-            result = result.project(projection)
-        try:
-            result = result.values().first()
-        except self.model.DoesNotExist:
-            result = None
-        return result
+        query = {'_id': ObjectId(_id)}
+        query_cache = get_query_cache(self.model)
+
+        if query_cache:
+            return query_cache.get_or_load('get_by_id', query, projection, lambda: self.__find_first(query, projection))
+
+        return self.__find_first(query, projection)
 
     def get_one(self, queries=None, filters=None, projection=None):
         '''Lists a single model document matching the args.
@@ -89,6 +200,16 @@ class DefaultManager(Manager):
                 '$and': filters
             }
 
+        query_cache = get_query_cache(self.model)
+
+        if query_cache:
+            return query_cache.get_or_load('get_one', query, projection, lambda: self.__find_first(query, projection))
+
+        return self.__find_first(query, projection)
+
+    @timed('mongo')
+    def __find_first(self, query, projection=None):
+
         result = self.model.objects.raw(query)
 
         if projection:
@@ -100,6 +221,8 @@ class DefaultManager(Manager):
 
         return result
 
+    @invalidates_query_cache
+    @timed('mongo')
     def insert_one(self, data):
         '''Inserts a single model document matching id.
 
@@ -115,13 +238,17 @@ class DefaultManager(Manager):
         new_resource = self.model.from_document(data)
         return new_resource.save().to_son().to_dict()
 
-    def insert_many(self, data):
+    @invalidates_query_cache
+    @timed('mongo')
+    def insert_many(self, data, ordered=True):
         '''Inserts multiple model documents
 
         Inserts new model documents list after validating the fields in each doc of data list.
 
         Args:
             data: list of dictionaries of data for the specific model
+            ordered: If set to False the server inserts every valid document instead of stopping at the first
+                     failing one, failures are raised together in a BulkWriteError
 
         Returns:
             Insert Many response containing list of ids of the saved documents
@@ -129,9 +256,19 @@ class DefaultManager(Manager):
 
         new_resources = [self.model.from_document(doc) for doc in data]
 
-        response = self.model.objects.bulk_create(new_resources, full_clean=True)
-        return response
+        if ordered:
+            return self.model.objects.bulk_create(new_resources, full_clean=True)
+
+        for resource in new_resources:
+            resource.full_clean()
 
+        response = self.model._mongometa.collection.insert_many(
+            [resource.to_son() for resource in new_resources], ordered=False
+        )
+        return response.inserted_ids
+
+    @invalidates_query_cache
+    @timed('mongo')
     def update_one(self, data, filters=None, projection=None, upsert=False, queries=None, return_document=None):
         '''Updates a single document matching query criteria.
 
@@ -215,6 +352,43 @@ class DefaultManager(Manager):
             response = update_response
         return response
 
+    @invalidates_query_cache
+    @timed('mongo')
+    def find_one_and_update(self, data, queries=None, filters=None, projection=None, upsert=False,
+                            return_document=ReturnDocument.AFTER):
+        '''Atomically updates a single document matching query criteria in one round trip.
+
+        Unlike `update_one`, which reads the matching document before and after writing it, the conditions of the
+        update are part of the query, so a document which no longer matches is neither read nor written.
+
+        Args:
+            data: dict of update operators.
+            queries: dictionary of parameters to find the matching document.
+            filters: array of data to find the matching document.
+            projection: projection of data dict to be returned.
+            upsert: If set to True it inserts the document if it's not already present.
+            return_document: ReturnDocument.BEFORE or ReturnDocument.AFTER, defaults to the document after update.
+
+        Returns:
+            The document before or after it is updated, None if no document matched.
+        '''
+
+        query = {}
+
+        if queries:
+            query = queries
+
+        elif filters:
+            query = {
+                '$and': filters
+            }
+
+        return self.model._mongometa.collection.find_one_and_update(
+            query, data, projection=projection, upsert=upsert, return_document=return_document
+        )
+
+    @invalidates_query_cache
+    @timed('mongo')
     def update_by_id(self, _id, data, projection=None, upsert=False, return_document=None):
         '''Updates a single document matching query criteria.
 
@@ -263,6 +437,8 @@ class DefaultManager(Manager):
             response = update_response
         return response
 
+    @invalidates_query_cache
+    @timed('mongo')
     def update_many(self, data, filters=None, queries=None, upsert=False):
         '''Updates all the documents matching query criteria.
 
@@ -292,6 +468,8 @@ class DefaultManager(Manager):
         response = queryset.update(data, upsert=upsert)
         return response
 
+    @invalidates_query_cache
+    @timed('mongo')
     def remove(self, filters=None, queries=None):
         '''Deletes all the documents matching query criteria.
 
@@ -319,6 +497,8 @@ class DefaultManager(Manager):
         response = queryset.delete()
         return response
 
+    @invalidates_query_cache
+    @timed('mongo')
     def remove_one(self, queries=None):
         '''Deletes a single document matching query criteria.
 
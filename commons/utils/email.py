@@ -15,7 +15,7 @@ class Gmail(object):
         self.session = session
 
     def send_message(self, receiver, subject, body):
-        ''' This must be removed '''
+        ''' Sends a message, raising smtplib.SMTPException if the server refuses it '''
         headers = [
             "From: " + self.email,
             "Subject: " + subject,
@@ -24,29 +24,35 @@ class Gmail(object):
             "Content-Type: text/html"]
         headers = "\r\n".join(headers)
 
+        self.session.sendmail(
+            self.email,
+            receiver,
+            headers + "\r\n\r\n" + body)
+
+    def close(self):
+        ''' Closes the SMTP session '''
+
         try:
-            self.session.sendmail(
-                self.email,
-                receiver,
-                headers + "\r\n\r\n" + body)
-        except Exception as e:
-            print(e)
+            self.session.quit()
+        except smtplib.SMTPException:
+            pass
 
 
-def validate_email(email):
+EMAIL_PATTERN = re.compile(r'^(\w|\.|\_|\-)+[@](\w|\_|\-|\.)+[.]\w{2,3}$')
+PINCODE_PATTERN = re.compile(r'^[1-9][0-9]{5}$')
 
-    regex = '^(\w|\.|\_|\-)+[@](\w|\_|\-|\.)+[.]\w{2,3}$'
 
-    if(re.search(regex, email)):
+def validate_email(email):
+
+    if(EMAIL_PATTERN.search(email)):
         return True
     else:
         return False
 
 
 def validate_pincode(pincode):
-    regex = "^[1-9][0-9]{5}$"
 
-    if(re.search(regex, pincode)):
+    if(PINCODE_PATTERN.search(pincode)):
         return True
     else:
         return False
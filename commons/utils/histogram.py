@@ -0,0 +1,88 @@
+import bisect
+
+# upper bounds in milliseconds of the histogram buckets, observations above the last bound fall in an overflow bucket
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 300000)
+
+
+class LatencyHistogram(object):
+    '''Latency histogram with fixed buckets.
+
+    Every histogram shares the same bucket bounds, so histograms recorded by different workers merge by adding their
+    counts, and `to_dict` only carries the non-empty buckets. Percentiles are the upper bound of the bucket they
+    fall in, capped at the largest observation.
+
+    Attributes:
+        counts: list of observations per bucket, the last one being the overflow bucket.
+        total: sum of the observed milliseconds.
+        maximum: largest observed milliseconds.
+    '''
+
+    bounds = LATENCY_BUCKETS_MS
+
+    def __init__(self, counts=None, total=0.0, maximum=0.0):
+        self.counts = counts or [0] * (len(self.bounds) + 1)
+        self.total = total
+        self.maximum = maximum
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, milliseconds):
+        self.counts[bisect.bisect_left(self.bounds, milliseconds)] += 1
+        self.total += milliseconds
+        self.maximum = max(self.maximum, milliseconds)
+
+    def merge(self, other):
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    def percentile(self, fraction):
+        '''Returns the upper bound in milliseconds below which `fraction` of the observations fall.
+        '''
+
+        count = self.count
+
+        if not count:
+            return None
+
+        rank = fraction * count
+        cumulative = 0
+
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+
+            if bucket_count and cumulative >= rank:
+                return self.maximum if index == len(self.bounds) else min(self.bounds[index], self.maximum)
+
+        return self.maximum
+
+    def summary(self):
+        count = self.count
+
+        return {
+            'count': count,
+            'mean': round(self.total / count, 2) if count else None,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'max': round(self.maximum, 2) if count else None
+        }
+
+    def to_dict(self):
+        return {
+            'buckets': [[index, count] for index, count in enumerate(self.counts) if count],
+            'total': round(self.total, 3),
+            'max': round(self.maximum, 3)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(total=data.get('total', 0.0), maximum=data.get('max', 0.0))
+
+        for index, count in data.get('buckets', []):
+            histogram.counts[index] += count
+
+        return histogram
@@ -169,6 +169,18 @@ class NotImplemented(HttpError):
         super(NotImplemented, self).__init__(self.status_code, message, error_code, errors)
 
 
+class ServiceUnavailable(HttpError):
+    '''Exception for HTTP 503 extended from HttpError
+
+    The server is temporarily unable to handle the request, usually because it is overloaded.
+    '''
+
+    status_code = 503
+
+    def __init__(self, message="The server is busy at this moment. Please try again later.", error_code=None, errors=None):
+        super(ServiceUnavailable, self).__init__(self.status_code, message, error_code, errors)
+
+
 class GatewayTimeout(HttpError):
     '''Exception for HTTP 501 extended from HttpError
 
@@ -1 +1,2 @@
+from .app_logger import app_logger
 from .error_logger import error_logger
@@ -0,0 +1,166 @@
+import bisect
+import json
+import threading
+import time
+
+from commons.utils.histogram import LATENCY_BUCKETS_MS
+from commons.utils.redis_manager import get_redis_client
+
+series_index_key = 'metrics:series'
+series_key = 'metrics:{name}:{labels}'
+metadata_key = 'metrics:metadata'
+
+
+def format_labels(labels):
+    return ','.join(f'{name}="{value}"' for name, value in sorted(labels.items()))
+
+
+class Histogram(object):
+    '''Histogram kept in redis so observations of every web and celery process add up.
+
+    A series, one per combination of label values, is a redis hash holding the count of every bucket, the sum and
+    the count of its observations. Observations are passed in milliseconds and exported in seconds. The HELP text
+    and bounds are stored next to the series, so any process can export histograms it never recorded itself.
+
+    Attributes:
+        name: metric name in the Prometheus exposition.
+        documentation: HELP text of the metric.
+        bounds: upper bounds in milliseconds of the buckets.
+    '''
+
+    def __init__(self, name, documentation, bounds=LATENCY_BUCKETS_MS):
+        self.name = name
+        self.documentation = documentation
+        self.bounds = bounds
+        self.described = False
+
+    def observe_many(self, milliseconds, client=None, **labels):
+        '''Records observations of one series in one round trip.
+
+        Args:
+            milliseconds: iterable of observed durations.
+            client: (optional) redis client or pipeline, the observations are sent with it instead.
+            labels: label values of the series.
+        '''
+
+        milliseconds = list(milliseconds)
+
+        if not milliseconds:
+            return
+
+        buckets = {}
+
+        for value in milliseconds:
+            index = bisect.bisect_left(self.bounds, value)
+            buckets[index] = buckets.get(index, 0) + 1
+
+        key = series_key.format(name=self.name, labels=format_labels(labels))
+        pipeline = client or get_redis_client().pipeline(transaction=False)
+
+        for index, count in buckets.items():
+            pipeline.hincrby(key, index, count)
+
+        pipeline.hincrby(key, 'count', len(milliseconds))
+        pipeline.hincrbyfloat(key, 'sum', sum(milliseconds) / 1000)
+        pipeline.sadd(series_index_key, json.dumps([self.name, labels], sort_keys=True))
+
+        if not self.described:
+            pipeline.hset(metadata_key, self.name, json.dumps([self.documentation, self.bounds]))
+            self.described = True
+
+        if client is None:
+            pipeline.execute()
+
+    def observe(self, milliseconds, client=None, **labels):
+        self.observe_many([milliseconds], client, **labels)
+
+
+class HistogramBuffer(object):
+    '''Buffers observations of histograms in the process and flushes them to redis in one round trip.
+
+    Used on hot paths such as every request or every mongo command, where a redis round trip per observation would
+    cost more than the work being measured.
+
+    Attributes:
+        flush_interval: seconds between flushes.
+    '''
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.flushed_at = time.monotonic()
+
+    def add(self, histogram, milliseconds, **labels):
+        '''Buffers an observation and flushes the buffer when the flush interval has passed.
+        '''
+
+        series = (histogram, tuple(sorted(labels.items())))
+
+        with self.lock:
+            self.pending.setdefault(series, []).append(milliseconds)
+
+            if time.monotonic() - self.flushed_at < self.flush_interval:
+                return
+
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+
+        pipeline = get_redis_client().pipeline(transaction=False)
+
+        for (histogram, labels), observations in pending.items():
+            histogram.observe_many(observations, pipeline, **dict(labels))
+
+        pipeline.execute()
+
+
+def render_prometheus():
+    '''Renders every recorded histogram in the Prometheus text exposition format.
+
+    Returns:
+        Exposition text.
+    '''
+
+    client = get_redis_client()
+    metadata = {name.decode(): json.loads(value) for name, value in client.hgetall(metadata_key).items()}
+    series = {}
+
+    for member in client.smembers(series_index_key):
+        name, labels = json.loads(member)
+
+        if name in metadata:
+            series.setdefault(name, []).append(labels)
+
+    pipeline = client.pipeline(transaction=False)
+    ordered = [(name, labels) for name in sorted(series) for labels in series[name]]
+
+    for name, labels in ordered:
+        pipeline.hgetall(series_key.format(name=name, labels=format_labels(labels)))
+
+    lines = []
+    previous_name = None
+
+    for (name, labels), values in zip(ordered, pipeline.execute() if ordered else []):
+        documentation, bounds = metadata[name]
+        values = {field.decode(): value for field, value in values.items()}
+
+        if name != previous_name:
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} histogram')
+            previous_name = name
+
+        label_prefix = format_labels(labels) + ',' if labels else ''
+        cumulative = 0
+
+        for index, bound in enumerate(bounds):
+            cumulative += int(values.get(str(index), 0))
+            lines.append(f'{name}_bucket{{{label_prefix}le="{bound / 1000:g}"}} {cumulative}')
+
+        count = int(values.get('count', 0))
+        series_labels = '{' + format_labels(labels) + '}' if labels else ''
+
+        lines.append(f'{name}_bucket{{{label_prefix}le="+Inf"}} {count}')
+        lines.append(f'{name}_sum{series_labels} {float(values.get("sum", 0)):g}')
+        lines.append(f'{name}_count{series_labels} {count}')
+
+    return '\n'.join(lines) + '\n'
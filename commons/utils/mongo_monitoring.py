@@ -0,0 +1,177 @@
+import json
+import time
+
+from bson import json_util
+from pymongo import monitoring
+
+# commands whose filter is read from the command document, and the commands explain accepts
+FILTER_FIELDS = {
+    'find': 'filter',
+    'count': 'query',
+    'distinct': 'query',
+    'findAndModify': 'query'
+}
+EXPLAINABLE_COMMANDS = ('find', 'count', 'distinct', 'findAndModify', 'aggregate', 'update', 'delete')
+
+# fields added by the driver which are not part of the command itself
+DRIVER_FIELDS = ('$db', 'lsid', '$clusterTime', '$readPreference', 'txnNumber')
+
+MONITORED_COMMANDS = EXPLAINABLE_COMMANDS + ('insert', 'getMore')
+
+# hash of command shape to the latest sample of a slow command, explained by the explain_slow_queries command
+slow_query_samples_key = 'mongo:slow-query-samples'
+
+
+def query_shape(value):
+    '''Returns the shape of a filter, with operators and field names kept and values replaced by `?`.
+    '''
+
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        return [query_shape(value[0])] if value and isinstance(value[0], (dict, list, tuple)) else '?'
+
+    return '?'
+
+
+def command_filter(command_name, command):
+    '''Returns the filter of a command, or the stage names of an aggregation without a leading $match.
+    '''
+
+    if command_name in FILTER_FIELDS:
+        return command.get(FILTER_FIELDS[command_name]) or {}
+
+    if command_name in ('update', 'delete'):
+        statements = command.get('updates' if command_name == 'update' else 'deletes') or [{}]
+        return statements[0].get('q') or {}
+
+    if command_name == 'aggregate':
+        pipeline = command.get('pipeline') or []
+
+        if pipeline and '$match' in pipeline[0]:
+            return pipeline[0]['$match']
+
+        return {'pipeline': [next(iter(stage), '?') for stage in pipeline]}
+
+    return None
+
+
+def plan_stages(plan):
+    '''Flattens a query plan into a list of stage names, index scans carrying their index name.
+    '''
+
+    stages = []
+
+    while plan:
+        stage = plan.get('stage', '?')
+        stages.append(f"{stage}({plan['indexName']})" if plan.get('indexName') else stage)
+        plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0]
+
+    return stages
+
+
+class CommandMonitor(monitoring.CommandListener):
+    '''pymongo command listener recording the latency of every query and logging the slow ones.
+
+    Latencies are buffered per collection and command into the `mongo_command_seconds` histogram. Commands slower
+    than `slow_ms` are logged with the shape of their filter. With `sample` set, a slow command of a shape is also
+    stored in redis at most once every `sample_interval` seconds, for the `explain_slow_queries` command to explain
+    later instead of doubling the latency of the request which ran it. The listener must be registered before the
+    client is created, and only imports django dependent modules once the first command completes so it can be
+    created in the settings module.
+
+    Attributes:
+        slow_ms: milliseconds from which a command is logged as slow.
+        sample: True to store samples of slow commands for `explain_slow_queries`.
+        sample_interval: seconds between two samples of the same command shape.
+        flush_interval: seconds between flushes of the latency histogram to redis.
+    '''
+
+    def __init__(self, slow_ms=100, sample=False, sample_interval=600, flush_interval=10):
+        self.slow_ms = slow_ms
+        self.sample = sample
+        self.sample_interval = sample_interval
+        self.flush_interval = flush_interval
+        self.in_flight = {}
+        self.sampled_at = {}
+        self.buffer = None
+        self.histogram = None
+
+    def __record(self, milliseconds, collection, command_name):
+        if self.buffer is None:
+            from commons.utils.metrics import Histogram, HistogramBuffer
+
+            self.histogram = Histogram(
+                'mongo_command_seconds', 'Time taken by mongo commands of a collection, as seen by the driver.'
+            )
+            self.buffer = HistogramBuffer(self.flush_interval)
+
+        self.buffer.add(self.histogram, milliseconds, collection=collection, command=command_name)
+
+    def __store_sample(self, database_name, command_name, command, shape, milliseconds):
+        '''Stores a slow command for `explain_slow_queries`, unless its shape was sampled recently.
+        '''
+
+        key = f'{command_name}:{shape}'
+        now = time.monotonic()
+
+        if now - self.sampled_at.get(key, -self.sample_interval) < self.sample_interval:
+            return
+
+        self.sampled_at[key] = now
+
+        from commons.utils.redis_manager import get_redis_client
+
+        get_redis_client().hset(slow_query_samples_key, key, json_util.dumps({
+            'database': database_name,
+            'command': {name: value for name, value in command.items() if name not in DRIVER_FIELDS},
+            'milliseconds': milliseconds,
+            'seenAt': time.time()
+        }))
+
+    def started(self, event):
+        if event.command_name not in MONITORED_COMMANDS:
+            return
+
+        command = event.command
+        collection = command.get(event.command_name)
+
+        if event.command_name == 'getMore':
+            collection = command.get('collection')
+
+        self.in_flight[(event.connection_id, event.request_id)] = (
+            collection, command, event.database_name
+        )
+
+    def succeeded(self, event):
+        self.__finish(event)
+
+    def failed(self, event):
+        self.__finish(event)
+
+    def __finish(self, event):
+        started = self.in_flight.pop((event.connection_id, event.request_id), None)
+
+        if started is None:
+            return
+
+        collection, command, database_name = started
+        milliseconds = event.duration_micros / 1000
+
+        from commons.utils.loggers import app_logger
+
+        try:
+            self.__record(milliseconds, str(collection), event.command_name)
+
+            if milliseconds < self.slow_ms:
+                return
+
+            shape = json.dumps(query_shape(command_filter(event.command_name, command)), sort_keys=True, default=str)
+
+            app_logger.error(f'MONGO_SLOW_QUERY: {collection}.{event.command_name} {milliseconds:.1f} ms filter={shape}')
+
+            if self.sample and event.command_name in EXPLAINABLE_COMMANDS:
+                self.__store_sample(database_name, event.command_name, command, shape, milliseconds)
+        except Exception:
+            app_logger.exception('MONGO_MONITORING_ERROR')
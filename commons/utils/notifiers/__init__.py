@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .base import DispatchResult, Notification, Notifier
+from .file import FileNotifier
+from .outbox import OutboxNotifier, SendQuota
+from .smtp import SMTPNotifier
+from .webhook import WebhookNotifier
+
+_notifiers = {}
+
+
+def get_notifier(name):
+    '''Returns the notifier configured under a name in NOTIFIER_BACKENDS setting.
+
+    Instances are created on first use and reused afterwards, so pooled connections are shared by the process.
+
+    Args:
+        name: key of the backend in NOTIFIER_BACKENDS.
+
+    Returns:
+        Notifier instance.
+    '''
+
+    if name not in _notifiers:
+        config = settings.NOTIFIER_BACKENDS[name]
+        _notifiers[name] = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+    return _notifiers[name]
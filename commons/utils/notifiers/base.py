@@ -0,0 +1,78 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from commons.utils.loggers import app_logger
+
+Notification = namedtuple('Notification', ['recipient', 'subject', 'body', 'payload'])
+Notification.__new__.__defaults__ = (None,)
+
+DispatchResult = namedtuple('DispatchResult', ['sent', 'failed'])
+
+
+class Notifier(object):
+    '''Base class of notification backends with batched, concurrent dispatch.
+
+    A backend implements `send_batch` and declares how many notifications go into one batch and how many batches
+    may be in flight at once. `dispatch` splits notifications into batches and runs them on a thread pool bounded
+    by the backend's concurrency.
+
+    Attributes:
+        batch_size: maximum number of notifications handed to one `send_batch` call.
+        concurrency: maximum number of batches sent at the same time.
+        deferred: True if `send_batch` only queues notifications which are sent later.
+    '''
+
+    batch_size = 50
+    concurrency = 1
+    deferred = False
+
+    def __init__(self, batch_size=None, concurrency=None):
+        self.batch_size = batch_size or self.batch_size
+        self.concurrency = concurrency or self.concurrency
+
+    def send_batch(self, notifications):
+        '''Sends a batch of notifications.
+
+        Args:
+            notifications: list of Notification.
+
+        Returns:
+            List of notifications which could not be sent.
+        '''
+
+        raise NotImplementedError
+
+    def __send_batch(self, notifications):
+        try:
+            return self.send_batch(notifications)
+        except Exception:
+            app_logger.exception('NOTIFIER_BATCH_ERROR')
+            return notifications
+
+    def dispatch(self, notifications):
+        '''Sends notifications in batches, running up to `concurrency` batches at once.
+
+        Args:
+            notifications: iterable of Notification.
+
+        Returns:
+            DispatchResult with the count of sent notifications and the list of failed ones.
+        '''
+
+        notifications = list(notifications)
+        batches = [
+            notifications[index:index + self.batch_size] for index in range(0, len(notifications), self.batch_size)
+        ]
+
+        if not batches:
+            return DispatchResult(0, [])
+
+        if len(batches) == 1 or self.concurrency == 1:
+            failed_batches = [self.__send_batch(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as executor:
+                failed_batches = list(executor.map(self.__send_batch, batches))
+
+        failed = [notification for batch in failed_batches for notification in batch]
+
+        return DispatchResult(len(notifications) - len(failed), failed)
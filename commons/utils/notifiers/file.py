@@ -0,0 +1,28 @@
+import json
+import threading
+
+from .base import Notifier
+
+
+class FileNotifier(Notifier):
+    '''Appends notifications as JSON lines to a local file, meant for testing and local development.
+
+    Attributes:
+        path: path of the file notifications are appended to.
+    '''
+
+    batch_size = 1000
+    concurrency = 1
+
+    def __init__(self, path, **kwargs):
+        super(FileNotifier, self).__init__(**kwargs)
+        self.path = path
+        self.__lock = threading.Lock()
+
+    def send_batch(self, notifications):
+        lines = ''.join(json.dumps(notification._asdict(), default=str) + '\n' for notification in notifications)
+
+        with self.__lock, open(self.path, 'a') as sink:
+            sink.write(lines)
+
+        return []
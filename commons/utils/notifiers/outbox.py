@@ -0,0 +1,346 @@
+import json
+import math
+import smtplib
+import time
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+
+from commons.utils.email import Gmail
+from commons.utils.loggers import app_logger
+from commons.utils.redis_manager import get_redis_client
+
+from .base import DispatchResult, Notification, Notifier
+
+SMTPAccount = namedtuple('SMTPAccount', ['user', 'password', 'daily_quota'])
+
+# replies after which an account is rested for a while
+THROTTLE_REPLY_CODES = (421, 450, 451, 452, 454, 535)
+
+# permanent replies which mean the account's daily sending limit is used up
+EXHAUSTED_REPLY_CODES = (550, 552, 554)
+EXHAUSTED_REPLY_MARKERS = (b'5.4.5', b'quota', b'limit exceeded')
+
+
+class SendQuota(object):
+    '''Daily send counters and cool downs of SMTP accounts, kept in redis so every worker shares them.
+
+    Attributes:
+        accounts: list of SMTPAccount.
+        client: redis client.
+    '''
+
+    count_key = 'notify:quota:{user}:{date}'
+    cooldown_key = 'notify:quota-cooldown:{user}'
+
+    def __init__(self, accounts, client):
+        self.accounts = accounts
+        self.client = client
+
+    def __count_key(self, account):
+        return self.count_key.format(user=account.user, date=datetime.now().strftime('%Y%m%d'))
+
+    def remaining(self):
+        '''Returns the sends left today per account, 0 for accounts cooling down.
+        '''
+
+        pipeline = self.client.pipeline(transaction=False)
+
+        for account in self.accounts:
+            pipeline.get(self.__count_key(account))
+            pipeline.exists(self.cooldown_key.format(user=account.user))
+
+        replies = pipeline.execute()
+        remaining = {}
+
+        for index, account in enumerate(self.accounts):
+            used, cooling_down = replies[2 * index], replies[2 * index + 1]
+            remaining[account.user] = 0 if cooling_down else max(account.daily_quota - int(used or 0), 0)
+
+        return remaining
+
+    def allowances(self, burst):
+        '''Returns how many sends each account may make in this run of the scheduler.
+
+        The remaining quota is spread evenly over the minutes left in the day, and a run may use up to `burst`
+        times its even share so openings are sent quickly without running the accounts dry by the morning.
+
+        Args:
+            burst: multiple of the even per minute share a run may use.
+
+        Returns:
+            Dictionary of account user to number of sends.
+        '''
+
+        now = datetime.now()
+        end_of_day = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        minutes_left = max(math.ceil((end_of_day - now).total_seconds() / 60), 1)
+
+        return {
+            user: min(remaining, math.ceil(remaining * burst / minutes_left))
+            for user, remaining in self.remaining().items()
+        }
+
+    def consume(self, account, count):
+        if count:
+            key = self.__count_key(account)
+            pipeline = self.client.pipeline(transaction=False)
+            pipeline.incrby(key, count)
+            pipeline.expire(key, 2 * 24 * 60 * 60)
+            pipeline.execute()
+
+    def exhaust(self, account):
+        self.client.set(self.__count_key(account), account.daily_quota, ex=2 * 24 * 60 * 60)
+
+    def cool_down(self, account, seconds):
+        self.client.set(self.cooldown_key.format(user=account.user), 1, ex=seconds)
+
+
+class OutboxNotifier(Notifier):
+    '''Queues email notifications in a redis priority outbox which `drain` sends within account quotas.
+
+    Dispatching only queues, so detection never waits on SMTP. Every run of `drain` leases the highest priority
+    messages the accounts may send in that run, where a message's priority is the time its newest slot was first
+    seen raised by `capacity_weight` seconds per doubling of the offered capacity. Accounts are used in order and
+    messages an account can not send spill over to the next one. Leased messages move to an in-flight set until
+    they are sent, so messages of a drain which died are put back in the outbox once their lease expires. Messages
+    deferred by throttled or exhausted accounts go back to the outbox, and messages older than `max_age` seconds are dropped since the slots they
+    announce are most likely gone.
+
+    Attributes:
+        accounts: list of SMTPAccount, in order of use.
+        outbox_key: redis key of the outbox sorted set.
+        inflight_key: redis key of the sorted set of leased messages scored by their lease deadline.
+        lease: seconds after which a leased message which was neither sent nor requeued is put back in the outbox.
+        max_age: seconds after which a queued message is dropped.
+        burst: multiple of the even per minute share of the quota a run may use.
+        capacity_weight: seconds of freshness a doubling of capacity is worth.
+        cooldown: seconds a throttled account is rested.
+    '''
+
+    batch_size = 500
+    concurrency = 1
+    deferred = True
+
+    def __init__(self, accounts, name='email', max_age=6 * 60 * 60, burst=10, capacity_weight=600, cooldown=900,
+                 lease=900, **kwargs):
+        super(OutboxNotifier, self).__init__(**kwargs)
+        self.accounts = [SMTPAccount(**account) for account in accounts if account.get('user')]
+        self.outbox_key = f'notify:outbox:{name}'
+        self.inflight_key = f'notify:outbox-inflight:{name}'
+        self.lease = lease
+        self.max_age = max_age
+        self.burst = burst
+        self.capacity_weight = capacity_weight
+        self.cooldown = cooldown
+        self.client = get_redis_client()
+        self.quota = SendQuota(self.accounts, self.client)
+
+    def priority(self, notification):
+        events = (notification.payload or {}).get('events') or []
+        seen_at = max([event.get('seenAt') or 0 for event in events] or [0]) or time.time()
+        capacity = sum(event.get('capacity') or 0 for event in events)
+
+        return seen_at + self.capacity_weight * math.log2(1 + capacity)
+
+    def send_batch(self, notifications):
+        queued_at = time.time()
+
+        self.client.zadd(self.outbox_key, {
+            json.dumps({'notification': notification._asdict(), 'queuedAt': queued_at}): self.priority(notification)
+            for notification in notifications
+        })
+
+        return []
+
+    def __on_refused(self, account, error):
+        '''Rests or exhausts an account after a refusal, returns False if the refusal is about the message.
+        '''
+
+        if error.smtp_code in THROTTLE_REPLY_CODES:
+            self.quota.cool_down(account, self.cooldown)
+
+        elif error.smtp_code in EXHAUSTED_REPLY_CODES and any(
+            marker in (error.smtp_error or b'').lower() for marker in EXHAUSTED_REPLY_MARKERS
+        ):
+            self.quota.exhaust(account)
+
+        else:
+            return False
+
+        app_logger.error(f'SMTP_ACCOUNT_THROTTLED: {account.user} {error.smtp_code} {error.smtp_error}')
+        return True
+
+    def __send_from(self, account, messages):
+        '''Sends leased messages from one account.
+
+        Args:
+            account: SMTPAccount.
+            messages: list of (member, message) pairs.
+
+        Returns:
+            Tuple of ((member, message), sent_at) pairs sent, pairs deferred to another account or run and pairs
+            dropped.
+        '''
+
+        try:
+            session = Gmail(account.user, account.password)
+        except smtplib.SMTPResponseException as e:
+            if not self.__on_refused(account, e):
+                self.quota.cool_down(account, self.cooldown)
+            return [], messages, []
+        except (smtplib.SMTPException, OSError):
+            app_logger.exception('SMTP_CONNECT_ERROR')
+            return [], messages, []
+
+        sent = []
+        dropped = []
+
+        try:
+            for index, (member, message) in enumerate(messages):
+                notification = Notification(**message['notification'])
+
+                try:
+                    session.send_message(notification.recipient, notification.subject, notification.body)
+                except smtplib.SMTPResponseException as e:
+                    if self.__on_refused(account, e):
+                        return sent, messages[index:], dropped
+
+                    app_logger.exception('SMTP_MESSAGE_REFUSED')
+                    dropped.append((member, message))
+                except smtplib.SMTPRecipientsRefused:
+                    app_logger.exception('SMTP_MESSAGE_REFUSED')
+                    dropped.append((member, message))
+                except (smtplib.SMTPException, OSError):
+                    app_logger.exception('SMTP_SESSION_ERROR')
+                    return sent, messages[index:], dropped
+                else:
+                    sent.append(((member, message), time.time()))
+        finally:
+            self.quota.consume(account, len(sent))
+            session.close()
+
+        return sent, [], dropped
+
+    def __lease(self, count, now):
+        '''Moves up to `count` of the highest priority messages to the in-flight set.
+
+        Expired leases are put back in the outbox first. A message is leased by the drain whose add to the in-flight
+        set succeeds, so concurrent drains never send the same message.
+
+        Returns:
+            List of (member, message) pairs leased.
+        '''
+
+        expired = self.client.zrangebyscore(self.inflight_key, '-inf', now)
+
+        if expired:
+            pipeline = self.client.pipeline(transaction=False)
+
+            for member in expired:
+                pipeline.zrem(self.inflight_key, member)
+
+            self.requeue([
+                json.loads(member) for member, removed in zip(expired, pipeline.execute()) if removed
+            ])
+
+        members = self.client.zrevrange(self.outbox_key, 0, count - 1)
+
+        if not members:
+            return []
+
+        pipeline = self.client.pipeline(transaction=False)
+
+        for member in members:
+            pipeline.zadd(self.inflight_key, {member: now + self.lease}, nx=True)
+            pipeline.zrem(self.outbox_key, member)
+
+        added = pipeline.execute()[::2]
+
+        return [(member, json.loads(member)) for member, leased in zip(members, added) if leased]
+
+    def drain(self, on_sent=None):
+        '''Sends the highest priority queued messages the accounts may send in this run.
+
+        Args:
+            on_sent: (optional) callable receiving the list of (notification, queued_at, sent_at) tuples sent.
+
+        Returns:
+            DispatchResult with the count of sent messages and the notifications which were dropped.
+        '''
+
+        allowances = self.quota.allowances(self.burst)
+        budget = sum(allowances.values())
+
+        if not budget:
+            return DispatchResult(0, [])
+
+        now = time.time()
+        pending = deque()
+        dropped = []
+
+        for member, message in self.__lease(budget, now):
+            if now - message['queuedAt'] > self.max_age:
+                dropped.append((member, message))
+            else:
+                pending.append((member, message))
+
+        sent = []
+
+        try:
+            for account in self.accounts:
+                if not pending:
+                    break
+
+                allowance = min(allowances.get(account.user, 0), len(pending))
+
+                if not allowance:
+                    continue
+
+                messages = [pending.popleft() for index in range(allowance)]
+                account_sent, deferred, account_dropped = self.__send_from(account, messages)
+
+                sent += account_sent
+                dropped += account_dropped
+                pending.extendleft(reversed(deferred))
+        finally:
+            pipeline = self.client.pipeline(transaction=False)
+
+            for member in [member for (member, message), sent_at in sent] + [member for member, message in dropped]:
+                pipeline.zrem(self.inflight_key, member)
+
+            pipeline.execute()
+
+            if pending:
+                self.requeue([message for member, message in pending], [member for member, message in pending])
+
+        if dropped:
+            app_logger.error(f'SMTP_OUTBOX_DROPPED: {len(dropped)} messages')
+
+        if sent and on_sent:
+            on_sent([
+                (Notification(**message['notification']), message['queuedAt'], sent_at)
+                for (member, message), sent_at in sent
+            ])
+
+        return DispatchResult(len(sent), [Notification(**message['notification']) for member, message in dropped])
+
+    def requeue(self, messages, leased_members=None):
+        '''Puts deferred messages back in the outbox keeping their original queue time.
+
+        Args:
+            messages: list of message dictionaries.
+            leased_members: (optional) in-flight members of the messages, removed from the in-flight set.
+        '''
+
+        if not messages:
+            return
+
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.zadd(self.outbox_key, {
+            json.dumps(message): self.priority(Notification(**message['notification'])) for message in messages
+        })
+
+        if leased_members:
+            pipeline.zrem(self.inflight_key, *leased_members)
+
+        pipeline.execute()
@@ -0,0 +1,40 @@
+from commons.utils.email import Gmail
+from commons.utils.loggers import app_logger
+
+from .base import Notifier
+
+
+class SMTPNotifier(Notifier):
+    '''Sends notifications as emails, reusing one authenticated SMTP session for a whole batch.
+
+    Each batch in flight holds its own SMTP session, so concurrency is the number of parallel SMTP connections
+    opened against the account.
+
+    Attributes:
+        user: SMTP account used as sender.
+        password: password of the SMTP account.
+    '''
+
+    batch_size = 100
+    concurrency = 2
+
+    def __init__(self, user, password, **kwargs):
+        super(SMTPNotifier, self).__init__(**kwargs)
+        self.user = user
+        self.password = password
+
+    def send_batch(self, notifications):
+        session = Gmail(self.user, self.password)
+        failed = []
+
+        try:
+            for notification in notifications:
+                try:
+                    session.send_message(notification.recipient, notification.subject, notification.body)
+                except Exception:
+                    app_logger.exception('SMTP_NOTIFIER_ERROR')
+                    failed.append(notification)
+        finally:
+            session.close()
+
+        return failed
@@ -0,0 +1,56 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+from commons.utils.loggers import app_logger
+
+from .base import Notifier
+
+
+class WebhookNotifier(Notifier):
+    '''Posts notifications as JSON to a webhook, one request per batch.
+
+    All batches share one pooled HTTP session, sized to the backend's concurrency so every batch in flight reuses
+    a kept-alive connection.
+
+    Attributes:
+        url: URL of the webhook.
+        headers: headers sent with every request.
+        timeout: seconds to wait for the webhook to respond.
+        session: pooled requests session.
+    '''
+
+    batch_size = 100
+    concurrency = 16
+
+    def __init__(self, url, headers=None, timeout=10, **kwargs):
+        super(WebhookNotifier, self).__init__(**kwargs)
+        self.url = url
+        self.headers = headers or {}
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def send_batch(self, notifications):
+        body = {
+            'notifications': [
+                {
+                    'recipient': notification.recipient,
+                    'subject': notification.subject,
+                    'body': notification.body,
+                    'payload': notification.payload
+                }
+                for notification in notifications
+            ]
+        }
+
+        try:
+            response = self.session.post(self.url, json=body, headers=self.headers, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException:
+            app_logger.exception('WEBHOOK_NOTIFIER_ERROR')
+            return notifications
+
+        return []
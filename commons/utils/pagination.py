@@ -1,3 +1,16 @@
+import base64
+import binascii
+from datetime import datetime
+
+from bson import json_util
+from bson.objectid import ObjectId
+
+from commons.utils.http_error import BadRequest
+
+# types of the values making up a position, anything else could carry query operators into the page filter
+CURSOR_VALUE_TYPES = (str, int, float, datetime, ObjectId, type(None))
+
+
 def create_pagination_url(url, limit=50, query_params=None):
     '''Method to create next pagination url.
 
@@ -21,3 +34,67 @@ def create_pagination_url(url, limit=50, query_params=None):
         next_pagination_url = next_pagination_url + query_params_string
 
     return next_pagination_url
+
+
+def encode_cursor(position):
+    '''Encodes a keyset position into an opaque url safe cursor token.
+
+    Args:
+        position: position returned by `DefaultManager.get_keyset_page`, None on the last page.
+
+    Returns:
+        Cursor token, None for the last page.
+    '''
+
+    if position is None:
+        return None
+
+    return base64.urlsafe_b64encode(json_util.dumps(list(position)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    '''Decodes a cursor token into a keyset position.
+
+    Args:
+        token: cursor token sent by the client, empty for the first page.
+
+    Returns:
+        Position passed to `DefaultManager.get_keyset_page`, None for the first page.
+
+    Raises:
+        BadRequest: If the token was not issued by `encode_cursor`.
+    '''
+
+    if not token:
+        return None
+
+    try:
+        position = json_util.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode())
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise BadRequest("Invalid cursor")
+
+    if not isinstance(position, list) or len(position) != 2 or not all(
+        isinstance(value, CURSOR_VALUE_TYPES) for value in position
+    ):
+        raise BadRequest("Invalid cursor")
+
+    return tuple(position)
+
+
+def create_cursor_pagination_url(url, cursor, limit=50, query_params=None):
+    '''Method to create next pagination url of keyset paginated lists.
+
+    Args:
+        url: URL to which pagination is to applied.
+        cursor: cursor token of the next page, None on the last page.
+        limit: Number of records to fetch.
+        query_params: Query params for pagination url.
+
+    Returns:
+        Next pagination url, None on the last page.
+    '''
+
+    if cursor is None:
+        return None
+
+    return create_pagination_url(url, limit, dict(query_params or {}, cursor=cursor))
@@ -0,0 +1,121 @@
+import hashlib
+from copy import deepcopy
+
+from bson import json_util
+
+from commons.utils.loggers import error_logger
+from commons.utils.redis_manager import get_redis_client
+from commons.utils.tiered_cache import LocalCache
+
+query_cache_key = 'query-cache:{collection}'
+
+query_caches = {}
+
+
+class QueryCache(object):
+    '''Read-through cache of the queries of one collection, kept in process memory in front of redis.
+
+    Results are keyed by the normalized method, query and projection, and stored in one redis hash per collection,
+    so a write drops every cached query of the collection with a single DEL. Results are also kept in a LocalCache
+    of the process, which every process clears when the collection is written and which serves a result for at
+    most `local_ttl` seconds. A result read from mongo while another process writes can be stored in redis after
+    that write's invalidation, so `timeout` also bounds how long such a result lives. Redis errors fall back to the
+    loader.
+
+    Attributes:
+        collection_name: name of the cached collection.
+        timeout: seconds after the last fill at which the redis hash expires.
+        local: LocalCache of the process.
+    '''
+
+    def __init__(self, collection_name, timeout, local_ttl=5, local_size=1024):
+        self.collection_name = collection_name
+        self.key = query_cache_key.format(collection=collection_name)
+        self.timeout = timeout
+        self.local = LocalCache(self.key, local_size, local_ttl)
+
+    @staticmethod
+    def query_key(method, query, projection):
+        normalized = json_util.dumps([method, query or {}, projection or {}], sort_keys=True)
+        return hashlib.sha1(normalized.encode()).hexdigest()
+
+    def get_or_load(self, method, query, projection, loader):
+        '''Returns the cached result of a query, loading and caching it on a miss.
+
+        Args:
+            method: name of the manager method.
+            query: query dictionary of the method.
+            projection: projection dictionary of the method.
+            loader: callable returning the result from mongo.
+
+        Returns:
+            A copy of the result, so callers may modify it.
+        '''
+
+        key = self.query_key(method, query, projection)
+        found, value = self.local.get(key)
+
+        if found:
+            return deepcopy(value)
+
+        generation = self.local.generation
+        client = get_redis_client()
+
+        try:
+            cached = client.hget(self.key, key)
+        except Exception:
+            error_logger.exception('QUERY_CACHE_ERROR')
+            return loader()
+
+        if cached is not None:
+            value = json_util.loads(cached)
+        else:
+            value = loader()
+
+            try:
+                pipeline = client.pipeline(transaction=False)
+                pipeline.hset(self.key, key, json_util.dumps(value))
+                pipeline.expire(self.key, self.timeout)
+                pipeline.execute()
+            except Exception:
+                error_logger.exception('QUERY_CACHE_ERROR')
+
+        self.local.set(key, value, generation=generation)
+        return deepcopy(value)
+
+    def invalidate(self):
+        '''Drops every cached query of the collection.
+        '''
+
+        try:
+            get_redis_client().delete(self.key)
+        except Exception:
+            error_logger.exception('QUERY_CACHE_ERROR')
+
+        self.local.invalidate()
+
+
+def get_query_cache(model):
+    '''Returns the query cache of a model, None unless the model sets `query_cache_timeout`.
+
+    Args:
+        model: MongoModel class, which may set `query_cache_timeout`, `query_cache_local_ttl` and
+               `query_cache_local_size`.
+    '''
+
+    timeout = getattr(model, 'query_cache_timeout', None)
+
+    if not timeout:
+        return None
+
+    collection_name = model._mongometa.collection_name
+
+    if collection_name not in query_caches:
+        query_caches[collection_name] = QueryCache(
+            collection_name,
+            timeout,
+            local_ttl=getattr(model, 'query_cache_local_ttl', 5),
+            local_size=getattr(model, 'query_cache_local_size', 1024)
+        )
+
+    return query_caches[collection_name]
@@ -0,0 +1,58 @@
+import redis
+from django.conf import settings
+from django_redis import get_redis_connection
+
+_subscriber_client = None
+
+
+def make_cache_key(key, key_prefix, version):
+    '''Key function used by the django_redis cache backend.
+
+    Args:
+        key: key passed to the cache api.
+        key_prefix: KEY_PREFIX of the cache config.
+        version: version of the cache key.
+
+    Returns:
+        Key under which the value is stored in redis.
+    '''
+
+    return f'{key_prefix}:{version}:{key}'
+
+
+def get_redis_client(alias='default'):
+    '''Returns the raw redis client backing a django_redis cache.
+
+    Args:
+        alias: alias of the cache in CACHES setting.
+
+    Returns:
+        redis.Redis client instance.
+    '''
+
+    return get_redis_connection(alias)
+
+
+def get_subscriber_client():
+    '''Returns the redis client used for pub/sub subscriptions.
+
+    Subscriptions hold their connection for as long as they are open, so they get a pool of their own bounded by
+    REDIS_SUBSCRIBER_MAX_CONNECTIONS instead of starving the cache pool. Connections are health checked and kept
+    alive so a dropped connection is noticed while a subscription is idle.
+
+    Returns:
+        redis.Redis client instance.
+    '''
+
+    global _subscriber_client
+
+    if _subscriber_client is None:
+        _subscriber_client = redis.Redis(connection_pool=redis.ConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_SUBSCRIBER_MAX_CONNECTIONS,
+            health_check_interval=settings.REDIS_SUBSCRIBER_HEALTH_CHECK_INTERVAL,
+            socket_keepalive=True,
+            socket_connect_timeout=3
+        ))
+
+    return _subscriber_client
@@ -11,6 +11,7 @@ from commons.utils.http_error import InternalServerError, GatewayTimeout
 from django.conf import settings
 
 from .loggers import app_logger, error_logger
+from .timing import timed
 
 
 def make_request(
@@ -80,7 +81,8 @@ def make_request(
 
     try:
         request_epoch = time.time() * 1000
-        response = requests.request(method, url, **req)
+        with timed('upstream'):
+            response = requests.request(method, url, **req)
         response_epoch = time.time() * 1000
         response_content = response.content
         response_code = response.status_code
@@ -199,7 +201,8 @@ def make_basic_authorization_request(
 
     try:
         request_epoch = time.time() * 1000
-        response = requests.request(method, url, **req)
+        with timed('upstream'):
+            response = requests.request(method, url, **req)
         response_epoch = time.time() * 1000
         if not response.content:
             response_json = {}
@@ -427,7 +430,8 @@ def make_auth_request(
 
     try:
         request_epoch = time.time() * 1000
-        response = requests.request(method, url, **req)
+        with timed('upstream'):
+            response = requests.request(method, url, **req)
         response_epoch = time.time() * 1000
         if not response.content:
             response_json = {}
@@ -550,7 +554,8 @@ def make_session_request(
     try:
         request_epoch = time.time() * 1000
 
-        response = requests.request(method, url, **req)
+        with timed('upstream'):
+            response = requests.request(method, url, **req)
         response_epoch = time.time() * 1000
         response_content = response.content
         response_text = response.text
@@ -1,8 +1,12 @@
+import hashlib
+import json
 from datetime import datetime
 
 from bson.objectid import ObjectId
 from django.core.serializers.json import DjangoJSONEncoder
-from django.http.response import JsonResponse
+from django.http.response import HttpResponse, HttpResponseNotModified, JsonResponse
+
+from commons.utils.timing import timed
 
 
 class CustomJsonEncoder(DjangoJSONEncoder):
@@ -28,6 +32,7 @@ class JSONResponse(JsonResponse):
     '''A Django JsonResponse class that consumes data to be serialized to JSON using CustomJsonEncoder.
     '''
 
+    @timed('serialize')
     def __init__(self, data, encoder=CustomJsonEncoder, safe=True, json_dumps_params=None, **kwargs):
         '''
         Args:
@@ -46,6 +51,7 @@ class OK(JSONResponse):
     '''A Custom JSONResponse class that append response with 200 http status code.
     '''
 
+    @timed('serialize')
     def __init__(self, data, encoder=CustomJsonEncoder, safe=True, json_dumps_params=None, **kwargs):
         '''
         Args:
@@ -61,3 +67,70 @@ class OK(JSONResponse):
         kwargs['status'] = 200
 
         super(JSONResponse, self).__init__(data, encoder, safe, json_dumps_params, **kwargs)
+
+
+class PreSerializedBody(object):
+    '''A JSON response body encoded once and served with a strong ETag and a long Cache-Control header.
+
+    Meant for reference data which changes rarely, so the cost of encoding and hashing is paid when the body is
+    built instead of on every request.
+
+    Attributes:
+        body: JSON encoded bytes.
+        etag: strong entity tag of the body.
+        cache_control: value of the Cache-Control header.
+    '''
+
+    def __init__(self, data=None, body=None, max_age=86400, encoder=CustomJsonEncoder):
+        '''
+        Args:
+            data: (optional) Data to be dumped into JSON.
+            body: (optional) Already encoded JSON bytes, used instead of data.
+            max_age: Seconds for which clients and proxies may reuse the response.
+            encoder: A JSON encoder class.
+        '''
+
+        if body is None:
+            body = json.dumps(data, cls=encoder, separators=(',', ':')).encode('utf-8')
+
+        self.body = body
+        self.etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        self.cache_control = 'public, max-age={}'.format(max_age)
+
+    def matches(self, if_none_match):
+        '''Checks an If-None-Match header against the body's ETag.
+
+        Args:
+            if_none_match: value of the If-None-Match request header.
+
+        Returns:
+            True if the client already holds the body.
+        '''
+
+        for etag in if_none_match.split(','):
+            etag = etag.strip()
+
+            if etag == '*' or etag.replace('W/', '', 1) == self.etag:
+                return True
+
+        return False
+
+    def response(self, request):
+        '''Builds the HTTP response for a request, answering conditional requests with 304.
+
+        Args:
+            request: Django's request object.
+
+        Returns:
+            HttpResponse with the encoded body or HttpResponseNotModified.
+        '''
+
+        if self.matches(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(self.body, content_type='application/json')
+
+        response['ETag'] = self.etag
+        response['Cache-Control'] = self.cache_control
+
+        return response
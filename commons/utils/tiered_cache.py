@@ -0,0 +1,325 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+from commons.utils.loggers import error_logger
+from commons.utils.redis_manager import get_redis_client, get_subscriber_client
+
+invalidation_channel = 'cache:invalidate'
+
+# seconds between pings of the subscription, and seconds without a pong after which it is considered lost
+INVALIDATION_PING_INTERVAL = 5
+INVALIDATION_PONG_TIMEOUT = 15
+
+
+class InvalidationListener(object):
+    '''Subscriber of the invalidation channel, dropping the entries of local caches written by other processes.
+
+    One daemon thread per process is started on the first use of a local cache, and started again in forked worker
+    processes. The subscription holds a connection of the subscriber pool and pings redis every
+    INVALIDATION_PING_INTERVAL seconds, a connection which answered no ping for INVALIDATION_PONG_TIMEOUT seconds
+    is dropped as half-open. Local caches are not served from until the subscription is confirmed, and are cleared
+    whenever the subscription is lost since invalidations may have been missed meanwhile. Invalidations carry the
+    id of the publishing process, which already dropped its own keys, so a process skips the ones it published.
+
+    Attributes:
+        alias: alias of the cache in CACHES setting whose redis the invalidations are published on.
+        caches: dictionary of name to LocalCache.
+        connected: True while the subscription is live.
+        origin: random id of the process in published invalidations, generated again in forked processes.
+    '''
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self.caches = {}
+        self.connected = False
+        self.pid = None
+        self.origin = None
+        self.lock = threading.Lock()
+
+    def register(self, local_cache):
+        self.caches[local_cache.name] = local_cache
+
+    def ensure_started(self):
+        if self.pid == os.getpid():
+            return
+
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+
+            self.connected = False
+            self.origin = uuid.uuid4().hex
+            self.pid = os.getpid()
+            threading.Thread(target=self.run, name='cache-invalidation', daemon=True).start()
+
+    def clear_all(self):
+        for local_cache in list(self.caches.values()):
+            local_cache.clear()
+
+    def run(self):
+        while True:
+            pubsub = None
+
+            try:
+                pubsub = get_subscriber_client().pubsub()
+                pubsub.subscribe(invalidation_channel)
+                pinged_at = ponged_at = time.monotonic()
+
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    now = time.monotonic()
+
+                    if message is None:
+                        pass
+                    elif message['type'] == 'subscribe':
+                        self.clear_all()
+                        self.connected = True
+                    elif message['type'] == 'pong':
+                        ponged_at = now
+                    elif message['type'] == 'message':
+                        self.handle(message['data'])
+
+                    if now - ponged_at > INVALIDATION_PONG_TIMEOUT:
+                        raise ConnectionError('cache invalidation subscription stopped answering pings')
+
+                    if now - pinged_at >= INVALIDATION_PING_INTERVAL:
+                        pubsub.ping()
+                        pinged_at = now
+            except Exception:
+                error_logger.exception('CACHE_INVALIDATION_LISTENER_ERROR')
+            finally:
+                self.connected = False
+                self.clear_all()
+
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+            time.sleep(1)
+
+    def handle(self, data):
+        try:
+            invalidation = json.loads(data)
+        except ValueError:
+            return
+
+        if invalidation.get('origin') == self.origin:
+            return
+
+        local_cache = self.caches.get(invalidation.get('cache'))
+
+        if local_cache is None:
+            return
+
+        if invalidation.get('keys') is None:
+            local_cache.clear()
+        else:
+            local_cache.delete(invalidation['keys'])
+
+    def publish(self, name, keys=None):
+        '''Publishes the invalidation of keys of a local cache, of every key when keys is None.
+        '''
+
+        self.ensure_started()
+        invalidation = {'cache': name, 'keys': keys, 'origin': self.origin}
+
+        try:
+            get_redis_client(self.alias).publish(invalidation_channel, json.dumps(invalidation))
+        except Exception:
+            error_logger.exception('CACHE_INVALIDATION_PUBLISH_ERROR')
+
+
+invalidation_listener = InvalidationListener()
+
+
+class LocalCache(object):
+    '''Bounded LRU of a process whose entries are dropped by invalidations published from any process.
+
+    An entry is served for at most `staleness` seconds, which bounds how old it can get when an invalidation is
+    lost. Values are shared between callers and must not be modified.
+
+    Attributes:
+        name: name of the cache, unique in the process and the same in every process.
+        max_entries: maximum number of entries kept.
+        staleness: seconds an entry is served for.
+        generation: counter bumped by every invalidation, a value read from the remote tier is only kept if no
+                    invalidation happened during the read.
+    '''
+
+    def __init__(self, name, max_entries, staleness):
+        self.name = name
+        self.max_entries = max_entries
+        self.staleness = staleness
+        self.generation = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        invalidation_listener.register(self)
+
+    def get(self, key):
+        '''Returns a (found, value) tuple.
+        '''
+
+        invalidation_listener.ensure_started()
+
+        if not invalidation_listener.connected:
+            return False, None
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return False, None
+
+            value, expires_at = entry
+
+            if time.monotonic() >= expires_at:
+                del self.entries[key]
+                return False, None
+
+            self.entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, timeout=None, generation=None):
+        '''Stores an entry for `staleness` seconds, or `timeout` seconds when shorter.
+
+        Args:
+            key: key of the entry.
+            value: value of the entry.
+            timeout: (optional) seconds the value lives in the remote tier.
+            generation: (optional) generation read before loading the value, the value is dropped if it changed.
+        '''
+
+        ttl = self.staleness if timeout is None else min(self.staleness, timeout)
+
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self.lock:
+            self.generation += 1
+
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def invalidate(self, keys=None):
+        '''Drops keys, or every key when keys is None, in this process and publishes it to the others.
+        '''
+
+        if keys is None:
+            self.clear()
+        else:
+            self.delete(keys)
+
+        invalidation_listener.publish(self.name, keys)
+
+
+class TieredCache(object):
+    '''Cache facade serving hot keys from a LocalCache in front of a django_redis cache.
+
+    Reads go to process memory first and to redis on a miss, misses are not kept locally. Writes go to redis and
+    invalidate the key in every process.
+
+    Attributes:
+        local: LocalCache of the process.
+        cache: django cache backend of the remote tier.
+        decode: (optional) callable applied to a value before it is kept locally, e.g. to build a response body
+                once per process instead of once per read.
+    '''
+
+    def __init__(self, name, max_entries, staleness, alias='default', decode=None):
+        self.local = LocalCache(name, max_entries, staleness)
+        self.cache = caches[alias]
+        self.decode = decode
+
+    def __decode(self, value):
+        return self.decode(value) if self.decode else value
+
+    def get(self, key):
+        '''Returns the value of a key, None when it is in neither tier.
+        '''
+
+        found, value = self.local.get(key)
+
+        if found:
+            return value
+
+        generation = self.local.generation
+        value = self.cache.get(key)
+
+        if value is None:
+            return None
+
+        value = self.__decode(value)
+        self.local.set(key, value, generation=generation)
+        return value
+
+    def get_many(self, keys):
+        '''Returns a dictionary of the keys found in either tier to their value.
+        '''
+
+        values = {}
+        missing = []
+
+        for key in keys:
+            found, value = self.local.get(key)
+
+            if found:
+                values[key] = value
+            else:
+                missing.append(key)
+
+        if not missing:
+            return values
+
+        generation = self.local.generation
+
+        for key, value in self.cache.get_many(missing).items():
+            values[key] = self.__decode(value)
+            self.local.set(key, values[key], generation=generation)
+
+        return values
+
+    def set(self, key, value, timeout=None):
+        '''Stores a value in redis, and in process memory once the other processes are told to drop it.
+
+        Returns:
+            The value kept in process memory.
+        '''
+
+        self.cache.set(key, value, timeout=timeout)
+        self.local.invalidate([key])
+
+        value = self.__decode(value)
+        self.local.set(key, value, timeout=timeout)
+        return value
+
+    def set_local(self, key, value):
+        '''Keeps a value in process memory only, e.g. a fallback for a key missing from redis.
+        '''
+
+        self.local.set(key, value)
+
+    def delete(self, key):
+        self.cache.delete(key)
+        self.local.invalidate([key])
@@ -0,0 +1,55 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# `phases` holds phase name to [milliseconds, count] of the request handled by the thread, or greenlet once gevent
+# patched threading, it is unset outside of a timed request
+_local = threading.local()
+
+
+def start_phases():
+    '''Starts collecting phase timings for the current request.
+
+    Returns:
+        Token passed to `stop_phases`.
+    '''
+
+    token = getattr(_local, 'phases', None)
+    _local.phases = {}
+    return token
+
+
+def stop_phases(token):
+    '''Stops collecting phase timings.
+
+    Returns:
+        Dictionary of phase name to [milliseconds, count] collected since `start_phases`.
+    '''
+
+    phases = getattr(_local, 'phases', None)
+    _local.phases = token
+    return phases or {}
+
+
+@contextmanager
+def timed(phase):
+    '''Adds the time spent in the block to a phase of the current request.
+
+    Usable as a context manager or a decorator, and a no-op outside of a timed request such as in celery tasks.
+    Time spent in the same phase more than once adds up.
+    '''
+
+    phases = getattr(_local, 'phases', None)
+
+    if phases is None:
+        yield
+        return
+
+    started_at = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        timing = phases.setdefault(phase, [0.0, 0])
+        timing[0] += (time.perf_counter() - started_at) * 1000
+        timing[1] += 1
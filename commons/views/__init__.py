@@ -2,3 +2,4 @@ from .bad_request import http_bad_request_view
 from .forbidden import http_forbidden_view
 from .internal_server_error import http_server_error_view
 from .not_found import http_not_found_view
+from .metrics import metrics_view
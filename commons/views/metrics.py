@@ -0,0 +1,24 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_http_methods
+
+from commons.utils.http_error import Forbidden
+from commons.utils.metrics import render_prometheus
+
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    '''View exposing the redis backed histograms in the Prometheus text format
+
+    Scrapers send METRICS_TOKEN as a bearer token, the endpoint answers 403 while the token is not configured.
+    '''
+
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    token = authorization[len('Bearer '):] if authorization.startswith('Bearer ') else ''
+
+    if not settings.METRICS_TOKEN or not hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+        raise Forbidden()
+
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
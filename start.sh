@@ -1,8 +1,30 @@
 if [ $1 == 'celery' ]
 then
-    echo "statrting Celery...."
-    exec celery -A care worker -l debug -c 1
+    echo "starting Celery ${2:-match} worker...."
+    # one worker per queue: $2 is otp, fetch, match or notify
+    case $2 in
+        otp)
+            # interactive, few short tasks: fetch one at a time so an OTP never waits behind a reserved one
+            exec celery -A boilerplate worker -Q otp -n otp@%h -P prefork -c ${CELERY_OTP_CONCURRENCY:-2} --prefetch-multiplier 1 -O fair -l info
+            ;;
+        fetch)
+            # waits on CoWIN, green threads keep many requests in flight
+            exec celery -A boilerplate worker -Q fetch -n fetch@%h -P gevent -c ${CELERY_FETCH_CONCURRENCY:-50} --prefetch-multiplier 1 -l info
+            ;;
+        notify)
+            # waits on SMTP and webhooks
+            exec celery -A boilerplate worker -Q notify -n notify@%h -P gevent -c ${CELERY_NOTIFY_CONCURRENCY:-20} --prefetch-multiplier 1 -l info
+            ;;
+        *)
+            # matching and fan out, CPU bound
+            exec celery -A boilerplate worker -Q match -n match@%h -P prefork -c ${CELERY_MATCH_CONCURRENCY:-2} --prefetch-multiplier 4 -l info
+            ;;
+    esac
+elif [ $1 == 'beat' ]
+then
+    echo "starting Celery beat...."
+    exec celery -A boilerplate beat -l info
 else
     echo "starting server..."
         exec python manage.py runserver
-fi
\ No newline at end of file
+fi
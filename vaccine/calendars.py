@@ -0,0 +1,213 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+
+from commons.utils.loggers import app_logger
+from commons.utils.tiered_cache import TieredCache
+from vaccine.helpers import fetch_calender_by_district, fetch_calender_by_pin
+
+calendar_cache_key = 'vaccine:calendar:{kind}:{key}:{date}'
+calendar_lock_key = 'vaccine:calendar-lock:{kind}:{key}:{date}'
+
+calendar_fetchers = {
+    'pincode': fetch_calender_by_pin,
+    'district_id': fetch_calender_by_district
+}
+
+calendar_cache = TieredCache('calendars', settings.CALENDAR_LOCAL_CACHE_SIZE, settings.CALENDAR_LOCAL_STALENESS)
+
+
+class CalendarCoalescer(object):
+    '''Read-through cache of CoWIN calendars which coalesces concurrent misses of the same calendar.
+
+    Calendars of hot pincodes and districts are served from process memory by `calendar_cache`. Within a process
+    only the first caller of a missing calendar fetches it and the others wait on its future.
+    Across processes the fetching caller holds a short redis lock, and callers of other processes which find the
+    lock taken poll the cache for a while before fetching the calendar themselves.
+
+    Attributes:
+        __inflight: dictionary of cache key to Future of the calendar being fetched.
+        __lock: lock guarding __inflight.
+    '''
+
+    def __init__(self):
+        self.__inflight = {}
+        self.__lock = threading.Lock()
+
+    def get(self, kind, key, date):
+        '''Returns the calendar of a pincode or district for the week starting at a date.
+
+        Args:
+            kind: `pincode` or `district_id`.
+            key: pincode or district id.
+            date: first date of the week as dd-mm-yyyy.
+
+        Returns:
+            calendar response of CoWIN.
+        '''
+
+        cache_key = calendar_cache_key.format(kind=kind, key=key, date=date)
+        calendar = calendar_cache.get(cache_key)
+
+        if calendar is not None:
+            return calendar
+
+        with self.__lock:
+            future = self.__inflight.get(cache_key)
+            leader = future is None
+
+            if leader:
+                future = self.__inflight[cache_key] = Future()
+
+        if not leader:
+            try:
+                return future.result(timeout=settings.CALENDAR_COALESCE_TIMEOUT)
+            except FutureTimeoutError:
+                # the leader is stuck on upstream, fetch without waiting on it any longer
+                calendar = calendar_fetchers[kind]({kind: key, 'date': date})
+                calendar_cache.set(cache_key, calendar, timeout=settings.CALENDAR_CACHE_TIMEOUT)
+                return calendar
+
+        try:
+            calendar = self.__fetch(kind, key, date, cache_key)
+            future.set_result(calendar)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.__lock:
+                self.__inflight.pop(cache_key, None)
+
+        return calendar
+
+    def __fetch(self, kind, key, date, cache_key):
+        lock_key = calendar_lock_key.format(kind=kind, key=key, date=date)
+        locked = cache.add(lock_key, 1, timeout=settings.CALENDAR_COALESCE_TIMEOUT)
+
+        if not locked:
+            deadline = time.monotonic() + settings.CALENDAR_COALESCE_TIMEOUT
+
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                calendar = calendar_cache.get(cache_key)
+
+                if calendar is not None:
+                    return calendar
+
+        try:
+            calendar = calendar_fetchers[kind]({kind: key, 'date': date})
+            calendar_cache.set(cache_key, calendar, timeout=settings.CALENDAR_CACHE_TIMEOUT)
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+        return calendar
+
+
+calendar_coalescer = CalendarCoalescer()
+
+calendar_executor = ThreadPoolExecutor(max_workers=settings.CALENDAR_BATCH_CONCURRENCY)
+
+
+def calendar_weeks(from_date, to_date):
+    '''Splits a date range into the weekly windows served by one CoWIN calendar call.
+
+    Args:
+        from_date: first date as dd-mm-yyyy.
+        to_date: (optional) last date as dd-mm-yyyy, same as from_date by default.
+
+    Returns:
+        List of first dates of each week as dd-mm-yyyy.
+
+    Raises:
+        ValueError: If a date is malformed, the range is reversed or longer than CALENDAR_BATCH_MAX_WEEKS.
+    '''
+
+    start = datetime.strptime(from_date, '%d-%m-%Y')
+    end = datetime.strptime(to_date, '%d-%m-%Y') if to_date else start
+
+    if end < start:
+        raise ValueError('to date is before from date')
+
+    weeks = [
+        (start + timedelta(days=day)).strftime('%d-%m-%Y') for day in range(0, (end - start).days + 1, 7)
+    ]
+
+    if len(weeks) > settings.CALENDAR_BATCH_MAX_WEEKS:
+        raise ValueError('date range is too long')
+
+    return weeks
+
+
+def session_date(session):
+    '''Returns the date of a calendar session, None if it is missing or malformed.
+    '''
+
+    try:
+        return datetime.strptime(session['date'], '%d-%m-%Y')
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def fetch_calendar_batch(lookups, weeks, last_date=None):
+    '''Fetches calendars of many pincodes and districts concurrently and merges them.
+
+    Centers returned by more than one lookup are merged into one entry and their sessions are deduplicated on
+    session_id. Sessions after `last_date` are left out, as the last week may run past it.
+
+    Args:
+        lookups: list of (kind, key) tuples, kind being `pincode` or `district_id`.
+        weeks: first dates of the weeks to fetch as dd-mm-yyyy.
+        last_date: (optional) last date of the range as dd-mm-yyyy.
+
+    Returns:
+        Dictionary with the merged centers and the lookups which failed.
+    '''
+
+    if last_date:
+        last_date = datetime.strptime(last_date, '%d-%m-%Y')
+
+    futures = {
+        (kind, key, week): calendar_executor.submit(calendar_coalescer.get, kind, key, week)
+        for kind, key in lookups for week in weeks
+    }
+
+    centers = {}
+    errors = []
+
+    for (kind, key, week), future in futures.items():
+        try:
+            calendar = future.result()
+        except Exception:
+            app_logger.exception('CALENDAR_BATCH_ERROR')
+            errors.append({kind: key, 'date': week})
+            continue
+
+        for center in calendar.get('centers', []):
+            merged = centers.get(center['center_id'])
+
+            if merged is None:
+                merged = centers[center['center_id']] = dict(center, sessions=[])
+                merged['_sessionIds'] = set()
+
+            for session in center.get('sessions', []):
+                date = session_date(session)
+
+                if last_date and date and date > last_date:
+                    continue
+
+                if session['session_id'] not in merged['_sessionIds']:
+                    merged['_sessionIds'].add(session['session_id'])
+                    merged['sessions'].append(session)
+
+    for center in centers.values():
+        del center['_sessionIds']
+
+    return {
+        'centers': sorted(centers.values(), key=lambda center: center['center_id']),
+        'errors': errors
+    }
@@ -0,0 +1,129 @@
+import json
+
+from django.conf import settings
+
+from commons.utils.http_error import NotFound
+from commons.utils.loggers import app_logger
+from commons.utils.response import PreSerializedBody
+from commons.utils.tiered_cache import TieredCache
+from vaccine.helpers import fetch_districts, fetch_states
+
+
+class DistrictCatalogue(object):
+    '''Store of CoWIN district lists keyed by state code.
+
+    District lists are kept as their JSON bytes in redis and served by a TieredCache as pre-serialized bodies, so
+    a body is built once per process instead of on every request. Redis is refreshed by
+    `vaccine.tasks.refresh_district_catalogue`, which drops the refreshed states from the memory of every process,
+    and a body is re-read from redis at least every `DISTRICT_CATALOGUE_LOCAL_TTL` seconds. States missing from
+    redis are served from the bundled snapshot, upstream is only called for a state which is in neither. Redis
+    entries expire after `DISTRICT_CATALOGUE_TIMEOUT` seconds, a state missing from the daily refresh is then
+    served from the snapshot again.
+
+    Attributes:
+        snapshot_path: path of the bundled JSON snapshot.
+        state_codes: set of the known CoWIN state ids, other state codes are not looked up.
+        timeout: seconds the district lists are kept in redis.
+        max_age: Cache-Control max-age of the served bodies.
+        cache: TieredCache of the district lists.
+        __snapshot: dictionary of state code to PreSerializedBody of the bundled snapshot.
+    '''
+
+    cache_key = 'vaccine:districts:{state_code}'
+
+    def __init__(self, snapshot_path, state_codes, timeout, local_ttl, max_age):
+        self.snapshot_path = snapshot_path
+        self.state_codes = {str(state_code) for state_code in state_codes}
+        self.timeout = timeout
+        self.max_age = max_age
+        self.cache = TieredCache('districts', 64, local_ttl, decode=self.decode)
+        self.__snapshot = {}
+
+        self.load_snapshot()
+
+    def decode(self, body):
+        return PreSerializedBody(body=body, max_age=self.max_age)
+
+    def load_snapshot(self):
+        '''Loads district lists from the bundled snapshot, served for states missing from redis.
+        '''
+
+        try:
+            with open(self.snapshot_path) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (IOError, ValueError):
+            app_logger.exception('DISTRICT_CATALOGUE_SNAPSHOT_ERROR')
+            snapshot = {}
+
+        for state_code, districts in snapshot.items():
+            self.__snapshot[str(state_code)] = PreSerializedBody(districts, max_age=self.max_age)
+
+    def get(self, state_code):
+        '''Returns the pre-serialized district list of a state.
+
+        Args:
+            state_code: CoWIN state id.
+
+        Returns:
+            PreSerializedBody of the district list.
+
+        Raises:
+            NotFound: If the state code is not a known CoWIN state.
+            InternalServerError: If the state is missing from the catalogue and upstream fails.
+        '''
+
+        state_code = str(state_code)
+
+        if state_code not in self.state_codes:
+            raise NotFound("State not found")
+
+        key = self.cache_key.format(state_code=state_code)
+
+        try:
+            districts = self.cache.get(key)
+        except Exception:
+            app_logger.exception('DISTRICT_CATALOGUE_CACHE_ERROR')
+            districts = None
+
+        if districts is not None:
+            return districts
+
+        districts = self.__snapshot.get(state_code)
+
+        if districts is None:
+            return self.refresh(state_code)
+
+        self.cache.set_local(key, districts)
+        return districts
+
+    def refresh(self, state_code):
+        '''Fetches the district list of a state from upstream and stores it in redis and process memory.
+
+        Args:
+            state_code: CoWIN state id.
+
+        Returns:
+            PreSerializedBody of the district list.
+        '''
+
+        key = self.cache_key.format(state_code=str(state_code))
+        districts = PreSerializedBody(fetch_districts(str(state_code)), max_age=self.max_age)
+
+        try:
+            self.cache.set(key, districts.body, timeout=self.timeout)
+        except Exception:
+            app_logger.exception('DISTRICT_CATALOGUE_CACHE_ERROR')
+
+        self.cache.set_local(key, districts)
+        return districts
+
+
+states_body = PreSerializedBody(fetch_states(), max_age=settings.REFERENCE_RESPONSE_MAX_AGE)
+
+district_catalogue = DistrictCatalogue(
+    settings.DISTRICT_CATALOGUE_SNAPSHOT,
+    [state['state_id'] for state in fetch_states()['states']],
+    settings.DISTRICT_CATALOGUE_TIMEOUT,
+    settings.DISTRICT_CATALOGUE_LOCAL_TTL,
+    settings.REFERENCE_RESPONSE_MAX_AGE
+)
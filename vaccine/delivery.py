@@ -0,0 +1,282 @@
+import json
+import time
+from datetime import datetime
+
+from django.conf import settings
+
+from commons.utils.bloom import RedisBloomFilter
+from commons.utils.notifiers import Notification, get_notifier
+from vaccine.digest import buffer_digests, claim_due_digests, complete_digests, release_digests
+from vaccine.metrics import record_matched, record_queued, record_sent
+from vaccine.models import UserDetails
+from vaccine.reports import record_deliveries, record_sent_deliveries
+from vaccine.slot_events import build_slot_event
+from vaccine.snapshots import fetch_pincode_snapshots
+
+notified_filter_key = 'vaccine:notified:{notifier}:{date}'
+
+
+def notified_filter(notifier_name):
+    '''Returns the bloom filter of (subscriber, center, session) alerts sent by a notifier today.
+
+    A new filter is used every day and the previous ones expire on their own.
+    '''
+
+    return RedisBloomFilter(
+        notified_filter_key.format(notifier=notifier_name, date=datetime.now().strftime('%Y%m%d')),
+        settings.ALERT_DEDUP_CAPACITY,
+        settings.ALERT_DEDUP_ERROR_RATE,
+        2 * 24 * 60 * 60
+    )
+
+
+def dedup_key(email, event):
+    return f"{email}:{event['centerId']}:{event['sessionId']}"
+
+
+def match_slot_events(entries):
+    '''Matches slot-open events to the active subscribers of their pincodes.
+
+    A subscriber matches an event when the session's min_age_limit is at most the subscriber's age.
+
+    Args:
+        entries: list of (entry_id, event) tuples read from the slot event stream.
+
+    Returns:
+        Dictionary of subscriber email to the list of matched (entry_id, event) tuples.
+    '''
+
+    pincodes = list({event['pincode'] for entry_id, event in entries})
+    subscribers = {}
+
+    for user in UserDetails.objects.fetch_pincode_subscribers(pincodes):
+        subscribers.setdefault(user['pincode'], []).append(user)
+
+    matches = {}
+
+    for entry_id, event in entries:
+        for user in subscribers.get(event['pincode'], []):
+            if (event.get('minAge') or 18) <= user['age']:
+                matches.setdefault(user['email'], []).append((entry_id, event))
+
+    return matches
+
+
+def build_alert_notification(email, events):
+    '''Builds the alert sent to a subscriber for a list of slot-open events.
+    '''
+
+    return Notification(
+        email,
+        'IMP-Vaccine Available Alert',
+        f'vaccine available at {json.dumps(events, indent=4)}',
+        {'events': events}
+    )
+
+
+def unseen_matches(dedup_filter, matches):
+    '''Drops matches of sessions a subscriber was already alerted of today.
+
+    Overlapping subscriptions and redelivered entries match a subscriber to the same session more than once, the
+    notifier's daily bloom filter drops those. A false positive skips an alert, at a rate bounded by
+    ALERT_DEDUP_ERROR_RATE.
+
+    Args:
+        dedup_filter: RedisBloomFilter of the notifier.
+        matches: dictionary of subscriber email to the list of matched (entry_id, event) tuples.
+
+    Returns:
+        Dictionary of the same shape without the matches already alerted.
+    '''
+
+    pairs = [(email, entry_id, event) for email, matched in matches.items() for entry_id, event in matched]
+    already_notified = dedup_filter.contains_many([dedup_key(email, event) for email, entry_id, event in pairs])
+
+    unseen = {}
+
+    for (email, entry_id, event), seen in zip(pairs, already_notified):
+        if not seen:
+            unseen.setdefault(email, []).append((entry_id, event))
+
+    return unseen
+
+
+def send_alerts(notifier_name, digests, dedup_filter):
+    '''Sends one alert per subscriber through a notifier and records the sent sessions in the bloom filter.
+
+    Sessions queued by a deferred notifier are recorded by `record_deferred_sent` once they are sent.
+
+    Args:
+        notifier_name: name of the backend in NOTIFIER_BACKENDS.
+        digests: dictionary of subscriber email to list of events.
+        dedup_filter: RedisBloomFilter of the notifier.
+
+    Returns:
+        DispatchResult of the notifier.
+    '''
+
+    notifications = [build_alert_notification(email, events) for email, events in digests.items()]
+    notifier = get_notifier(notifier_name)
+
+    queued_at = time.time()
+    record_queued(notifier_name, digests, queued_at)
+
+    result = notifier.dispatch(notifications)
+
+    failed_recipients = {notification.recipient for notification in result.failed}
+    record_deliveries(notifier_name, digests, result, queued=notifier.deferred)
+
+    # deferred notifiers only queued the notifications, `record_deferred_sent` marks them once they go out
+    if notifier.deferred:
+        return result
+
+    sent_at = time.time()
+    record_sent(notifier_name, [
+        (notification, queued_at, sent_at)
+        for notification in notifications if notification.recipient not in failed_recipients
+    ])
+
+    dedup_filter.add_many([
+        dedup_key(email, event)
+        for email, events in digests.items() if email not in failed_recipients for event in events
+    ])
+
+    return result
+
+
+def record_deferred_sent(notifier_name, sent):
+    '''Records notifications a deferred notifier sent, passed as its `on_sent` callback.
+
+    The sent sessions are added to the notifier's bloom filter, and the sends to the latency histograms and the
+    delivery counters of their sweep runs.
+
+    Args:
+        notifier_name: name of the backend in NOTIFIER_BACKENDS.
+        sent: list of (notification, queued_at, sent_at) tuples.
+    '''
+
+    if not sent:
+        return
+
+    record_sent(notifier_name, sent)
+
+    notified_filter(notifier_name).add_many([
+        dedup_key(notification.recipient, event)
+        for notification, queued_at, sent_at in sent
+        for event in (notification.payload or {}).get('events') or []
+    ])
+
+    record_sent_deliveries(notifier_name, [notification for notification, queued_at, sent_at in sent])
+
+
+def deliver_slot_entries(notifier_name, entries):
+    '''Delivers slot-open events read from the stream to their subscribers through a notifier.
+
+    With ALERT_DIGEST_WINDOW set, matched events are buffered into per subscriber digests which
+    `flush_alert_digests` sends once the window closes, otherwise they are sent right away.
+
+    Args:
+        notifier_name: name of the backend in NOTIFIER_BACKENDS.
+        entries: list of (entry_id, event) tuples.
+
+    Returns:
+        Tuple of the entry ids which can be acknowledged and the DispatchResult, None when events were buffered.
+        Entries matched to a subscriber whose notification failed are left out so they are redelivered.
+    '''
+
+    dedup_filter = notified_filter(notifier_name)
+    matches = unseen_matches(dedup_filter, match_slot_events(entries))
+    digests = {email: [dict(event) for entry_id, event in matched] for email, matched in matches.items()}
+
+    record_matched(notifier_name, [event for events in digests.values() for event in events], time.time())
+
+    if settings.ALERT_DIGEST_WINDOW:
+        buffer_digests(notifier_name, digests, settings.ALERT_DIGEST_WINDOW)
+        return [entry_id for entry_id, event in entries], None
+
+    result = send_alerts(notifier_name, digests, dedup_filter)
+
+    failed_ids = {
+        entry_id for notification in result.failed for entry_id, event in matches[notification.recipient]
+    }
+
+    return [entry_id for entry_id, event in entries if entry_id not in failed_ids], result
+
+
+def match_open_sessions(user):
+    '''Builds slot-open events for the sessions open for a subscriber in the current snapshot of their pincode.
+
+    Args:
+        user: subscriber dictionary with pincode and age.
+
+    Returns:
+        List of events.
+    '''
+
+    events = []
+
+    for snapshot in fetch_pincode_snapshots([user['pincode']]):
+        for center in snapshot.get('centers', []):
+            for session in center.get('sessions', []):
+                if session.get('available_capacity', 0) > 0 and (session.get('min_age_limit') or 18) <= user['age']:
+                    events.append(build_slot_event(snapshot['pincode'], center, session, snapshot['fetchedAt']))
+
+    return events
+
+
+def deliver_open_sessions(notifier_name, email, events):
+    '''Alerts a subscriber of sessions which were already open when they subscribed.
+
+    The sweep only alerts sessions opening after its previous run, so these events never go through the slot
+    event stream. Sessions the subscriber was alerted of today are skipped, and digests are used as for the sweep.
+
+    Args:
+        notifier_name: name of the backend in NOTIFIER_BACKENDS.
+        email: email of the subscriber.
+        events: events built by `match_open_sessions`.
+
+    Returns:
+        DispatchResult of the notifier, None when events were buffered.
+    '''
+
+    dedup_filter = notified_filter(notifier_name)
+    matches = unseen_matches(dedup_filter, {email: [(None, event) for event in events]})
+    digests = {recipient: [event for entry_id, event in matched] for recipient, matched in matches.items()}
+
+    if settings.ALERT_DIGEST_WINDOW:
+        buffer_digests(notifier_name, digests, settings.ALERT_DIGEST_WINDOW)
+        return None
+
+    return send_alerts(notifier_name, digests, dedup_filter)
+
+
+def flush_alert_digests(notifier_name, limit):
+    '''Sends the digests of a notifier whose window has closed.
+
+    Digests stay buffered until they are sent. Digests which fail to send are retried after
+    ALERT_DIGEST_RETRY_DELAY seconds, up to ALERT_DIGEST_MAX_ATTEMPTS claims after which they are dead lettered.
+
+    Args:
+        notifier_name: name of the backend in NOTIFIER_BACKENDS.
+        limit: maximum number of digests to send.
+
+    Returns:
+        DispatchResult of the notifier.
+    '''
+
+    claims = claim_due_digests(
+        notifier_name, limit, settings.ALERT_DIGEST_LEASE, settings.ALERT_DIGEST_MAX_ATTEMPTS
+    )
+    digests = {email: claim.events for email, claim in claims.items()}
+    result = send_alerts(notifier_name, digests, notified_filter(notifier_name))
+
+    failed_recipients = {notification.recipient for notification in result.failed}
+
+    complete_digests(notifier_name, {
+        email: claim for email, claim in claims.items() if email not in failed_recipients
+    })
+    release_digests(notifier_name, {
+        email: claim for email, claim in claims.items() if email in failed_recipients
+    }, settings.ALERT_DIGEST_RETRY_DELAY)
+
+    return result
@@ -0,0 +1,215 @@
+import json
+import time
+from collections import namedtuple
+
+from commons.utils.loggers import app_logger
+from commons.utils.redis_manager import get_redis_client
+
+digest_key = 'vaccine:digest:{notifier}:{email}'
+digest_due_key = 'vaccine:digest-due:{notifier}'
+digest_lease_key = 'vaccine:digest-lease:{notifier}'
+digest_attempts_key = 'vaccine:digest-attempts:{notifier}'
+digest_dead_key = 'vaccine:digest-dead:{notifier}'
+
+# dead lettered digests kept for inspection
+DEAD_DIGEST_MAXLEN = 10000
+
+# events of a claimed digest, number of buffered entries they were read from and deadline of the lease
+DigestClaim = namedtuple('DigestClaim', ['events', 'length', 'deadline'])
+
+
+def buffer_digests(notifier_name, digests, window):
+    '''Buffers matched slot-open events per subscriber until their digest window closes.
+
+    The window of a subscriber opens with the first buffered event, later events join the same digest without
+    moving its due time. Buffers live in redis so any worker can flush them.
+
+    Args:
+        notifier_name: name of the backend in NOTIFIER_BACKENDS.
+        digests: dictionary of subscriber email to list of events.
+        window: seconds for which events of a subscriber are collected.
+    '''
+
+    if not digests:
+        return
+
+    due_at = time.time() + window
+    pipeline = get_redis_client().pipeline(transaction=False)
+
+    for email, events in digests.items():
+        key = digest_key.format(notifier=notifier_name, email=email)
+
+        pipeline.rpush(key, *[json.dumps(event, separators=(',', ':')) for event in events])
+        pipeline.expire(key, max(window * 10, 24 * 60 * 60))
+
+    pipeline.zadd(digest_due_key.format(notifier=notifier_name), {email: due_at for email in digests}, nx=True)
+    pipeline.execute()
+
+
+def claim_due_digests(notifier_name, limit, lease, max_attempts):
+    '''Leases the digests whose window has closed.
+
+    A digest is claimed by adding its subscriber to the lease set with a deadline, so when workers race for a digest
+    only the one whose add succeeds reads its buffer. The buffer stays in redis until `complete_digests` trims the
+    sent events, so a worker dying before that only delays the digest: its lease expires and the digest is due
+    again. Events buffered meanwhile join the buffer behind the leased ones. A digest claimed more than
+    `max_attempts` times is moved to the dead letter list instead.
+
+    Args:
+        notifier_name: name of the backend in NOTIFIER_BACKENDS.
+        limit: maximum number of digests to claim.
+        lease: seconds after which a digest which was neither completed nor released is due again.
+        max_attempts: number of claims after which a digest is dead lettered.
+
+    Returns:
+        Dictionary of subscriber email to DigestClaim, duplicates of a session removed from its events.
+    '''
+
+    client = get_redis_client()
+    due_key = digest_due_key.format(notifier=notifier_name)
+    lease_key = digest_lease_key.format(notifier=notifier_name)
+    attempts_key = digest_attempts_key.format(notifier=notifier_name)
+    now = time.time()
+
+    expired = [email.decode() for email in client.zrangebyscore(lease_key, '-inf', now, start=0, num=limit)]
+
+    if expired:
+        pipeline = client.pipeline(transaction=False)
+
+        for email in expired:
+            pipeline.zrem(lease_key, email)
+
+        requeued = [email for email, removed in zip(expired, pipeline.execute()) if removed]
+
+        if requeued:
+            client.zadd(due_key, {email: now for email in requeued})
+
+    emails = [email.decode() for email in client.zrangebyscore(due_key, '-inf', now, start=0, num=limit)]
+
+    if not emails:
+        return {}
+
+    deadline = now + lease
+    pipeline = client.pipeline(transaction=False)
+
+    for email in emails:
+        pipeline.zadd(lease_key, {email: deadline}, nx=True)
+
+    claimed = [email for email, added in zip(emails, pipeline.execute()) if added]
+
+    if not claimed:
+        return {}
+
+    pipeline = client.pipeline(transaction=False)
+
+    for email in claimed:
+        pipeline.zrem(due_key, email)
+        pipeline.hincrby(attempts_key, email, 1)
+        pipeline.lrange(digest_key.format(notifier=notifier_name, email=email), 0, -1)
+
+    pipeline.expire(attempts_key, 2 * 24 * 60 * 60)
+    replies = pipeline.execute()
+
+    claims = {}
+    dead = {}
+
+    for index, email in enumerate(claimed):
+        attempts, buffer = replies[3 * index + 1], replies[3 * index + 2]
+        events = {}
+
+        for raw_event in buffer:
+            event = json.loads(raw_event)
+            events[(event['centerId'], event['sessionId'])] = event
+
+        claim = DigestClaim(list(events.values()), len(buffer), deadline)
+
+        if attempts > max_attempts:
+            dead[email] = claim
+        else:
+            claims[email] = claim
+
+    if dead:
+        pipeline = client.pipeline(transaction=False)
+        dead_key = digest_dead_key.format(notifier=notifier_name)
+
+        for email, claim in dead.items():
+            pipeline.lpush(dead_key, json.dumps({'email': email, 'events': claim.events, 'failedAt': now}))
+
+        pipeline.ltrim(dead_key, 0, DEAD_DIGEST_MAXLEN - 1)
+        pipeline.execute()
+
+        app_logger.error(f'ALERT_DIGEST_DEAD_LETTER: {notifier_name} {len(dead)} digests')
+        complete_digests(notifier_name, dead)
+
+    # buffers which expired leave nothing to send
+    complete_digests(notifier_name, {email: claim for email, claim in claims.items() if not claim.length})
+
+    return {email: claim for email, claim in claims.items() if claim.length}
+
+
+def _owned_claims(client, lease_key, claims):
+    '''Returns the emails of claims whose lease was not taken over after expiring.
+    '''
+
+    pipeline = client.pipeline(transaction=False)
+
+    for email in claims:
+        pipeline.zscore(lease_key, email)
+
+    return [email for email, score in zip(claims, pipeline.execute()) if score == claims[email].deadline]
+
+
+def complete_digests(notifier_name, claims):
+    '''Drops the sent events of claimed digests from their buffers and ends their leases.
+
+    Args:
+        notifier_name: name of the backend in NOTIFIER_BACKENDS.
+        claims: dictionary of subscriber email to DigestClaim.
+    '''
+
+    if not claims:
+        return
+
+    client = get_redis_client()
+    lease_key = digest_lease_key.format(notifier=notifier_name)
+    owned = _owned_claims(client, lease_key, claims)
+
+    if not owned:
+        return
+
+    pipeline = client.pipeline(transaction=False)
+
+    for email in owned:
+        pipeline.ltrim(digest_key.format(notifier=notifier_name, email=email), claims[email].length, -1)
+        pipeline.zrem(lease_key, email)
+        pipeline.hdel(digest_attempts_key.format(notifier=notifier_name), email)
+
+    pipeline.execute()
+
+
+def release_digests(notifier_name, claims, retry_delay):
+    '''Ends the leases of claimed digests which failed to send, they are due again after `retry_delay` seconds.
+
+    Args:
+        notifier_name: name of the backend in NOTIFIER_BACKENDS.
+        claims: dictionary of subscriber email to DigestClaim.
+        retry_delay: seconds after which the digests are due again.
+    '''
+
+    if not claims:
+        return
+
+    client = get_redis_client()
+    lease_key = digest_lease_key.format(notifier=notifier_name)
+    owned = _owned_claims(client, lease_key, claims)
+
+    if not owned:
+        return
+
+    pipeline = client.pipeline(transaction=False)
+    pipeline.zadd(digest_due_key.format(notifier=notifier_name), {email: time.time() + retry_delay for email in owned})
+
+    for email in owned:
+        pipeline.zrem(lease_key, email)
+
+    pipeline.execute()
@@ -0,0 +1,187 @@
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from vaccine.geography import pincode_table
+from vaccine.snapshots import fetch_pincode_snapshots
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.2
+
+
+def haversine_km(latitude, longitude, other_latitude, other_longitude):
+    '''Great circle distance between two coordinates in kilometres.
+    '''
+
+    latitude, longitude, other_latitude, other_longitude = map(
+        math.radians, (latitude, longitude, other_latitude, other_longitude)
+    )
+    a = (
+        math.sin((other_latitude - latitude) / 2) ** 2 +
+        math.cos(latitude) * math.cos(other_latitude) * math.sin((other_longitude - longitude) / 2) ** 2
+    )
+
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class CenterIndex(object):
+    '''Uniform grid over vaccination center coordinates.
+
+    Centers are bucketed into cells of `cell_size` degrees, so a radius query only visits the cells overlapping the
+    query's bounding box instead of every center.
+
+    Attributes:
+        cell_size: edge of a grid cell in degrees.
+        built_at: monotonic time at which the index was built.
+        __cells: dictionary of (row, column) to list of (latitude, longitude, center) tuples.
+    '''
+
+    def __init__(self, cell_size=0.1):
+        self.cell_size = cell_size
+        self.built_at = time.monotonic()
+        self.__cells = {}
+
+    def __cell(self, latitude, longitude):
+        return int(math.floor(latitude / self.cell_size)), int(math.floor(longitude / self.cell_size))
+
+    def add(self, latitude, longitude, center):
+        self.__cells.setdefault(self.__cell(latitude, longitude), []).append((latitude, longitude, center))
+
+    def query(self, latitude, longitude, radius_km):
+        '''Finds centers within a radius of a coordinate.
+
+        Args:
+            latitude: latitude of the origin.
+            longitude: longitude of the origin.
+            radius_km: search radius in kilometres.
+
+        Returns:
+            List of (distance_km, center) tuples in no particular order.
+        '''
+
+        latitude_delta = radius_km / KM_PER_DEGREE
+        longitude_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+        min_row, min_column = self.__cell(latitude - latitude_delta, longitude - longitude_delta)
+        max_row, max_column = self.__cell(latitude + latitude_delta, longitude + longitude_delta)
+
+        results = []
+
+        for row in range(min_row, max_row + 1):
+            for column in range(min_column, max_column + 1):
+                for center_latitude, center_longitude, center in self.__cells.get((row, column), ()):
+                    distance = haversine_km(latitude, longitude, center_latitude, center_longitude)
+
+                    if distance <= radius_km:
+                        results.append((distance, center))
+
+        return results
+
+
+def center_coordinates(center):
+    '''Coordinates of a CoWIN center, falling back to its pincode's location when CoWIN has none.
+
+    Returns:
+        (latitude, longitude) tuple or None.
+    '''
+
+    latitude, longitude = center.get('lat'), center.get('long')
+
+    if latitude and longitude:
+        return float(latitude), float(longitude)
+
+    location = pincode_table.lookup(center.get('pincode'))
+
+    if location:
+        return location.latitude, location.longitude
+
+    return None
+
+
+def build_center_index():
+    '''Builds a CenterIndex from the calendar snapshots stored by the sweep.
+    '''
+
+    index = CenterIndex(settings.GEO_INDEX_CELL_SIZE)
+
+    for snapshot in fetch_pincode_snapshots():
+        for center in snapshot.get('centers', []):
+            coordinates = center_coordinates(center)
+
+            if coordinates:
+                index.add(coordinates[0], coordinates[1], center)
+
+    return index
+
+
+class NearbyCenters(object):
+    '''Process wide CenterIndex rebuilt from snapshots once it is older than `GEO_INDEX_REFRESH_SECONDS`.
+
+    A rebuild happens on the request thread which finds the index stale, other threads keep querying the previous
+    index meanwhile.
+    '''
+
+    def __init__(self):
+        self.__index = None
+        self.__lock = threading.Lock()
+
+    def is_stale(self, index):
+        return index is None or time.monotonic() - index.built_at > settings.GEO_INDEX_REFRESH_SECONDS
+
+    def index(self):
+        index = self.__index
+
+        if self.is_stale(index) and self.__lock.acquire(blocking=index is None):
+            try:
+                index = self.__index
+
+                if self.is_stale(index):
+                    index = self.__index = build_center_index()
+            finally:
+                self.__lock.release()
+
+        return index
+
+    def search(self, latitude, longitude, radius_km, min_age_limit=None, limit=50):
+        '''Finds centers with open sessions around a coordinate.
+
+        Centers are ranked by distance rounded to the kilometre, and centers at the same distance by their
+        available capacity.
+
+        Args:
+            latitude: latitude of the origin.
+            longitude: longitude of the origin.
+            radius_km: search radius in kilometres.
+            min_age_limit: (optional) age of the user, sessions with a higher min_age_limit are skipped.
+            limit: maximum number of centers returned.
+
+        Returns:
+            List of center dictionaries with only open sessions, along with distance and available capacity.
+        '''
+
+        results = []
+
+        for distance, center in self.index().query(latitude, longitude, radius_km):
+            sessions = [
+                session for session in center.get('sessions', [])
+                if session.get('available_capacity', 0) > 0 and (
+                    min_age_limit is None or session.get('min_age_limit', 18) <= min_age_limit
+                )
+            ]
+
+            if sessions:
+                result = dict(center)
+                result.update({
+                    'sessions': sessions,
+                    'distance_km': round(distance, 2),
+                    'available_capacity': sum(session.get('available_capacity', 0) for session in sessions)
+                })
+                results.append(result)
+
+        results.sort(key=lambda center: (round(center['distance_km']), -center['available_capacity']))
+
+        return results[:limit]
+
+
+nearby_centers = NearbyCenters()
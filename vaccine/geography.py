@@ -0,0 +1,142 @@
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+from django.conf import settings
+
+from commons.utils.loggers import app_logger
+
+PincodeLocation = namedtuple('PincodeLocation', ['pincode', 'district_id', 'state_id', 'latitude', 'longitude'])
+
+
+class PincodeTable(object):
+    '''Read only pincode to district table backed by a memory-mapped binary file.
+
+    The file is a 16 byte header followed by fixed width records sorted by pincode, so a lookup is a binary search
+    over the mapped pages and needs no parsing at startup. The mapping is opened at import time, before workers fork,
+    and the pages are shared through the page cache by every process. The table is built by `build_pincode_table`,
+    while it is empty the features resolving pincodes answer that pincode lookups are unavailable.
+
+    File layout (little endian):
+        header: magic (8 bytes), record count (uint32), padding (4 bytes)
+        record: pincode (uint32), district_id (uint16), state_id (uint8), padding (1 byte),
+                latitude (float32), longitude (float32)
+
+    Attributes:
+        path: path of the table file.
+        count: number of records in the table.
+        __buffer: memory map of the table file.
+    '''
+
+    magic = b'PINGEO01'
+    header = struct.Struct('<8sI4x')
+    record = struct.Struct('<IHBxff')
+    key = struct.Struct('<I')
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.__buffer = None
+
+        self.open()
+
+    def open(self):
+        '''Maps the table file into memory, leaving the table empty if the file is missing or malformed.
+        '''
+
+        try:
+            with open(self.path, 'rb') as table_file:
+                buffer = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, ValueError):
+            app_logger.exception('PINCODE_TABLE_ERROR')
+            return
+
+        magic, count = self.header.unpack_from(buffer, 0) if len(buffer) >= self.header.size else (None, 0)
+
+        if magic != self.magic or len(buffer) != self.header.size + count * self.record.size:
+            app_logger.error('PINCODE_TABLE_ERROR: malformed table at ' + self.path)
+            buffer.close()
+            return
+
+        self.__buffer = buffer
+        self.count = count
+
+        if not count:
+            app_logger.error('PINCODE_TABLE_EMPTY: run build_pincode_table to fill ' + self.path)
+
+    def __len__(self):
+        return self.count
+
+    def __pincode_at(self, index):
+        return self.key.unpack_from(self.__buffer, self.header.size + index * self.record.size)[0]
+
+    def lookup(self, pincode):
+        '''Finds the location of a pincode.
+
+        Args:
+            pincode: six digit pincode as string or integer.
+
+        Returns:
+            PincodeLocation of the pincode, None if the pincode is not in the table.
+        '''
+
+        try:
+            pincode = int(pincode)
+        except (TypeError, ValueError):
+            return None
+
+        low, high = 0, self.count
+
+        while low < high:
+            middle = (low + high) // 2
+
+            if self.__pincode_at(middle) < pincode:
+                low = middle + 1
+            else:
+                high = middle
+
+        if low < self.count and self.__pincode_at(low) == pincode:
+            return PincodeLocation(*self.record.unpack_from(self.__buffer, self.header.size + low * self.record.size))
+
+        return None
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield PincodeLocation(
+                *self.record.unpack_from(self.__buffer, self.header.size + index * self.record.size)
+            )
+
+    @classmethod
+    def build(cls, locations, path):
+        '''Writes a table file from pincode locations.
+
+        The file is written next to the target and renamed over it, so running processes keep their mapping of the
+        previous table until they restart.
+
+        Args:
+            locations: iterable of PincodeLocation, duplicates of a pincode keep the last one.
+            path: path of the table file.
+
+        Returns:
+            Number of records written.
+        '''
+
+        records = {int(location.pincode): location for location in locations}
+        temp_path = path + '.tmp'
+
+        with open(temp_path, 'wb') as table_file:
+            table_file.write(cls.header.pack(cls.magic, len(records)))
+
+            for pincode in sorted(records):
+                location = records[pincode]
+                table_file.write(cls.record.pack(
+                    pincode, int(location.district_id), int(location.state_id),
+                    float(location.latitude), float(location.longitude)
+                ))
+
+        os.replace(temp_path, path)
+        return len(records)
+
+
+pincode_table = PincodeTable(settings.PINCODE_TABLE_PATH)
@@ -0,0 +1,119 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from boilerplate.middlewares.helpers import RequestValidationConfig
+from commons.utils.mongo_monitoring import plan_stages
+from vaccine.models import SweepReport, UserDetails, user_email_index
+
+# filters of the manager queries with sample values, the plan chosen by mongo does not depend on the values
+FIND_QUERIES = [
+    ('UserDetailsManager.fetch_user_details', UserDetails, {'email': 'audit@example.com'}, None),
+    ('UserDetailsManager.update_user_details', UserDetails, {'email': 'audit@example.com'}, None),
+    (
+        'UserDetailsManager.fetch_pincode_subscribers',
+        UserDetails,
+        {'pincode': {'$in': ['110001', '560001']}, 'active': True, 'alertCount': {'$lt': 5}},
+        None
+    ),
+    ('admin_subscribers', UserDetails, {'pincode': '110001'}, [('_id', 1)]),
+    ('SweepReportManager.fetch_sweep_report', SweepReport, {'runId': 'audit'}, None),
+    ('SweepReportManager.fetch_sweep_reports', SweepReport, {}, [('startedOn', -1)]),
+    (
+        'request_validator',
+        RequestValidationConfig,
+        {'routeName': 'calendar_pin', 'isActive': True, 'method': 'GET'},
+        None
+    ),
+]
+
+AGGREGATE_QUERIES = [
+    (
+        'UserDetailsManager.fetch_alert_pincodes',
+        UserDetails,
+        [
+            {'$match': {'active': True, 'alertCount': {'$lt': 5}, 'pincode': {'$nin': [None, '']}}},
+            {'$group': {'_id': '$pincode'}}
+        ]
+    ),
+]
+
+MODELS = (UserDetails, SweepReport, RequestValidationConfig)
+
+# indexes only created by this command, see `vaccine.models.user_email_index`
+MANAGED_INDEXES = {
+    UserDetails: [user_email_index]
+}
+
+
+class Command(BaseCommand):
+    '''Checks the plans of the manager queries against the declared indexes.
+
+    Declared indexes missing from a collection are listed, and every manager query is explained with sample values.
+    Queries whose winning plan scans the whole collection are reported and make the command fail, so it can run
+    in a deployment pipeline. `--create-indexes` creates missing declared indexes first, and creates the unique
+    email index after checking that existing documents do not violate it.
+    '''
+
+    help = 'Report manager queries whose query plan is a collection scan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--create-indexes', action='store_true', help='Create missing declared indexes first')
+
+    def handle(self, *args, **options):
+        for model in MODELS:
+            self.check_indexes(model, options['create_indexes'])
+
+        scans = []
+
+        for name, model, query, sort in FIND_QUERIES:
+            cursor = model._mongometa.collection.find(query)
+
+            if sort:
+                cursor = cursor.sort(sort)
+
+            plan = cursor.limit(1).explain()
+            scans += self.report(name, plan['queryPlanner']['winningPlan'])
+
+        for name, model, pipeline in AGGREGATE_QUERIES:
+            plan = model._mongometa.collection.database.command(
+                'aggregate', model._mongometa.collection_name, pipeline=pipeline, explain=True
+            )
+            query_planner = plan.get('queryPlanner') or plan['stages'][0]['$cursor']['queryPlanner']
+            scans += self.report(name, query_planner['winningPlan'])
+
+        if scans:
+            raise CommandError('Collection scans in: ' + ', '.join(scans))
+
+    def check_indexes(self, model, create):
+        collection = model._mongometa.collection
+        existing = {
+            tuple(info['key']) for info in collection.index_information().values()
+        }
+        declared = list(model._mongometa.indexes) + MANAGED_INDEXES.get(model, [])
+        missing = [index for index in declared if tuple(index.document['key'].items()) not in existing]
+
+        for index in missing:
+            self.stdout.write(f'{model._mongometa.collection_name}: missing index {index.document["name"]}')
+
+        if not create or not missing:
+            return
+
+        if user_email_index in missing:
+            duplicates = list(collection.aggregate([
+                {'$group': {'_id': '$email', 'count': {'$sum': 1}}},
+                {'$match': {'count': {'$gt': 1}}},
+                {'$limit': 20}
+            ], allowDiskUse=True))
+
+            if duplicates:
+                raise CommandError(
+                    'Duplicate emails block the unique email index: ' + ', '.join(str(doc['_id']) for doc in duplicates)
+                )
+
+        collection.create_indexes(missing)
+        self.stdout.write(f'{model._mongometa.collection_name}: created {len(missing)} indexes')
+
+    def report(self, name, winning_plan):
+        stages = plan_stages(winning_plan)
+        self.stdout.write(f"{name}: {' <- '.join(stages)}")
+
+        return [name] if 'COLLSCAN' in stages else []
@@ -0,0 +1,130 @@
+import time
+import uuid
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from kombu import compression, serialization
+
+from commons.utils.compression import register_lz4
+from commons.utils.redis_manager import get_redis_client
+from vaccine.models import UserDetails
+from vaccine.snapshots import fetch_pincode_snapshots
+
+
+class Command(BaseCommand):
+    '''Compares serializers and compressions on the messages and results of the hourly sweep.
+
+    Sweep chunk messages are built from the pincodes of the current subscribers, and the stored calendar snapshots
+    stand in for large results. Every combination is timed over `--rounds` encodes and decodes, and its redis memory
+    is measured by pushing the encoded bodies into a temporary list, the same way the broker queues them.
+    '''
+
+    help = 'Benchmark encode and decode time and redis memory of celery serializers and compressions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--serializers', default='json,msgpack', help='Comma separated serializers')
+        parser.add_argument('--compressions', default='none,zlib,lz4', help='Comma separated compressions')
+        parser.add_argument('--chunk-size', type=int, default=5, help='Pincodes per sweep message')
+        parser.add_argument('--snapshots', type=int, default=200, help='Calendar snapshots used as results')
+        parser.add_argument('--rounds', type=int, default=5, help='Encode and decode rounds per combination')
+
+    def handle(self, *args, **options):
+        register_lz4()
+
+        compressions = []
+
+        for name in options['compressions'].split(','):
+            try:
+                if name != 'none':
+                    compression.get_encoder(name)
+            except KeyError:
+                self.stderr.write(f'Skipping unavailable compression {name}')
+            else:
+                compressions.append(name)
+
+        pincodes = UserDetails.objects.fetch_alert_pincodes()
+        chunk_size = options['chunk_size']
+
+        samples = {
+            'chunks': [
+                ((pincodes[index:index + chunk_size],), {}, {'callbacks': None, 'errbacks': None, 'chain': None})
+                for index in range(0, len(pincodes), chunk_size)
+            ],
+            'snapshots': list(islice(fetch_pincode_snapshots(), options['snapshots']))
+        }
+
+        client = get_redis_client()
+
+        self.stdout.write(
+            f'{"payload":<10} {"serializer":<10} {"compression":<11} {"count":>6} {"bytes":>10} '
+            f'{"redis bytes":>12} {"encode ms":>10} {"decode ms":>10}'
+        )
+
+        for payload_name, payloads in samples.items():
+            if not payloads:
+                self.stderr.write(f'No {payload_name} to benchmark')
+                continue
+
+            for serializer in options['serializers'].split(','):
+                for compression_name in compressions:
+                    try:
+                        row = self.measure(client, payloads, serializer, compression_name, options['rounds'])
+                    except serialization.SerializerNotInstalled as e:
+                        raise CommandError(str(e))
+
+                    self.stdout.write(
+                        f'{payload_name:<10} {serializer:<10} {compression_name:<11} {len(payloads):>6} '
+                        f'{row["bytes"]:>10} {row["redis_bytes"]:>12} {row["encode_ms"]:>10.2f} '
+                        f'{row["decode_ms"]:>10.2f}'
+                    )
+
+    def encode(self, payload, serializer, compression_name):
+        '''Encodes a payload the way kombu publishes it.
+
+        Returns:
+            Tuple of content type, content encoding, compression content type or None and body.
+        '''
+
+        content_type, content_encoding, body = serialization.dumps(payload, serializer=serializer)
+
+        if compression_name == 'none':
+            return content_type, content_encoding, None, body
+
+        body, compression_type = compression.compress(body, compression_name)
+        return content_type, content_encoding, compression_type, body
+
+    def decode(self, content_type, content_encoding, compression_type, body):
+        if compression_type:
+            body = compression.decompress(body, compression_type)
+
+        return serialization.loads(body, content_type, content_encoding, accept=None)
+
+    def measure(self, client, payloads, serializer, compression_name, rounds):
+        started_at = time.perf_counter()
+
+        for _ in range(rounds):
+            encoded = [self.encode(payload, serializer, compression_name) for payload in payloads]
+
+        encode_ms = (time.perf_counter() - started_at) * 1000 / rounds
+        started_at = time.perf_counter()
+
+        for _ in range(rounds):
+            for message in encoded:
+                self.decode(*message)
+
+        decode_ms = (time.perf_counter() - started_at) * 1000 / rounds
+        bodies = [message[-1] for message in encoded]
+        key = f'benchmark:serializers:{uuid.uuid4().hex}'
+
+        try:
+            client.rpush(key, *bodies)
+            redis_bytes = client.memory_usage(key, samples=0)
+        finally:
+            client.delete(key)
+
+        return {
+            'bytes': sum(len(body.encode() if isinstance(body, str) else body) for body in bodies),
+            'redis_bytes': redis_bytes,
+            'encode_ms': encode_ms,
+            'decode_ms': decode_ms
+        }
@@ -0,0 +1,45 @@
+import csv
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from vaccine.geography import PincodeLocation, PincodeTable
+
+
+class Command(BaseCommand):
+    '''Builds the bundled pincode geography table from a CSV file.
+
+    The CSV must have a header row with the columns pincode, district_id, state_id, latitude and longitude, where
+    district_id and state_id are CoWIN ids.
+    '''
+
+    help = 'Build the memory-mapped pincode to district table from a CSV file.'
+
+    columns = PincodeLocation._fields
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='CSV file with pincode, district_id, state_id, latitude, longitude columns')
+        parser.add_argument('--output', default=settings.PINCODE_TABLE_PATH, help='Path of the table file')
+
+    def handle(self, *args, **options):
+        locations = []
+
+        with open(options['source'], newline='') as source_file:
+            reader = csv.DictReader(source_file)
+
+            missing_columns = set(self.columns) - set(reader.fieldnames or [])
+            if missing_columns:
+                raise CommandError('Missing columns: ' + ', '.join(sorted(missing_columns)))
+
+            for line_number, row in enumerate(reader, start=2):
+                try:
+                    locations.append(PincodeLocation(
+                        int(row['pincode']), int(row['district_id']), int(row['state_id']),
+                        float(row['latitude']), float(row['longitude'])
+                    ))
+                except (TypeError, ValueError):
+                    self.stderr.write(f'Skipping invalid row {line_number}')
+
+        count = PincodeTable.build(locations, options['output'])
+
+        self.stdout.write(f'Wrote {count} pincodes to {options["output"]}')
@@ -0,0 +1,46 @@
+from bson import json_util
+from django.core.management.base import BaseCommand
+from pymodm.connection import _get_db
+
+from commons.utils.mongo_monitoring import plan_stages, slow_query_samples_key
+from commons.utils.redis_manager import get_redis_client
+
+
+class Command(BaseCommand):
+    '''Explains the slow mongo commands sampled by `commons.utils.mongo_monitoring.CommandMonitor`.
+
+    Samples are stored with MONGO_SLOW_QUERY_EXPLAIN set, one per command shape. Each one is explained with the
+    queryPlanner verbosity, which does not run the command, and printed with its winning plan so collection scans
+    stand out. `--clear` drops the samples once explained.
+    '''
+
+    help = 'Explain the sampled slow mongo commands.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help='Drop the samples once explained')
+
+    def handle(self, *args, **options):
+        client = get_redis_client()
+        samples = client.hgetall(slow_query_samples_key)
+
+        for shape, raw_sample in sorted(samples.items()):
+            sample = json_util.loads(raw_sample)
+
+            try:
+                plan = _get_db().client[sample['database']].command(
+                    'explain', sample['command'], verbosity='queryPlanner'
+                )
+            except Exception as e:
+                self.stdout.write(f'{shape.decode()}: explain failed: {e}')
+                continue
+
+            # aggregations explain the query of their first stage under $cursor
+            query_planner = plan.get('queryPlanner') or plan.get('stages', [{}])[0].get('$cursor', {}).get(
+                'queryPlanner'
+            )
+            stages = plan_stages((query_planner or {}).get('winningPlan'))
+
+            self.stdout.write(f"{shape.decode()} {sample['milliseconds']:.1f} ms: {' <- '.join(stages)}")
+
+        if options['clear'] and samples:
+            client.hdel(slow_query_samples_key, *samples.keys())
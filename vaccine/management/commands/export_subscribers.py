@@ -0,0 +1,57 @@
+import csv
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+
+from commons.utils.response import CustomJsonEncoder
+from vaccine.models import UserDetails
+
+
+class Command(BaseCommand):
+    '''Exports subscribers as NDJSON or CSV, in the format `import_subscribers` reads.
+
+    Subscribers are streamed in keyset pages of `--batch-size` documents, so exports of any size run in constant
+    memory and every page costs the same.
+    '''
+
+    help = 'Export subscribers to an NDJSON or CSV file.'
+
+    fields = ('email', 'age', 'pincode', 'district', 'active', 'alertCount', 'createdOn', 'updatedOn')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='-', help='NDJSON or CSV file, - for stdout')
+        parser.add_argument('--format', choices=('ndjson', 'csv'), help='Defaults to the extension of the output')
+        parser.add_argument('--active', action='store_true', help='Export active subscribers only')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Subscribers fetched per round trip')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        output_format = options['format'] or ('csv' if output.endswith('.csv') else 'ndjson')
+
+        query = {'active': True} if options['active'] else {}
+        projection = dict({'_id': 0}, **{field: 1 for field in self.fields})
+
+        subscribers = UserDetails.objects.iter_keyset(
+            queries=query, projection=projection, batch_size=options['batch_size']
+        )
+        output_file = sys.stdout if output == '-' else open(output, 'w', newline='')
+        exported = 0
+
+        try:
+            if output_format == 'csv':
+                writer = csv.DictWriter(output_file, fieldnames=self.fields, extrasaction='ignore')
+                writer.writeheader()
+
+            for subscriber in subscribers:
+                if output_format == 'csv':
+                    writer.writerow(subscriber)
+                else:
+                    output_file.write(json.dumps(subscriber, cls=CustomJsonEncoder) + '\n')
+
+                exported += 1
+        finally:
+            if output_file is not sys.stdout:
+                output_file.close()
+
+        self.stderr.write(f'Exported {exported} subscribers')
@@ -0,0 +1,185 @@
+import csv
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from pymodm.errors import ValidationError
+from pymongo.errors import BulkWriteError
+
+from commons.utils.email import EMAIL_PATTERN, PINCODE_PATTERN
+from vaccine.geography import pincode_table
+from vaccine.models import UserDetails
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class Command(BaseCommand):
+    '''Imports subscriber lists handed over by partners.
+
+    Rows are streamed from an NDJSON or CSV file with email, age and a pincode or district, validated one by one
+    and inserted in unordered batches of `--batch-size`, so the file is never held in memory and a row failing to
+    insert does not stop the rest of its batch. Emails already subscribed are skipped by the unique email index,
+    the command fails before reading the file when that index was not created by `audit_query_plans
+    --create-indexes`. Rejected rows are written with their reason to `--rejects` as NDJSON.
+    '''
+
+    help = 'Import subscribers from an NDJSON or CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='NDJSON or CSV file, - for stdin')
+        parser.add_argument('--format', choices=('ndjson', 'csv'), help='Defaults to the extension of the source')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Subscribers inserted per batch')
+        parser.add_argument('--rejects', help='File the rejected rows are written to')
+
+    def handle(self, *args, **options):
+        if not UserDetails.objects.has_unique_email_index():
+            raise CommandError(
+                'The unique email index is missing, run audit_query_plans --create-indexes before importing'
+            )
+
+        source = options['source']
+        source_format = options['format'] or ('csv' if source.endswith('.csv') else 'ndjson')
+
+        self.counts = {'read': 0, 'inserted': 0, 'existing': 0, 'rejected': 0}
+        self.rejects = open(options['rejects'], 'w') if options['rejects'] else None
+        seen_emails = set()
+        batch = []
+
+        source_file = sys.stdin if source == '-' else open(source, newline='')
+
+        try:
+            for line_number, row in self.read_rows(source_file, source_format):
+                self.counts['read'] += 1
+
+                try:
+                    subscriber = self.clean_row(row)
+                except ValueError as e:
+                    self.reject(line_number, row, str(e))
+                    continue
+
+                if subscriber['email'] in seen_emails:
+                    self.reject(line_number, row, 'Duplicate email in file')
+                    continue
+
+                seen_emails.add(subscriber['email'])
+                batch.append((line_number, subscriber))
+
+                if len(batch) >= options['batch_size']:
+                    self.insert_batch(batch)
+                    batch = []
+
+            if batch:
+                self.insert_batch(batch)
+        finally:
+            if source_file is not sys.stdin:
+                source_file.close()
+
+            if self.rejects:
+                self.rejects.close()
+
+        self.stdout.write(', '.join(f'{count} {name}' for name, count in self.counts.items()))
+
+    def read_rows(self, source_file, source_format):
+        '''Yields (line number, row dictionary) tuples of the source file.
+        '''
+
+        if source_format == 'csv':
+            for line_number, row in enumerate(csv.DictReader(source_file), start=2):
+                yield line_number, row
+
+            return
+
+        for line_number, line in enumerate(source_file, start=1):
+            if not line.strip():
+                continue
+
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+
+            if not isinstance(row, dict):
+                self.counts['read'] += 1
+                self.reject(line_number, line.strip(), 'Invalid JSON object')
+                continue
+
+            yield line_number, row
+
+    def clean_row(self, row):
+        '''Validates a row and builds the subscriber document.
+
+        Raises:
+            ValueError: with the reason the row is rejected.
+        '''
+
+        email = str(row.get('email') or '').strip()
+
+        if not EMAIL_PATTERN.search(email):
+            raise ValueError('Invalid email')
+
+        try:
+            age = int(row.get('age'))
+        except (TypeError, ValueError):
+            raise ValueError('Invalid age')
+
+        if not 0 < age < 150:
+            raise ValueError('Invalid age')
+
+        pincode = str(row.get('pincode') or '').strip()
+        district = str(row.get('district') or '').strip()
+
+        if pincode:
+            if not PINCODE_PATTERN.search(pincode):
+                raise ValueError('Invalid pincode')
+
+            location = pincode_table.lookup(pincode)
+
+            if location:
+                district = str(location.district_id)
+            elif len(pincode_table):
+                raise ValueError('Unknown pincode')
+            elif not district.isdigit():
+                raise ValueError('District is required while the pincode table is empty')
+
+        if not pincode and not district.isdigit():
+            raise ValueError('Pincode or district is required')
+
+        return {
+            'email': email,
+            'age': age,
+            'pincode': pincode or None,
+            'district': district or None,
+            'active': True,
+            'alertCount': 0
+        }
+
+    def insert_batch(self, batch):
+        try:
+            inserted_ids = UserDetails.objects.insert_many(
+                [subscriber for line_number, subscriber in batch], ordered=False
+            )
+            self.counts['inserted'] += len(inserted_ids)
+        except ValidationError as e:
+            # pymodm validates the whole batch before inserting, fall back to rows one by one to find the bad ones
+            if len(batch) == 1:
+                line_number, subscriber = batch[0]
+                self.reject(line_number, subscriber, str(e))
+            else:
+                for row in batch:
+                    self.insert_batch([row])
+        except BulkWriteError as e:
+            self.counts['inserted'] += e.details['nInserted']
+
+            for error in e.details['writeErrors']:
+                line_number, subscriber = batch[error['index']]
+
+                if error['code'] == DUPLICATE_KEY_ERROR:
+                    self.counts['existing'] += 1
+                else:
+                    self.reject(line_number, subscriber, error['errmsg'])
+
+    def reject(self, line_number, row, reason):
+        self.counts['rejected'] += 1
+
+        if self.rejects:
+            self.rejects.write(json.dumps({'line': line_number, 'row': row, 'reason': reason}, default=str) + '\n')
@@ -0,0 +1,26 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from vaccine.helpers import fetch_districts, fetch_states
+
+
+class Command(BaseCommand):
+    '''Writes the bundled district catalogue snapshot from CoWIN.
+
+    The snapshot seeds `vaccine.catalogue.district_catalogue` at startup and should be regenerated before a release.
+    '''
+
+    help = 'Fetch district lists of all states from CoWIN and write them to the bundled snapshot.'
+
+    def handle(self, *args, **options):
+        snapshot = {}
+
+        for state in fetch_states()['states']:
+            snapshot[str(state['state_id'])] = fetch_districts(state['state_id'])
+
+        with open(settings.DISTRICT_CATALOGUE_SNAPSHOT, 'w') as snapshot_file:
+            json.dump(snapshot, snapshot_file, indent=1, sort_keys=True)
+
+        self.stdout.write(f'Wrote {len(snapshot)} states to {settings.DISTRICT_CATALOGUE_SNAPSHOT}')
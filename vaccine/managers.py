@@ -1,50 +1,81 @@
 from datetime import datetime, timedelta
 from bson.objectid import ObjectId
 from commons.utils.default_model_manager import DefaultManager
-from pymongo import ReturnDocument
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
 
 
 class UserDetailsManager(DefaultManager):
+    # set once the unique email index was seen, it is not dropped while the process runs
+    email_index_ready = False
+
     def insert_user_details(self, user_details):
+        '''Inserts a subscriber, the unique email index raises DuplicateKeyError if the email is registered.
+        '''
 
         user_details.update({
             'active': True,
             'alertCount': 0
         })
-        try:
-            doc = self.model.objects.insert_one(user_details)
-        except Exception as e:
-            print(e)
-        return doc
 
-    def fetch_pincode_emails(self):
+        return self.model.objects.insert_one(user_details)
+
+    def has_unique_email_index(self):
+        '''Checks that the unique email index created by `audit_query_plans --create-indexes` exists.
+
+        Registration and imports rely on it to reject emails already subscribed, without it they would insert
+        duplicate subscribers.
+        '''
+
+        if not self.email_index_ready:
+            indexes = self.model._mongometa.collection.index_information().values()
+            self.email_index_ready = any(
+                index.get('unique') and list(index['key']) == [('email', ASCENDING)] for index in indexes
+            )
+
+        return self.email_index_ready
+
+    def fetch_alert_pincodes(self):
+        '''Returns the pincodes with subscribers still due for alerts, the sweep only needs the keys since
+        subscribers are resolved again when openings are delivered.
+        '''
+
         pipeline = [
             {
                 '$match': {
                     'active': True,
-                    'alertCount': {'$lt': 5}
+                    'alertCount': {'$lt': 5},
+                    'pincode': {'$nin': [None, '']}
                 }
             },
             {
-                '$project': {
-                    '_id': 0
+                '$group': {
+                    '_id': '$pincode'
                 }
             },
             {
                 '$sort': {
-                    'updatedOn': -1,
-                    'createdOn': -1
-                }
-            },
-            {
-                '$group': {
-                    '_id': '$pincode',
-                    'userBucket': {"$push": "$$ROOT"}
+                    '_id': 1
                 }
             }
         ]
-        pincode_email_map = list(self.model.objects.aggregate(*pipeline)) or []
-        return pincode_email_map
+        return [doc['_id'] for doc in self.model.objects.aggregate(*pipeline)]
+
+    def fetch_pincode_subscribers(self, pincodes):
+
+        query = {
+            'pincode': {'$in': pincodes},
+            'active': True,
+            'alertCount': {'$lt': 5}
+        }
+
+        projection = {
+            '_id': 0,
+            'email': 1,
+            'age': 1,
+            'pincode': 1
+        }
+
+        return self.model.objects.get_all(queries=query, projection=projection)
 
     def fetch_user_details(self, email_id):
 
@@ -55,22 +86,49 @@ class UserDetailsManager(DefaultManager):
         return self.model.objects.get_one(queries=query)
 
     def update_user_details(self, email_id, user_details):
+        '''Updates a subscriber in one round trip, only if one of the fields changes.
+
+        Returns:
+            The updated document, None if no subscriber has the email or nothing would change.
+        '''
 
         query = {
-            'email': email_id
+            'email': email_id,
+            '$or': [{field: {'$ne': value}} for field, value in user_details.items()]
         }
 
+        changes = dict(user_details, updatedOn=datetime.now())
+
         if user_details['active']:
-            user_details.update({
+            changes.update({
                 'alertCount': 0
             })
 
         data = {
-            '$set': user_details
+            '$set': changes
+        }
+
+        return self.model.objects.find_one_and_update(queries=query, data=data, return_document=ReturnDocument.AFTER)
+
+
+class SweepReportManager(DefaultManager):
+    def fetch_sweep_reports(self, limit=24):
+
+        projection = {
+            '_id': 0,
+            'upstreamHistogram': 0
+        }
+
+        return self.model.objects.get_all(projection=projection, limit=limit, sort=[('startedOn', DESCENDING)])
+
+    def fetch_sweep_report(self, run_id):
+
+        query = {
+            'runId': run_id
+        }
+
+        projection = {
+            '_id': 0
         }
 
-        try:
-            doc = self.model.objects.update_one(queries=query, data=data, return_document=ReturnDocument.AFTER)
-        except Exception as e:
-            print(e)
-        return doc
+        return self.model.objects.get_one(queries=query, projection=projection)
@@ -0,0 +1,85 @@
+from commons.utils.metrics import Histogram
+from commons.utils.redis_manager import get_redis_client
+
+# upper bounds in milliseconds, alerts wait for digest windows and send quotas so they span seconds to hours
+ALERT_LATENCY_BUCKETS_MS = tuple(seconds * 1000 for seconds in (
+    1, 5, 15, 30, 60, 120, 300, 600, 900, 1800, 3600, 2 * 3600, 4 * 3600, 6 * 3600, 12 * 3600
+))
+
+alert_stage_latency = Histogram(
+    'vaccine_alert_stage_seconds',
+    'Time slot-open alerts spend in a pipeline stage: match (seen to matched), queue (matched to handed to the '
+    'notifier) and send (handed to the notifier to sent).',
+    ALERT_LATENCY_BUCKETS_MS
+)
+
+alert_latency = Histogram(
+    'vaccine_alert_latency_seconds',
+    'Time from the sweep first seeing an open slot to its alert being sent.',
+    ALERT_LATENCY_BUCKETS_MS
+)
+
+
+def record_matched(notifier_name, events, matched_at):
+    '''Stamps matched events with `matchedAt` and records the time since the sweep saw them.
+
+    Args:
+        notifier_name: name of the backend in NOTIFIER_BACKENDS.
+        events: list of matched event dictionaries, once per matched subscriber.
+        matched_at: epoch seconds of the match.
+    '''
+
+    for event in events:
+        event['matchedAt'] = matched_at
+
+    alert_stage_latency.observe_many(
+        [(matched_at - event['seenAt']) * 1000 for event in events if event.get('seenAt')],
+        stage='match', notifier=notifier_name
+    )
+
+
+def record_queued(notifier_name, digests, queued_at):
+    '''Records the time matched events waited before being handed to the notifier.
+
+    Args:
+        notifier_name: name of the backend in NOTIFIER_BACKENDS.
+        digests: dictionary of subscriber email to list of events.
+        queued_at: epoch seconds at which the notifications were handed to the notifier.
+    '''
+
+    alert_stage_latency.observe_many(
+        [
+            (queued_at - event['matchedAt']) * 1000
+            for events in digests.values() for event in events if event.get('matchedAt')
+        ],
+        stage='queue', notifier=notifier_name
+    )
+
+
+def record_sent(notifier_name, sent):
+    '''Records the send stage and the end to end latency of sent alerts.
+
+    Args:
+        notifier_name: name of the backend in NOTIFIER_BACKENDS.
+        sent: list of (notification, queued_at, sent_at) tuples.
+    '''
+
+    if not sent:
+        return
+
+    pipeline = get_redis_client().pipeline(transaction=False)
+
+    alert_stage_latency.observe_many(
+        [(sent_at - queued_at) * 1000 for notification, queued_at, sent_at in sent],
+        pipeline, stage='send', notifier=notifier_name
+    )
+    alert_latency.observe_many(
+        [
+            (sent_at - event['seenAt']) * 1000
+            for notification, queued_at, sent_at in sent
+            for event in (notification.payload or {}).get('events', []) if event.get('seenAt')
+        ],
+        pipeline, notifier=notifier_name
+    )
+
+    pipeline.execute()
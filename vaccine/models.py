@@ -1,8 +1,8 @@
 from datetime import datetime, timedelta
 
 from pymodm import MongoModel, fields
-from pymongo import DESCENDING, IndexModel
-from vaccine.managers import UserDetailsManager
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from vaccine.managers import SweepReportManager, UserDetailsManager
 
 
 class UserDetails(MongoModel):
@@ -32,6 +32,61 @@ class UserDetails(MongoModel):
                     ('district', DESCENDING)
                 ],
                 background=True
+            ),
+            IndexModel(
+                [
+                    ('pincode', ASCENDING),
+                    ('_id', ASCENDING)
+                ],
+                background=True
+            ),
+            IndexModel(
+                [
+                    ('pincode', ASCENDING),
+                    ('alertCount', ASCENDING)
+                ],
+                name='active_pincode_alertCount',
+                partialFilterExpression={'active': True},
+                background=True
             )
         ]
         final = True
+
+
+# pymodm creates the Meta indexes when the model is defined, an existing duplicate email would then stop every
+# process from importing the models. The unique email index is created by `audit_query_plans --create-indexes`
+# instead, once no duplicate emails are left. Registration and imports are refused until it exists.
+user_email_index = IndexModel([('email', ASCENDING)], unique=True, background=True)
+
+
+class SweepReport(MongoModel):
+    '''Model to maintain the summary of an hourly availability sweep.
+
+    Attributes:
+        runId: id of the sweep run, carried by the slot-open events it published.
+        startedOn: Datetime object
+        finishedOn: Datetime object
+        upstreamLatency: percentiles of the CoWIN calendar requests in milliseconds.
+        upstreamHistogram: LatencyHistogram dictionary of the CoWIN calendar requests.
+    '''
+
+    runId = fields.CharField(required=True)
+    startedOn = fields.DateTimeField(required=True)
+    finishedOn = fields.DateTimeField(required=True)
+    durationMs = fields.FloatField(required=True)
+    chunks = fields.IntegerField(required=True, default=0)
+    pincodes = fields.IntegerField(required=True, default=0)
+    failedPincodes = fields.IntegerField(required=True, default=0)
+    sessions = fields.IntegerField(required=True, default=0)
+    openings = fields.IntegerField(required=True, default=0)
+    upstreamLatency = fields.DictField(required=False, blank=True)
+    upstreamHistogram = fields.DictField(required=False, blank=True)
+    objects = SweepReportManager()
+
+    class Meta:
+        collection_name = 'SweepReport'
+        indexes = [
+            IndexModel([('runId', DESCENDING)], unique=True, background=True),
+            IndexModel([('startedOn', DESCENDING)], background=True)
+        ]
+        final = True
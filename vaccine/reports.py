@@ -0,0 +1,140 @@
+from datetime import datetime
+
+from commons.utils.histogram import LatencyHistogram
+from commons.utils.redis_manager import get_redis_client
+
+sweep_deliveries_key = 'vaccine:sweep-deliveries:{run_id}'
+
+
+def merge_chunk_reports(run_id, started_at, chunk_reports):
+    '''Merges the counters returned by the chunks of a sweep into its summary.
+
+    Args:
+        run_id: id of the sweep run.
+        started_at: epoch seconds at which the sweep was started.
+        chunk_reports: list of dictionaries returned by `fetch_vaccine_availability`.
+
+    Returns:
+        SweepReport document.
+    '''
+
+    upstream = LatencyHistogram()
+    totals = {'pincodes': 0, 'failed': 0, 'sessions': 0, 'published': 0}
+
+    for chunk_report in chunk_reports:
+        if not chunk_report:
+            continue
+
+        for name in totals:
+            totals[name] += chunk_report.get(name, 0)
+
+        upstream.merge(LatencyHistogram.from_dict(chunk_report.get('latency', {})))
+
+    finished_on = datetime.now()
+    started_on = datetime.fromtimestamp(started_at)
+
+    return {
+        'runId': run_id,
+        'startedOn': started_on,
+        'finishedOn': finished_on,
+        'durationMs': round((finished_on - started_on).total_seconds() * 1000, 2),
+        'chunks': len(chunk_reports),
+        'pincodes': totals['pincodes'],
+        'failedPincodes': totals['failed'],
+        'sessions': totals['sessions'],
+        'openings': totals['published'],
+        'upstreamLatency': upstream.summary(),
+        'upstreamHistogram': upstream.to_dict()
+    }
+
+
+def record_deliveries(notifier_name, digests, result, queued=False):
+    '''Counts matched events and notifications per sweep run of the events.
+
+    A notification covering events of several runs is counted for each of them. Notifications of deferred
+    notifiers are counted as queued, `record_sent_deliveries` counts them as notified once they are sent.
+
+    Args:
+        notifier_name: name of the backend in NOTIFIER_BACKENDS.
+        digests: dictionary of subscriber email to list of events.
+        result: DispatchResult of the notifier.
+        queued: True if the notifier only queued the notifications.
+    '''
+
+    failed_recipients = {notification.recipient for notification in result.failed}
+    counters = {}
+
+    for email, events in digests.items():
+        outcome = 'failed' if email in failed_recipients else ('queued' if queued else 'notified')
+
+        for event in events:
+            if event.get('runId'):
+                run_counters = counters.setdefault(event['runId'], {})
+                run_counters['matched'] = run_counters.get('matched', 0) + 1
+
+        for run_id in {event['runId'] for event in events if event.get('runId')}:
+            counters[run_id][outcome] = counters[run_id].get(outcome, 0) + 1
+
+    _increment_deliveries(notifier_name, counters)
+
+
+def record_sent_deliveries(notifier_name, notifications):
+    '''Counts sent notifications of a deferred notifier as notified per sweep run of their events.
+
+    Args:
+        notifier_name: name of the backend in NOTIFIER_BACKENDS.
+        notifications: list of sent Notification.
+    '''
+
+    counters = {}
+
+    for notification in notifications:
+        events = (notification.payload or {}).get('events') or []
+
+        for run_id in {event['runId'] for event in events if event.get('runId')}:
+            run_counters = counters.setdefault(run_id, {})
+            run_counters['notified'] = run_counters.get('notified', 0) + 1
+
+    _increment_deliveries(notifier_name, counters)
+
+
+def _increment_deliveries(notifier_name, counters):
+
+    if not counters:
+        return
+
+    pipeline = get_redis_client().pipeline(transaction=False)
+
+    for run_id, run_counters in counters.items():
+        key = sweep_deliveries_key.format(run_id=run_id)
+
+        for name, count in run_counters.items():
+            pipeline.hincrby(key, f'{notifier_name}:{name}', count)
+
+        pipeline.expire(key, 7 * 24 * 60 * 60)
+
+    pipeline.execute()
+
+
+def fetch_deliveries(run_ids):
+    '''Returns the delivery counters of sweep runs.
+
+    Returns:
+        Dictionary of run id to {notifier: {'matched', 'queued', 'notified', 'failed'}}.
+    '''
+
+    pipeline = get_redis_client().pipeline(transaction=False)
+
+    for run_id in run_ids:
+        pipeline.hgetall(sweep_deliveries_key.format(run_id=run_id))
+
+    deliveries = {}
+
+    for run_id, counters in zip(run_ids, pipeline.execute() if run_ids else []):
+        run_deliveries = deliveries.setdefault(run_id, {})
+
+        for field, count in counters.items():
+            notifier_name, name = field.decode().rsplit(':', 1)
+            run_deliveries.setdefault(notifier_name, {'matched': 0, 'queued': 0, 'notified': 0, 'failed': 0})[name] = int(count)
+
+    return deliveries
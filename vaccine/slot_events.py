@@ -0,0 +1,250 @@
+import json
+import os
+import socket
+import time
+
+from django.conf import settings
+from redis.exceptions import ResponseError
+
+from commons.utils.redis_manager import get_redis_client, get_subscriber_client
+from vaccine.geography import pincode_table
+
+pincode_channel = 'vaccine:slots:pin:{pincode}'
+district_channel = 'vaccine:slots:district:{district_id}'
+
+slot_event_stream = 'vaccine:slot-events'
+delivery_group = 'notify:{notifier}'
+
+
+def build_slot_event(pincode, center, session, seen_at, run_id=None):
+    '''Builds the compact event published for a newly opened session.
+
+    Args:
+        pincode: pincode swept by the sweep.
+        center: center dictionary of the CoWIN calendar.
+        session: session dictionary of the center.
+        seen_at: epoch seconds at which the sweep first saw the opening.
+        run_id: (optional) id of the sweep run which saw the opening.
+
+    Returns:
+        Event dictionary.
+    '''
+
+    location = pincode_table.lookup(pincode)
+
+    return {
+        'pincode': str(pincode),
+        'districtId': location.district_id if location else None,
+        'centerId': center.get('center_id'),
+        'name': center.get('name'),
+        'address': center.get('address'),
+        'sessionId': session.get('session_id'),
+        'date': session.get('date'),
+        'capacity': session.get('available_capacity', 0),
+        'minAge': session.get('min_age_limit'),
+        'vaccine': session.get('vaccine'),
+        'seenAt': seen_at,
+        'runId': run_id
+    }
+
+
+def event_channels(event):
+    '''Returns the pub/sub channels an event is published on.
+    '''
+
+    channels = [pincode_channel.format(pincode=event['pincode'])]
+
+    if event.get('districtId'):
+        channels.append(district_channel.format(district_id=event['districtId']))
+
+    return channels
+
+
+def publish_slot_events(events):
+    '''Publishes slot-open events in one round trip.
+
+    Every event is appended to the slot event stream, read by the delivery consumer groups, and published on its
+    pincode and district channels for live subscribers. The stream is trimmed to about SLOT_EVENT_STREAM_MAXLEN
+    entries so a stalled consumer group can not grow it without bound.
+
+    Args:
+        events: list of event dictionaries.
+
+    Returns:
+        Number of events published.
+    '''
+
+    if not events:
+        return 0
+
+    pipeline = get_redis_client().pipeline(transaction=False)
+
+    for event in events:
+        payload = json.dumps(event, separators=(',', ':'))
+
+        pipeline.xadd(slot_event_stream, {'event': payload}, maxlen=settings.SLOT_EVENT_STREAM_MAXLEN)
+
+        for channel in event_channels(event):
+            pipeline.publish(channel, payload)
+
+    pipeline.execute()
+    return len(events)
+
+
+class SlotEventConsumer(object):
+    '''Reads slot-open events of a consumer group from the slot event stream.
+
+    Every notifier has its own consumer group, so each backend receives every event once and tracks its own
+    progress. Entries stay pending until they are acknowledged, entries pending longer than
+    SLOT_EVENT_CLAIM_IDLE_MS are claimed again for redelivery, and a group with SLOT_EVENT_MAX_PENDING or more
+    pending entries stops reading new entries until its backlog drains.
+
+    Attributes:
+        group: name of the consumer group.
+        consumer: name of this consumer within the group.
+        client: redis client.
+    '''
+
+    def __init__(self, notifier):
+        self.group = delivery_group.format(notifier=notifier)
+        self.consumer = f'{socket.gethostname()}-{os.getpid()}'
+        self.client = get_redis_client()
+
+        try:
+            self.client.xgroup_create(slot_event_stream, self.group, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def __decode(self, entries):
+        return [
+            (entry_id, json.loads(fields[b'event']))
+            for entry_id, fields in entries if fields
+        ]
+
+    def claim_stale(self, count):
+        '''Claims entries which other consumers received but did not acknowledge in time.
+
+        Entries delivered SLOT_EVENT_MAX_DELIVERIES times already are acknowledged and dropped instead.
+
+        Args:
+            count: maximum number of entries to claim.
+
+        Returns:
+            List of (entry_id, event) tuples.
+        '''
+
+        stale_ids = []
+        dead_ids = []
+
+        for pending in self.client.xpending_range(slot_event_stream, self.group, '-', '+', count):
+            if pending['time_since_delivered'] < settings.SLOT_EVENT_CLAIM_IDLE_MS:
+                continue
+
+            if pending['times_delivered'] >= settings.SLOT_EVENT_MAX_DELIVERIES:
+                dead_ids.append(pending['message_id'])
+            else:
+                stale_ids.append(pending['message_id'])
+
+        if dead_ids:
+            self.ack(dead_ids)
+
+        if not stale_ids:
+            return []
+
+        entries = self.client.xclaim(
+            slot_event_stream, self.group, self.consumer, settings.SLOT_EVENT_CLAIM_IDLE_MS, stale_ids
+        )
+
+        # entries trimmed from the stream are claimed without fields and can never be delivered
+        self.ack([entry_id for entry_id, fields in entries if not fields])
+
+        return self.__decode(entries)
+
+    def read(self, count, block=None):
+        '''Reads entries which were never delivered to the group, unless the group's backlog is full.
+
+        Args:
+            count: maximum number of entries to read.
+            block: (optional) milliseconds to wait for new entries.
+
+        Returns:
+            List of (entry_id, event) tuples.
+        '''
+
+        if self.client.xpending(slot_event_stream, self.group)['pending'] >= settings.SLOT_EVENT_MAX_PENDING:
+            return []
+
+        response = self.client.xreadgroup(self.group, self.consumer, {slot_event_stream: '>'}, count, block)
+
+        return self.__decode(response[0][1]) if response else []
+
+    def ack(self, entry_ids):
+        if entry_ids:
+            self.client.xack(slot_event_stream, self.group, *entry_ids)
+
+
+def subscribe_slot_events(channels):
+    '''Subscribes to the pub/sub channels of a slot stream.
+
+    Args:
+        channels: pub/sub channels to subscribe.
+
+    Returns:
+        PubSub instance holding a connection of the subscriber pool.
+
+    Raises:
+        redis.ConnectionError: If the subscriber pool has no connection left or redis is unreachable.
+    '''
+
+    pubsub = get_subscriber_client().pubsub(ignore_subscribe_messages=True)
+
+    try:
+        pubsub.subscribe(*channels)
+    except Exception:
+        pubsub.close()
+        raise
+
+    return pubsub
+
+
+class SlotEventStream(object):
+    '''Server-Sent Events of slot-open events published on the channels of a subscription.
+
+    The stream ends after `max_duration` seconds, clients reconnect using the advertised retry interval. A comment
+    line is sent every `heartbeat` seconds without events so proxies keep the connection open. The subscription is
+    closed when the stream ends or the response is closed, even if the stream was never iterated.
+
+    Attributes:
+        pubsub: PubSub instance returned by `subscribe_slot_events`.
+        heartbeat: seconds between keep-alive comments.
+        max_duration: seconds after which the stream is closed.
+    '''
+
+    def __init__(self, pubsub, heartbeat, max_duration):
+        self.pubsub = pubsub
+        self.heartbeat = heartbeat
+        self.max_duration = max_duration
+
+    def __iter__(self):
+        try:
+            yield b'retry: 5000\n\n'
+
+            deadline = time.monotonic() + self.max_duration
+            last_sent = time.monotonic()
+
+            while time.monotonic() < deadline:
+                message = self.pubsub.get_message(timeout=1.0)
+
+                if message and message['type'] == 'message':
+                    yield b'event: slot-open\ndata: ' + message['data'] + b'\n\n'
+                    last_sent = time.monotonic()
+
+                elif time.monotonic() - last_sent >= self.heartbeat:
+                    yield b': keep-alive\n\n'
+                    last_sent = time.monotonic()
+        finally:
+            self.close()
+
+    def close(self):
+        self.pubsub.close()
@@ -0,0 +1,107 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from commons.utils.redis_manager import get_redis_client
+
+pincode_snapshot_key = 'vaccine:snapshot:pin:{pincode}'
+pincode_snapshot_index = 'vaccine:snapshot:pincodes'
+pincode_open_sessions_key = 'vaccine:snapshot:open:{pincode}'
+
+
+def open_session_ids(snapshot):
+    '''Returns ids of sessions with available capacity in a snapshot.
+    '''
+
+    if not snapshot:
+        return set()
+
+    return {
+        session['session_id']
+        for center in snapshot.get('centers', []) for session in center.get('sessions', [])
+        if session.get('available_capacity', 0) > 0
+    }
+
+
+def store_pincode_snapshot(pincode, calendar):
+    '''Stores the latest CoWIN calendar of a pincode fetched by the sweep and detects newly opened sessions.
+
+    A session is an opening when it has available capacity now and was not open in the previous sweep of the
+    pincode. Open sessions are remembered for CALENDAR_OPEN_SESSIONS_TIMEOUT seconds, longer than the snapshot
+    itself, so a snapshot expiring does not alert every open session again. Only the first sweep of a pincode
+    alerts all of its open sessions, subscribers joining later are matched against the current snapshot by
+    `vaccine.tasks.alert_open_sessions`.
+
+    Args:
+        pincode: pincode of the calendar.
+        calendar: calendarByPin response of CoWIN.
+
+    Returns:
+        Tuple of the stored snapshot and the list of (center, session) openings.
+    '''
+
+    key = pincode_snapshot_key.format(pincode=pincode)
+    open_key = pincode_open_sessions_key.format(pincode=pincode)
+    previously_open = cache.get(open_key)
+
+    if previously_open is None:
+        previously_open = open_session_ids(cache.get(key))
+
+    snapshot = {
+        'pincode': str(pincode),
+        'fetchedAt': time.time(),
+        'centers': calendar.get('centers', [])
+    }
+
+    cache.set(key, snapshot, timeout=settings.CALENDAR_SNAPSHOT_TIMEOUT)
+    cache.set(open_key, open_session_ids(snapshot), timeout=settings.CALENDAR_OPEN_SESSIONS_TIMEOUT)
+
+    pipeline = get_redis_client().pipeline(transaction=False)
+    pipeline.sadd(pincode_snapshot_index, str(pincode))
+    pipeline.expire(pincode_snapshot_index, settings.CALENDAR_SNAPSHOT_TIMEOUT)
+    pipeline.execute()
+
+    openings = [
+        (center, session)
+        for center in snapshot['centers'] for session in center.get('sessions', [])
+        if session.get('available_capacity', 0) > 0 and session['session_id'] not in previously_open
+    ]
+
+    return snapshot, openings
+
+
+def fetch_pincode_snapshots(pincodes=None, batch_size=500):
+    '''Yields stored calendar snapshots.
+
+    The index of pincodes expires with the last snapshot stored, and when all pincodes are fetched, pincodes whose
+    snapshot expired are removed from it.
+
+    Args:
+        pincodes: (optional) pincodes to fetch, all pincodes seen by the sweep by default.
+        batch_size: number of snapshots read from redis in one round trip.
+
+    Yields:
+        Snapshot dictionaries, pincodes without a live snapshot are skipped.
+    '''
+
+    prune = pincodes is None
+
+    if prune:
+        pincodes = [pincode.decode() for pincode in get_redis_client().smembers(pincode_snapshot_index)]
+
+    pincodes = list(pincodes)
+
+    for index in range(0, len(pincodes), batch_size):
+        keys = {
+            pincode_snapshot_key.format(pincode=pincode): pincode for pincode in pincodes[index:index + batch_size]
+        }
+        snapshots = cache.get_many(list(keys))
+
+        expired = [pincode for key, pincode in keys.items() if key not in snapshots]
+
+        if prune and expired:
+            get_redis_client().srem(pincode_snapshot_index, *expired)
+
+        for snapshot in snapshots.values():
+            yield snapshot
@@ -2,82 +2,257 @@ from __future__ import absolute_import, unicode_literals
 
 import os
 import re
-import traceback
+import smtplib
+import time
+import uuid
 import json
 from copy import deepcopy
 from datetime import date, datetime, timedelta
+from functools import partial
 
 from bson.objectid import ObjectId
 from celery import current_task, shared_task, task, group, chain
+from cryptography.fernet import InvalidToken
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from commons.utils.email import Gmail, validate_email, validate_pincode
-from vaccine.models import UserDetails
-from vaccine.helpers import fetch_calender_by_pin
-gmail = Gmail(settings.GMAIL_USER, settings.GMAIL_PASSWORD)
+from commons.utils.histogram import LatencyHistogram
+from commons.utils.loggers import app_logger
+from commons.utils.notifiers import OutboxNotifier, get_notifier
+from commons.utils.notifiers.outbox import SendQuota, SMTPAccount
+from commons.utils.otp import decrypt
+from commons.utils.redis_manager import get_redis_client
+from vaccine.models import SweepReport, UserDetails
+from vaccine.catalogue import district_catalogue
+from vaccine.delivery import (
+    deliver_open_sessions, deliver_slot_entries, flush_alert_digests, match_open_sessions, record_deferred_sent
+)
+from vaccine.helpers import fetch_calender_by_pin, fetch_states
+from vaccine.reports import merge_chunk_reports
+from vaccine.slot_events import SlotEventConsumer, build_slot_event, publish_slot_events
+from vaccine.snapshots import store_pincode_snapshot
+
+
+def _sweep_message_options():
+
+    options = {'serializer': settings.SWEEP_TASK_SERIALIZER}
+
+    if settings.SWEEP_TASK_COMPRESSION:
+        options['compression'] = settings.SWEEP_TASK_COMPRESSION
+
+    return options
 
 
 @shared_task()
 def send_vaccine_alert(*args, **kwargs):
 
-    pincode_users_map_list = UserDetails.objects.fetch_pincode_emails()
-    pincode_chunks = [pincode_users_map_list[x:x+5] for x in range(0, len(pincode_users_map_list), 5)]
-    job = group([fetch_vaccine_availability.s(pincode_users_map_sub_list) for pincode_users_map_sub_list in pincode_chunks])
+    run_id = uuid.uuid4().hex
+    started_at = time.time()
+
+    pincodes = UserDetails.objects.fetch_alert_pincodes()
+    pincode_chunks = [pincodes[x:x + settings.SWEEP_CHUNK_SIZE] for x in range(0, len(pincodes), settings.SWEEP_CHUNK_SIZE)]
+    job = group([
+        fetch_vaccine_availability.s(pincode_chunk, run_id).set(**_sweep_message_options())
+        for pincode_chunk in pincode_chunks
+    ])
 
-    report_sub_task = _report_task.s()
+    report_sub_task = _report_task.s(run_id, started_at).set(**_sweep_message_options())
 
     chain(job, report_sub_task)()
 
 
 @shared_task()
-def fetch_vaccine_availability(pincode_users_map_sub_list):
+def fetch_vaccine_availability(pincodes, run_id=None):
+    '''Fetches the calendar of a chunk of pincodes and publishes the sessions which opened since the last sweep.
 
-    try:
-        gmail = Gmail(settings.GMAIL_USER, settings.GMAIL_PASSWORD)
+    Returns:
+        Dictionary of the chunk's counters and the LatencyHistogram dictionary of its CoWIN requests.
+    '''
 
-        for pincode_users in pincode_users_map_sub_list:
+    upstream = LatencyHistogram()
+    sessions = 0
+    failed = 0
+    published = 0
 
-            user_list_45 = []
-            user_list_18 = []
-            centre_list_18 = []
-            centre_list_45 = []
+    for pincode in pincodes:
 
-            all_users = pincode_users.get('userBucket', [])
+        date_time = datetime.now().strftime("%d-%m-%Y")
 
-            for user in all_users:
-                if user['age'] >= 45:
-                    user_list_45.append(user['email'])
-                elif user['age'] >= 18:
-                    user_list_18.append(user['email'])
+        url_params = {
+            "pincode": pincode,
+            "date": date_time
+        }
 
-            date_time = datetime.now().strftime("%d-%m-%Y")
-
-            url_params = {
-                "pincode": pincode_users.get("_id"),
-                "date": date_time
-            }
+        requested_at = time.perf_counter()
 
+        try:
             pincode_availability = fetch_calender_by_pin(url_params)
+        except Exception:
+            app_logger.exception('SWEEP_UPSTREAM_ERROR')
+            failed += 1
+            continue
+        finally:
+            upstream.observe((time.perf_counter() - requested_at) * 1000)
+
+        try:
+            snapshot, openings = store_pincode_snapshot(pincode, pincode_availability)
+            published += publish_slot_events([
+                build_slot_event(snapshot['pincode'], center, session, snapshot['fetchedAt'], run_id)
+                for center, session in openings
+            ])
+        except Exception:
+            app_logger.exception('SWEEP_PUBLISH_ERROR')
+            failed += 1
+            continue
+
+        sessions += sum(len(center.get('sessions', [])) for center in snapshot['centers'])
+
+    if published:
+        drain_slot_events.delay()
+
+    return {
+        'pincodes': len(pincodes),
+        'failed': failed,
+        'sessions': sessions,
+        'published': published,
+        'latency': upstream.to_dict()
+    }
+
+
+@shared_task()
+def drain_slot_events(*args, **kwargs):
+
+    for notifier_name in settings.ALERT_NOTIFIERS:
+        deliver_slot_events.delay(notifier_name)
+
+
+@shared_task()
+def deliver_slot_events(notifier_name):
+
+    consumer = SlotEventConsumer(notifier_name)
+    deadline = time.monotonic() + settings.SLOT_EVENT_DELIVERY_BUDGET
+
+    entries = consumer.claim_stale(settings.SLOT_EVENT_READ_COUNT)
+
+    while time.monotonic() < deadline:
+        entries = entries or consumer.read(settings.SLOT_EVENT_READ_COUNT)
+
+        if not entries:
+            break
+
+        delivered_ids, result = deliver_slot_entries(notifier_name, entries)
+        consumer.ack(delivered_ids)
+
+        entries = []
+
+
+@shared_task()
+def alert_open_sessions(email):
+    '''Alerts a subscriber who just became active of the sessions already open at their pincode.
+    '''
+
+    user = UserDetails.objects.fetch_user_details(email)
 
-            for center in pincode_availability.get('centers'):
-                for session in center.get('sessions'):
-                    if session.get("available_capacity", 0) > 0:
-                        if session.get("min_age_limit", 45) > 18:
-                            centre_list_18.append(center)
-                        centre_list_45.append(center)
+    if not user or not user.get('active') or not user.get('pincode'):
+        return
 
-            if centre_list_18 and user_list_18:
-                for user in user_list_18:
-                    gmail.send_message(user, 'IMP-Vaccine Available Alert', f'vaccine available at {json.dumps(centre_list_18, indent=4)}')
+    events = match_open_sessions(user)
 
-            if user_list_18 and centre_list_45:
-                for user in user_list_45:
-                    gmail.send_message(user, 'IMP-Vaccine Available Alert', f'vaccine available at {json.dumps(centre_list_45, indent=4)}')
+    if not events:
+        return
 
-    except Exception:
-        pass
+    for notifier_name in settings.ALERT_NOTIFIERS:
+        try:
+            deliver_open_sessions(notifier_name, email, events)
+        except Exception:
+            app_logger.exception('OPEN_SESSIONS_ALERT_ERROR')
+
+
+@shared_task()
+def send_alert_digests(*args, **kwargs):
+
+    for notifier_name in settings.ALERT_NOTIFIERS:
+        deadline = time.monotonic() + settings.SLOT_EVENT_DELIVERY_BUDGET
+
+        try:
+            while time.monotonic() < deadline:
+                result = flush_alert_digests(notifier_name, settings.ALERT_DIGEST_FLUSH_COUNT)
+
+                if result.sent + len(result.failed) < settings.ALERT_DIGEST_FLUSH_COUNT:
+                    break
+        except Exception:
+            app_logger.exception('ALERT_DIGEST_FLUSH_ERROR')
+
+
+@shared_task()
+def send_email_outbox(*args, **kwargs):
+
+    for notifier_name in settings.ALERT_NOTIFIERS:
+        notifier = get_notifier(notifier_name)
+
+        if not isinstance(notifier, OutboxNotifier):
+            continue
+
+        try:
+            notifier.drain(on_sent=partial(record_deferred_sent, notifier_name))
+        except Exception:
+            app_logger.exception('OUTBOX_DRAIN_ERROR')
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=5)
+def send_otp_email(self, email, encrypted_key):
+    '''Sends the OTP of an encrypted key issued by the auth endpoint.
+
+    Only the encrypted key travels through the broker, the worker decrypts it just before sending. Keys which
+    expired while queued are skipped since the OTP could not be used anymore. The send is counted against the
+    daily quota of the account so the alert outbox leaves room for it.
+    '''
+
+    try:
+        otp = decrypt(encrypted_key)
+    except InvalidToken:
+        app_logger.error(f'OTP_EXPIRED_IN_QUEUE: {email}')
+        return
+
+    try:
+        gmail = Gmail(settings.GMAIL_USER, settings.GMAIL_PASSWORD)
+    except (smtplib.SMTPException, OSError) as e:
+        raise self.retry(exc=e)
+
+    try:
+        gmail.send_message(email, 'Vaccine Alert One Time Password', f'Please use OTP - {otp} to register for vaccine alert')
+    except smtplib.SMTPRecipientsRefused:
+        app_logger.exception('OTP_RECIPIENT_REFUSED')
+        return
+    except (smtplib.SMTPException, OSError) as e:
+        raise self.retry(exc=e)
+    finally:
+        gmail.close()
+
+    account = SMTPAccount(settings.GMAIL_USER, settings.GMAIL_PASSWORD, settings.GMAIL_DAILY_QUOTA)
+    SendQuota([account], get_redis_client()).consume(account, 1)
 
 
 @shared_task
-def _report_task(args):
-    pass
+def _report_task(chunk_reports, run_id=None, started_at=None):
+
+    if run_id is None:
+        return
+
+    report = merge_chunk_reports(run_id, started_at, chunk_reports)
+    SweepReport.objects.insert_one(report)
+
+    app_logger.info(
+        f"SWEEP_REPORT: {run_id} {report['pincodes']} pincodes, {report['failedPincodes']} failed, "
+        f"{report['openings']} openings in {report['durationMs']} ms"
+    )
+
+
+@shared_task()
+def refresh_district_catalogue(*args, **kwargs):
+
+    for state in fetch_states()['states']:
+        try:
+            district_catalogue.refresh(state['state_id'])
+        except Exception:
+            app_logger.exception('DISTRICT_CATALOGUE_REFRESH_ERROR')
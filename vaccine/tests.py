@@ -1,3 +1,629 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from commons.utils.histogram import LatencyHistogram
+from vaccine.calendars import CalendarCoalescer
+from vaccine.digest import buffer_digests, claim_due_digests, complete_digests, release_digests
+from vaccine.geo_index import CenterIndex, NearbyCenters
+from vaccine.geography import PincodeLocation, PincodeTable
+from vaccine.reports import merge_chunk_reports
+from vaccine.slot_events import SlotEventConsumer
+
+
+class PincodeTableTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'pincodes.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def build(self, locations):
+        return PincodeTable.build(locations, self.path)
+
+    def test_lookup_finds_every_pincode(self):
+        locations = [
+            PincodeLocation(pincode, district_id, 1, 12.5, 77.5)
+            for pincode, district_id in [(560001, 294), (110001, 141), (400001, 395), (600001, 571), (700001, 725)]
+        ]
+        self.build(locations)
+        table = PincodeTable(self.path)
+
+        self.assertEqual(len(table), 5)
+
+        for location in locations:
+            found = table.lookup(str(location.pincode))
+            self.assertEqual((found.pincode, found.district_id), (location.pincode, location.district_id))
+
+    def test_lookup_misses(self):
+        self.build([PincodeLocation(110001, 141, 9, 28.6, 77.2), PincodeLocation(560001, 294, 16, 12.9, 77.6)])
+        table = PincodeTable(self.path)
+
+        for pincode in ('100000', '110000', '110002', '999999', '', 'abc', None):
+            self.assertIsNone(table.lookup(pincode))
+
+    def test_records_are_sorted_and_deduplicated(self):
+        written = self.build([
+            PincodeLocation(560001, 294, 16, 12.9, 77.6),
+            PincodeLocation(110001, 141, 9, 28.6, 77.2),
+            PincodeLocation(560001, 265, 16, 12.9, 77.6),
+        ])
+        table = PincodeTable(self.path)
+
+        self.assertEqual(written, 2)
+        self.assertEqual([location.pincode for location in table], [110001, 560001])
+        self.assertEqual(table.lookup(560001).district_id, 265)
+
+    def test_empty_table(self):
+        self.build([])
+        table = PincodeTable(self.path)
+
+        self.assertEqual(len(table), 0)
+        self.assertIsNone(table.lookup(110001))
+
+    def test_header_carries_magic_and_count(self):
+        self.build([PincodeLocation(110001, 141, 9, 28.6, 77.2)])
+
+        with open(self.path, 'rb') as table_file:
+            data = table_file.read()
+
+        self.assertEqual(PincodeTable.header.unpack_from(data, 0), (PincodeTable.magic, 1))
+        self.assertEqual(len(data), PincodeTable.header.size + PincodeTable.record.size)
+
+    def test_malformed_files_leave_the_table_empty(self):
+        self.build([PincodeLocation(110001, 141, 9, 28.6, 77.2)])
+
+        with open(self.path, 'rb') as table_file:
+            data = table_file.read()
+
+        for malformed in (b'NOTATABL' + data[8:], data[:-1], data + b'\0' * PincodeTable.record.size, b''):
+            with open(self.path, 'wb') as table_file:
+                table_file.write(malformed)
+
+            table = PincodeTable(self.path)
+
+            self.assertEqual(len(table), 0)
+            self.assertIsNone(table.lookup(110001))
+
+    def test_missing_file_leaves_the_table_empty(self):
+        table = PincodeTable(os.path.join(self.directory, 'missing.bin'))
+
+        self.assertEqual(len(table), 0)
+        self.assertIsNone(table.lookup(110001))
+
+
+class MergeChunkReportsTests(SimpleTestCase):
+
+    def chunk_report(self, pincodes, failed, sessions, published, latencies):
+        histogram = LatencyHistogram()
+
+        for milliseconds in latencies:
+            histogram.observe(milliseconds)
+
+        return {
+            'pincodes': pincodes,
+            'failed': failed,
+            'sessions': sessions,
+            'published': published,
+            'latency': histogram.to_dict()
+        }
+
+    def test_counters_are_summed(self):
+        report = merge_chunk_reports('run', time.time() - 2, [
+            self.chunk_report(50, 1, 120, 3, [40, 80, 90]),
+            self.chunk_report(50, 0, 100, 0, [200]),
+            self.chunk_report(20, 2, 10, 1, []),
+        ])
+
+        self.assertEqual(report['runId'], 'run')
+        self.assertEqual(report['chunks'], 3)
+        self.assertEqual(report['pincodes'], 120)
+        self.assertEqual(report['failedPincodes'], 3)
+        self.assertEqual(report['sessions'], 230)
+        self.assertEqual(report['openings'], 4)
+        self.assertGreaterEqual(report['durationMs'], 2000)
+
+    def test_latencies_are_merged(self):
+        report = merge_chunk_reports('run', time.time(), [
+            self.chunk_report(1, 0, 0, 0, [40, 80, 90]),
+            self.chunk_report(1, 0, 0, 0, [200]),
+        ])
+
+        self.assertEqual(report['upstreamLatency'], {
+            'count': 4, 'mean': 102.5, 'p50': 100, 'p90': 200, 'p99': 200, 'max': 200
+        })
+        self.assertEqual(report['upstreamHistogram'], {'buckets': [[5, 1], [6, 2], [7, 1]], 'total': 410, 'max': 200})
+
+    def test_missing_chunk_reports_are_skipped(self):
+        report = merge_chunk_reports('run', time.time(), [None, {}, self.chunk_report(5, 1, 2, 1, [10])])
+
+        self.assertEqual(report['chunks'], 3)
+        self.assertEqual((report['pincodes'], report['failedPincodes'], report['openings']), (5, 1, 1))
+        self.assertEqual(report['upstreamLatency']['count'], 1)
+
+    def test_empty_sweep(self):
+        report = merge_chunk_reports('run', time.time(), [])
+
+        self.assertEqual(report['chunks'], 0)
+        self.assertEqual(report['pincodes'], 0)
+        self.assertEqual(report['upstreamLatency'], {
+            'count': 0, 'mean': None, 'p50': None, 'p90': None, 'p99': None, 'max': None
+        })
+        self.assertEqual(report['upstreamHistogram'], {'buckets': [], 'total': 0, 'max': 0})
+
+
+class FakeRedis(object):
+    '''In memory stand-in for the sorted set, list and hash commands used by the digest buffers.
+    '''
+
+    def __init__(self):
+        self.sorted_sets = {}
+        self.lists = {}
+        self.hashes = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def expire(self, key, seconds):
+        pass
+
+    def zadd(self, key, mapping, nx=False):
+        members = self.sorted_sets.setdefault(key, {})
+        added = [member for member in mapping if member not in members]
+
+        for member, score in mapping.items():
+            if not nx or member in added:
+                members[member] = score
+
+        return len(added)
+
+    def zrem(self, key, member):
+        return int(self.sorted_sets.get(key, {}).pop(member, None) is not None)
+
+    def zscore(self, key, member):
+        return self.sorted_sets.get(key, {}).get(member)
+
+    def zrangebyscore(self, key, minimum, maximum, start=None, num=None):
+        members = sorted(self.sorted_sets.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+        members = [member.encode() for member, score in members if float(minimum) <= score <= float(maximum)]
+
+        return members[start:start + num] if num is not None else members
+
+    def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(values)
+
+    def lpush(self, key, value):
+        self.lists.setdefault(key, []).insert(0, value)
+
+    def lrange(self, key, start, end):
+        values = self.lists.get(key, [])
+        return values[start:] if end == -1 else values[start:end + 1]
+
+    def ltrim(self, key, start, end):
+        self.lists[key] = self.lrange(key, start, end)
+
+    def hincrby(self, key, field, amount):
+        values = self.hashes.setdefault(key, {})
+        values[field] = values.get(field, 0) + amount
+        return values[field]
+
+    def hdel(self, key, field):
+        self.hashes.get(key, {}).pop(field, None)
+
+
+class FakePipeline(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((getattr(self.client, name), args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        replies = [command(*args, **kwargs) for command, args, kwargs in self.commands]
+        self.commands = []
+        return replies
+
+
+def slot_event(center_id, session_id):
+    return {'centerId': center_id, 'sessionId': session_id, 'pincode': '560001', 'capacity': 10}
+
+
+@mock.patch('vaccine.digest.time')
+class DigestTests(SimpleTestCase):
+
+    def setUp(self):
+        self.client = FakeRedis()
+        patcher = mock.patch('vaccine.digest.get_redis_client', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def claim(self, clock, now, lease=60, max_attempts=3):
+        clock.time.return_value = now
+        return claim_due_digests('email', 100, lease, max_attempts)
+
+    def buffered(self, email):
+        return [json.loads(event) for event in self.client.lists.get(f'vaccine:digest:email:{email}', [])]
+
+    def test_digests_are_due_once_their_window_closes(self, clock):
+        clock.time.return_value = 1000
+        buffer_digests('email', {'user@example.com': [slot_event(1, 'a')]}, 300)
+        clock.time.return_value = 1100
+        buffer_digests('email', {'user@example.com': [slot_event(1, 'a'), slot_event(2, 'b')]}, 300)
+
+        self.assertEqual(self.claim(clock, 1299), {})
+
+        claims = self.claim(clock, 1300)
+
+        # later events join the digest without moving its due time, duplicates of a session are sent once
+        self.assertEqual(list(claims), ['user@example.com'])
+        self.assertEqual(claims['user@example.com'].events, [slot_event(1, 'a'), slot_event(2, 'b')])
+        self.assertEqual(claims['user@example.com'].length, 3)
+
+    def test_leased_digests_are_not_claimed_twice(self, clock):
+        clock.time.return_value = 1000
+        buffer_digests('email', {'user@example.com': [slot_event(1, 'a')]}, 0)
+
+        self.assertEqual(len(self.claim(clock, 1000)), 1)
+        self.assertEqual(self.claim(clock, 1010), {})
+
+    def test_completed_digests_keep_events_buffered_meanwhile(self, clock):
+        clock.time.return_value = 1000
+        buffer_digests('email', {'user@example.com': [slot_event(1, 'a')]}, 0)
+        claims = self.claim(clock, 1000)
+        buffer_digests('email', {'user@example.com': [slot_event(2, 'b')]}, 0)
+
+        complete_digests('email', claims)
+
+        self.assertEqual(self.buffered('user@example.com'), [slot_event(2, 'b')])
+        self.assertEqual(self.client.sorted_sets['vaccine:digest-lease:email'], {})
+        self.assertEqual(self.client.hashes['vaccine:digest-attempts:email'], {})
+        self.assertEqual(self.claim(clock, 1001)['user@example.com'].events, [slot_event(2, 'b')])
+
+    def test_expired_leases_are_due_again(self, clock):
+        clock.time.return_value = 1000
+        buffer_digests('email', {'user@example.com': [slot_event(1, 'a')]}, 0)
+        self.claim(clock, 1000, lease=60)
+
+        self.assertEqual(self.claim(clock, 1059, lease=60), {})
+
+        claims = self.claim(clock, 1060, lease=60)
+
+        self.assertEqual(claims['user@example.com'].events, [slot_event(1, 'a')])
+        self.assertEqual(self.client.hashes['vaccine:digest-attempts:email']['user@example.com'], 2)
+
+    def test_taken_over_claims_are_not_completed(self, clock):
+        clock.time.return_value = 1000
+        buffer_digests('email', {'user@example.com': [slot_event(1, 'a')]}, 0)
+        stale_claims = self.claim(clock, 1000, lease=60)
+        claims = self.claim(clock, 1060, lease=60)
+
+        complete_digests('email', stale_claims)
+        release_digests('email', stale_claims, 0)
+
+        self.assertEqual(self.buffered('user@example.com'), [slot_event(1, 'a')])
+        self.assertEqual(
+            self.client.zscore('vaccine:digest-lease:email', 'user@example.com'), claims['user@example.com'].deadline
+        )
+
+    def test_released_digests_are_retried_after_the_delay(self, clock):
+        clock.time.return_value = 1000
+        buffer_digests('email', {'user@example.com': [slot_event(1, 'a')]}, 0)
+        claims = self.claim(clock, 1000)
+
+        release_digests('email', claims, 30)
+
+        self.assertEqual(self.client.sorted_sets['vaccine:digest-lease:email'], {})
+        self.assertEqual(self.claim(clock, 1029), {})
+        self.assertEqual(self.claim(clock, 1030)['user@example.com'].events, [slot_event(1, 'a')])
+
+    def test_digests_failing_too_often_are_dead_lettered(self, clock):
+        clock.time.return_value = 1000
+        buffer_digests('email', {'user@example.com': [slot_event(1, 'a')]}, 0)
+
+        for attempt in range(2):
+            release_digests('email', self.claim(clock, 1000 + attempt, max_attempts=2), 0)
+
+        self.assertEqual(self.claim(clock, 1002, max_attempts=2), {})
+
+        dead = [json.loads(digest) for digest in self.client.lists['vaccine:digest-dead:email']]
+
+        self.assertEqual(dead, [{'email': 'user@example.com', 'events': [slot_event(1, 'a')], 'failedAt': 1002}])
+        self.assertEqual(self.buffered('user@example.com'), [])
+        self.assertEqual(self.client.sorted_sets['vaccine:digest-lease:email'], {})
+        self.assertEqual(self.claim(clock, 1003, max_attempts=2), {})
+
+    def test_expired_buffers_are_dropped(self, clock):
+        clock.time.return_value = 1000
+        buffer_digests('email', {'user@example.com': [slot_event(1, 'a')]}, 0)
+        del self.client.lists['vaccine:digest:email:user@example.com']
+
+        self.assertEqual(self.claim(clock, 1000), {})
+        self.assertEqual(self.client.sorted_sets['vaccine:digest-lease:email'], {})
+
+
+class FakeCalendarCache(object):
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value, timeout=None):
+        self.values[key] = value
+
+
+class CalendarCoalescerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.calendar_cache = FakeCalendarCache()
+        self.lock_cache = mock.Mock()
+        self.lock_cache.add.return_value = True
+        self.fetch = mock.Mock(return_value={'centers': [{'center_id': 1}]})
+
+        for patcher in (
+            mock.patch('vaccine.calendars.calendar_cache', self.calendar_cache),
+            mock.patch('vaccine.calendars.cache', self.lock_cache),
+            mock.patch.dict('vaccine.calendars.calendar_fetchers', {'pincode': self.fetch}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.coalescer = CalendarCoalescer()
+
+    def blocking_fetch(self, started, release):
+        def fetch(params):
+            started.set()
+            release.wait(5)
+            return {'centers': [{'center_id': 1}]}
+
+        return fetch
+
+    def test_cached_calendars_are_not_fetched(self):
+        self.calendar_cache.set('vaccine:calendar:pincode:560001:10-05-2021', {'centers': []})
+
+        self.assertEqual(self.coalescer.get('pincode', '560001', '10-05-2021'), {'centers': []})
+        self.fetch.assert_not_called()
+
+    def test_misses_are_fetched_and_cached(self):
+        self.assertEqual(self.coalescer.get('pincode', '560001', '10-05-2021'), {'centers': [{'center_id': 1}]})
+
+        self.fetch.assert_called_once_with({'pincode': '560001', 'date': '10-05-2021'})
+        self.assertIn('vaccine:calendar:pincode:560001:10-05-2021', self.calendar_cache.values)
+        self.lock_cache.delete.assert_called_once_with('vaccine:calendar-lock:pincode:560001:10-05-2021')
+
+    def test_followers_wait_on_the_leader(self):
+        started, release = threading.Event(), threading.Event()
+        self.fetch.side_effect = self.blocking_fetch(started, release)
+        results = []
+
+        def get():
+            results.append(self.coalescer.get('pincode', '560001', '10-05-2021'))
+
+        leader = threading.Thread(target=get)
+        leader.start()
+        started.wait(5)
+
+        followers = [threading.Thread(target=get) for _ in range(3)]
+
+        for follower in followers:
+            follower.start()
+
+        release.set()
+
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(results, [{'centers': [{'center_id': 1}]}] * 4)
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_leader_errors_reach_the_followers(self):
+        started, release = threading.Event(), threading.Event()
+
+        def fetch(params):
+            started.set()
+            release.wait(5)
+            raise ValueError('upstream failed')
+
+        self.fetch.side_effect = fetch
+        errors = []
+
+        def get():
+            try:
+                self.coalescer.get('pincode', '560001', '10-05-2021')
+            except ValueError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=get)]
+        threads[0].start()
+        started.wait(5)
+        threads.append(threading.Thread(target=get))
+        threads[1].start()
+        release.set()
+
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(errors, ['upstream failed'] * 2)
+        self.assertEqual(self.fetch.call_count, 1)
+
+    @override_settings(CALENDAR_COALESCE_TIMEOUT=0.05)
+    def test_followers_stop_waiting_on_a_stuck_leader(self):
+        started, release = threading.Event(), threading.Event()
+        stuck_fetch = self.blocking_fetch(started, release)
+        self.fetch.side_effect = lambda params: (
+            stuck_fetch(params) if self.fetch.call_count == 1 else {'centers': []}
+        )
+
+        leader = threading.Thread(target=self.coalescer.get, args=('pincode', '560001', '10-05-2021'))
+        leader.start()
+        started.wait(5)
+
+        self.assertEqual(self.coalescer.get('pincode', '560001', '10-05-2021'), {'centers': []})
+        self.assertEqual(self.fetch.call_count, 2)
+
+        release.set()
+        leader.join(5)
+
+    @override_settings(CALENDAR_COALESCE_TIMEOUT=1)
+    def test_fetches_of_other_processes_are_awaited(self):
+        self.lock_cache.add.return_value = False
+        cache_key = 'vaccine:calendar:pincode:560001:10-05-2021'
+        threading.Timer(0.1, self.calendar_cache.set, args=(cache_key, {'centers': []})).start()
+
+        self.assertEqual(self.coalescer.get('pincode', '560001', '10-05-2021'), {'centers': []})
+        self.fetch.assert_not_called()
+        self.lock_cache.delete.assert_not_called()
+
+
+@override_settings(SLOT_EVENT_CLAIM_IDLE_MS=60000, SLOT_EVENT_MAX_DELIVERIES=3, SLOT_EVENT_MAX_PENDING=100)
+class SlotEventConsumerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.client = mock.Mock()
+        patcher = mock.patch('vaccine.slot_events.get_redis_client', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.consumer = SlotEventConsumer('email')
+
+    def pending(self, message_id, idle, deliveries):
+        return {'message_id': message_id, 'time_since_delivered': idle, 'times_delivered': deliveries}
+
+    def entry(self, event):
+        return {b'event': json.dumps(event).encode()}
+
+    def test_group_is_created_once(self):
+        self.client.xgroup_create.assert_called_once_with('vaccine:slot-events', 'notify:email', id='0', mkstream=True)
+
+    def test_stale_entries_are_claimed(self):
+        self.client.xpending_range.return_value = [
+            self.pending(b'1-0', 60000, 1),
+            self.pending(b'2-0', 1000, 1),
+        ]
+        self.client.xclaim.return_value = [(b'1-0', self.entry(slot_event(1, 'a')))]
+
+        self.assertEqual(self.consumer.claim_stale(10), [(b'1-0', slot_event(1, 'a'))])
+        self.client.xclaim.assert_called_once_with(
+            'vaccine:slot-events', 'notify:email', self.consumer.consumer, 60000, [b'1-0']
+        )
+        self.client.xack.assert_not_called()
+
+    def test_entries_delivered_too_often_are_dropped(self):
+        self.client.xpending_range.return_value = [self.pending(b'1-0', 60000, 3)]
+
+        self.assertEqual(self.consumer.claim_stale(10), [])
+        self.client.xack.assert_called_once_with('vaccine:slot-events', 'notify:email', b'1-0')
+        self.client.xclaim.assert_not_called()
+
+    def test_trimmed_entries_are_acknowledged(self):
+        self.client.xpending_range.return_value = [self.pending(b'1-0', 60000, 1), self.pending(b'2-0', 60000, 1)]
+        self.client.xclaim.return_value = [(b'1-0', None), (b'2-0', self.entry(slot_event(2, 'b')))]
+
+        self.assertEqual(self.consumer.claim_stale(10), [(b'2-0', slot_event(2, 'b'))])
+        self.client.xack.assert_called_once_with('vaccine:slot-events', 'notify:email', b'1-0')
+
+    def test_nothing_pending(self):
+        self.client.xpending_range.return_value = []
+
+        self.assertEqual(self.consumer.claim_stale(10), [])
+        self.client.xclaim.assert_not_called()
+
+    def test_ack(self):
+        self.consumer.ack([])
+        self.client.xack.assert_not_called()
+
+        self.consumer.ack([b'1-0', b'2-0'])
+        self.client.xack.assert_called_once_with('vaccine:slot-events', 'notify:email', b'1-0', b'2-0')
+
+    def test_full_backlogs_stop_reading(self):
+        self.client.xpending.return_value = {'pending': 100}
+
+        self.assertEqual(self.consumer.read(10), [])
+        self.client.xreadgroup.assert_not_called()
+
+        self.client.xpending.return_value = {'pending': 99}
+        self.client.xreadgroup.return_value = [[b'vaccine:slot-events', [(b'3-0', self.entry(slot_event(3, 'c')))]]]
+
+        self.assertEqual(self.consumer.read(10), [(b'3-0', slot_event(3, 'c'))])
+
+
+class NearbyCentersTests(SimpleTestCase):
+    # about 1.1 km per 0.01 degree of latitude
+    origin = (12.97, 77.59)
+
+    def setUp(self):
+        self.index = CenterIndex(0.1)
+        patcher = mock.patch.object(NearbyCenters, 'index', return_value=self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_center(self, center_id, latitude_offset, sessions):
+        self.index.add(self.origin[0] + latitude_offset, self.origin[1], {'center_id': center_id, 'sessions': sessions})
+
+    def session(self, capacity, min_age_limit=18):
+        return {'available_capacity': capacity, 'min_age_limit': min_age_limit}
+
+    def search(self, radius_km=20, min_age_limit=None, limit=50):
+        return NearbyCenters().search(self.origin[0], self.origin[1], radius_km, min_age_limit, limit)
+
+    def test_centers_are_ranked_by_distance_then_capacity(self):
+        self.add_center(1, 0.05, [self.session(5)])
+        self.add_center(2, 0.002, [self.session(1)])
+        self.add_center(3, -0.003, [self.session(10), self.session(2)])
+
+        results = self.search()
+
+        self.assertEqual([center['center_id'] for center in results], [3, 2, 1])
+        self.assertEqual(results[0]['available_capacity'], 12)
+        self.assertAlmostEqual(results[2]['distance_km'], 5.56, places=1)
+
+    def test_only_open_sessions_are_returned(self):
+        self.add_center(1, 0.01, [self.session(0), self.session(3)])
+        self.add_center(2, 0.01, [self.session(0)])
+
+        results = self.search()
+
+        self.assertEqual([center['center_id'] for center in results], [1])
+        self.assertEqual(results[0]['sessions'], [self.session(3)])
+
+    def test_sessions_above_the_age_are_skipped(self):
+        self.add_center(1, 0.01, [self.session(3, min_age_limit=45)])
+        self.add_center(2, 0.01, [self.session(3, min_age_limit=18), self.session(4, min_age_limit=45)])
+
+        results = self.search(min_age_limit=30)
+
+        self.assertEqual([center['center_id'] for center in results], [2])
+        self.assertEqual(results[0]['available_capacity'], 3)
+        self.assertEqual(len(self.search()), 2)
+
+    def test_radius_and_limit(self):
+        for center_id in range(5):
+            self.add_center(center_id, 0.01 * center_id, [self.session(1)])
+
+        self.add_center(9, 0.5, [self.session(1)])
+
+        self.assertEqual(len(self.search(radius_km=20)), 5)
+        self.assertEqual(len(self.search(radius_km=3)), 3)
+        self.assertEqual([center['center_id'] for center in self.search(limit=2)], [0, 1])
+
+    def test_results_are_copies(self):
+        self.add_center(1, 0.01, [self.session(0), self.session(3)])
+
+        self.search()
+
+        self.assertEqual(len(self.index.query(self.origin[0], self.origin[1], 20)[0][1]['sessions']), 2)
@@ -1,14 +1,20 @@
 from django.urls import include, path
-from vaccine.views import manage_states, manage_districts, calendar_pin, calendar_district, register_user, auth
+from vaccine.views import manage_states, manage_districts, calendar_pin, calendar_district, calendar_batch, calendar_nearby, slot_stream, sweep_reports, sweep_report, admin_subscribers, register_user, auth
 
 app_name = 'vaccine'
 
 
 urlpatterns = [
     path('states', manage_states, name='manage_states'),
-    path('districts/<state_code>', manage_districts, name='manage_districts'),
+    path('districts/<int:state_code>', manage_districts, name='manage_districts'),
     path('calendar/pin', calendar_pin, name='calendar_pin'),
     path('calendar/district', calendar_district, name='calendar_district'),
+    path('calendar/batch', calendar_batch, name='calendar_batch'),
+    path('calendar/nearby', calendar_nearby, name='calendar_nearby'),
+    path('stream', slot_stream, name='slot_stream'),
+    path('sweeps', sweep_reports, name='sweep_reports'),
+    path('sweeps/<run_id>', sweep_report, name='sweep_report'),
+    path('admin/subscribers', admin_subscribers, name='admin_subscribers'),
     path('auth', auth, name='auth'),
     path('register', register_user, name='register_user'),
 ]
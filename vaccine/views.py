@@ -1,12 +1,24 @@
 from commons.utils.response import OK
-from commons.utils.http_error import BadRequest
+from commons.utils.http_error import BadRequest, Forbidden, NotFound, ServiceUnavailable
+from commons.utils.pagination import create_cursor_pagination_url, decode_cursor, encode_cursor
+from django.http import StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
+from pymodm.errors import ValidationError
+from pymongo.errors import DuplicateKeyError
+from redis.exceptions import ConnectionError as RedisConnectionError
+import hmac
 import json
-from vaccine.helpers import fetch_states, fetch_districts, fetch_calender_by_pin, fetch_calender_by_district
-from commons.utils.email import Gmail, validate_email, validate_pincode
+import math
+from vaccine.catalogue import district_catalogue, states_body
+from vaccine.geo_index import nearby_centers
+from vaccine.geography import pincode_table
+from vaccine.slot_events import SlotEventStream, district_channel, pincode_channel, subscribe_slot_events
+from vaccine.calendars import calendar_coalescer, calendar_weeks, fetch_calendar_batch
+from commons.utils.email import validate_email, validate_pincode
 from commons.utils.otp import otpgen, encrypt, decrypt, authorize_user
-from vaccine.models import UserDetails
-from vaccine.tasks import send_vaccine_alert
+from vaccine.models import SweepReport, UserDetails
+from vaccine.reports import fetch_deliveries
+from vaccine.tasks import alert_open_sessions, send_otp_email, send_vaccine_alert
 from django.conf import settings
 
 
@@ -19,8 +31,7 @@ def manage_states(request):
         response: states list
     """
 
-    states = fetch_states()
-    return OK(states)
+    return states_body.response(request)
 
 
 @require_http_methods(["GET"])
@@ -32,8 +43,46 @@ def manage_districts(request, state_code):
         response: districts list
     """
 
-    districts = fetch_districts(state_code)
-    return OK(districts)
+    return district_catalogue.get(state_code).response(request)
+
+
+def validate_calendar_lookup(lookup_type, value):
+    """Validates a pincode or district id before it is looked up in the calendar cache or upstream
+    Args:
+        lookup_type: pincode or district_id
+        value: pincode or district id sent by the user
+    Raises:
+        BadRequest: If the value is not a pincode or a numeric district id
+    """
+
+    if lookup_type == 'pincode' and not validate_pincode(value):
+        raise BadRequest(f"Invalid Pincode: {value}")
+
+    if lookup_type == 'district_id' and not value.isdigit():
+        raise BadRequest(f"Invalid District: {value}")
+
+
+def calendar_lookup(request, lookup_type):
+    """Reads and validates the lookup and date query params of a calendar request
+    Args:
+        request: A Django HttpRequest
+        lookup_type: pincode or district_id
+    Returns:
+        value: pincode or district id
+        date: date as dd-mm-yyyy
+    Raises:
+        BadRequest: If the lookup or the date is invalid
+    """
+
+    value = request.GET.get(lookup_type, '')
+    validate_calendar_lookup(lookup_type, value)
+
+    try:
+        date = calendar_weeks(request.GET.get('date', ''), None)[0]
+    except ValueError:
+        raise BadRequest("Invalid date, dates must be of format dd-mm-yyyy")
+
+    return value, date
 
 
 @require_http_methods(["GET"])
@@ -45,12 +94,8 @@ def calendar_pin(request):
         response: calendar by pin
     """
 
-    url_params = {
-        "pincode": request.GET.get('pincode', ''),
-        "date": request.GET.get('date', '')
-    }
-
-    calendar_pin = fetch_calender_by_pin(url_params)
+    pincode, date = calendar_lookup(request, 'pincode')
+    calendar_pin = calendar_coalescer.get('pincode', pincode, date)
 
     return OK(calendar_pin)
 
@@ -64,14 +109,239 @@ def calendar_district(request):
         response: calendar by districts
     """
 
-    url_params = {
-        "district_id": request.GET.get('district_id', ''),
-        "date": request.GET.get('date', '')
+    district_id, date = calendar_lookup(request, 'district_id')
+    calendar_district = calendar_coalescer.get('district_id', district_id, date)
+
+    return OK(calendar_district)
+
+
+@require_http_methods(["POST"])
+def calendar_batch(request):
+    """View to fetch calendars of many pincodes and districts over a date range in one request
+    Args:
+        request: A Django HttpRequest with a JSON body of pincodes, district_ids, from and to dates
+    Returns:
+        response: merged and deduplicated centers along with the lookups which failed
+    """
+
+    request_data = json.loads(request.body.decode('utf-8'))
+
+    if not isinstance(request_data, dict) or not all(
+        isinstance(request_data.get(field, []), list) and
+        all(isinstance(item, (str, int)) for item in request_data.get(field, []))
+        for field in ('pincodes', 'district_ids')
+    ):
+        raise BadRequest("pincodes and district_ids must be lists of strings or numbers")
+
+    lookups = (
+        [('pincode', str(pincode)) for pincode in dict.fromkeys(request_data.get('pincodes', []))] +
+        [('district_id', str(district)) for district in dict.fromkeys(request_data.get('district_ids', []))]
+    )
+
+    if not lookups or len(lookups) > settings.CALENDAR_BATCH_MAX_LOOKUPS:
+        raise BadRequest(f"Between 1 and {settings.CALENDAR_BATCH_MAX_LOOKUPS} pincodes and districts are required")
+
+    for lookup_type, value in lookups:
+        validate_calendar_lookup(lookup_type, value)
+
+    try:
+        weeks = calendar_weeks(request_data.get('from', ''), request_data.get('to'))
+    except (TypeError, ValueError) as e:
+        raise BadRequest(f"Invalid date range, dates must be of format dd-mm-yyyy: {e}")
+
+    return OK(fetch_calendar_batch(lookups, weeks, request_data.get('to') or request_data.get('from')))
+
+
+@require_http_methods(["GET"])
+def calendar_nearby(request):
+    """View to find open sessions around a pincode or a coordinate
+    Args:
+        request: A Django HttpRequest
+    Returns:
+        response: centers with open sessions ranked by distance and capacity
+    """
+
+    pincode = request.GET.get('pincode', '')
+
+    try:
+        if pincode:
+            if not len(pincode_table):
+                raise ServiceUnavailable("Pincode search is not available at this moment, search by lat and lon")
+
+            location = pincode_table.lookup(pincode)
+
+            if not location:
+                raise BadRequest("Unknown Pincode")
+
+            latitude, longitude = location.latitude, location.longitude
+        else:
+            latitude, longitude = float(request.GET['lat']), float(request.GET['lon'])
+
+        radius = min(float(request.GET.get('radius', 20)), settings.GEO_SEARCH_MAX_RADIUS_KM)
+        age = int(request.GET['age']) if request.GET.get('age') else None
+        limit = min(int(request.GET.get('limit', 50)), 200)
+
+    except (KeyError, ValueError):
+        raise BadRequest("pincode or lat and lon are required, radius, age and limit must be numbers")
+
+    if not (math.isfinite(latitude) and math.isfinite(longitude)) or abs(latitude) > 90 or abs(longitude) > 180:
+        raise BadRequest("lat must be between -90 and 90 and lon between -180 and 180")
+
+    if not math.isfinite(radius) or radius <= 0 or limit < 1:
+        raise BadRequest("radius must be positive and limit at least 1")
+
+    centers = nearby_centers.search(latitude, longitude, radius, min_age_limit=age, limit=limit)
+
+    return OK({'centers': centers})
+
+
+@require_http_methods(["GET"])
+def slot_stream(request):
+    """View to stream slot openings of pincodes and districts as Server-Sent Events
+    Args:
+        request: A Django HttpRequest with comma separated pincodes and district_ids query params
+    Returns:
+        response: text/event-stream of slot-open events
+    """
+
+    pincodes = [pincode for pincode in request.GET.get('pincodes', '').split(',') if pincode]
+    district_ids = [district for district in request.GET.get('district_ids', '').split(',') if district]
+
+    if not pincodes and not district_ids or len(pincodes) + len(district_ids) > settings.SLOT_STREAM_MAX_CHANNELS:
+        raise BadRequest(f"Between 1 and {settings.SLOT_STREAM_MAX_CHANNELS} pincodes and districts are required")
+
+    if not all(validate_pincode(pincode) for pincode in pincodes) or not all(map(str.isdigit, district_ids)):
+        raise BadRequest("Invalid pincode or district id")
+
+    if district_ids and not len(pincode_table):
+        # events only carry a district once their pincode resolves, district channels would stay silent
+        raise ServiceUnavailable("District streams are not available at this moment, subscribe to pincodes")
+
+    channels = (
+        [pincode_channel.format(pincode=pincode) for pincode in pincodes] +
+        [district_channel.format(district_id=district_id) for district_id in district_ids]
+    )
+
+    try:
+        pubsub = subscribe_slot_events(channels)
+    except RedisConnectionError:
+        raise ServiceUnavailable("Too many open slot streams, please try again later")
+
+    response = StreamingHttpResponse(
+        SlotEventStream(pubsub, settings.SLOT_STREAM_HEARTBEAT, settings.SLOT_STREAM_MAX_DURATION),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+
+    return response
+
+
+@require_http_methods(["GET"])
+def sweep_reports(request):
+    """View to list the summaries of the latest availability sweeps
+    Args:
+        request: A Django HttpRequest with an optional limit query param
+    Returns:
+        response: sweep reports with their delivery counters per notifier, newest first
+    """
+
+    authorize_admin(request)
+
+    try:
+        limit = min(int(request.GET.get('limit', 24)), 168)
+    except ValueError:
+        raise BadRequest("Invalid limit")
+
+    if limit < 1:
+        raise BadRequest("limit must be at least 1")
+
+    reports = SweepReport.objects.fetch_sweep_reports(limit=limit)
+    deliveries = fetch_deliveries([report['runId'] for report in reports])
+
+    for report in reports:
+        report['deliveries'] = deliveries.get(report['runId'], {})
+
+    return OK({'data': {'sweepReports': reports}})
+
+
+@require_http_methods(["GET"])
+def sweep_report(request, run_id):
+    """View to get the summary of an availability sweep
+    Args:
+        request: A Django HttpRequest
+        run_id: id of the sweep run
+    Returns:
+        response: sweep report with its upstream latency histogram and delivery counters per notifier
+    """
+
+    authorize_admin(request)
+
+    report = SweepReport.objects.fetch_sweep_report(run_id)
+
+    if not report:
+        raise NotFound("Sweep report not found")
+
+    report['deliveries'] = fetch_deliveries([run_id]).get(run_id, {})
+
+    return OK({'data': {'sweepReport': report}})
+
+
+@require_http_methods(["GET"])
+def admin_subscribers(request):
+    """View to page through subscribers for admins
+    Args:
+        request: A Django HttpRequest with optional limit, cursor, active and pincode query params
+    Returns:
+        response: a page of subscribers in registration order and the url of the next page
+    """
+
+    authorize_admin(request)
+
+    try:
+        limit = min(int(request.GET.get('limit', 100)), settings.ADMIN_PAGE_MAX_LIMIT)
+    except ValueError:
+        raise BadRequest("Invalid limit")
+
+    if limit < 1:
+        raise BadRequest("Invalid limit")
+
+    query = {}
+    query_params = {}
+
+    if request.GET.get('active') in ('true', 'false'):
+        query['active'] = request.GET['active'] == 'true'
+        query_params['active'] = request.GET['active']
+
+    if request.GET.get('pincode'):
+        if not validate_pincode(request.GET['pincode']):
+            raise BadRequest("Invalid Pincode")
+
+        query['pincode'] = query_params['pincode'] = request.GET['pincode']
+
+    projection = {
+        'email': 1,
+        'age': 1,
+        'pincode': 1,
+        'district': 1,
+        'active': 1,
+        'alertCount': 1,
+        'createdOn': 1,
+        'updatedOn': 1
     }
 
-    calendar_district = fetch_calender_by_district(url_params)
+    subscribers, position = UserDetails.objects.get_keyset_page(
+        limit, queries=query, projection=projection, after=decode_cursor(request.GET.get('cursor'))
+    )
 
-    return OK(calendar_district)
+    data = {
+        "data": {
+            "subscribers": subscribers,
+            "next": create_cursor_pagination_url(request.path, encode_cursor(position), limit, query_params)
+        }
+    }
+
+    return OK(data)
 
 
 @require_http_methods(["GET", "POST"])
@@ -84,12 +354,10 @@ def auth(request):
             raise BadRequest("Invalid Email Address")
 
         otp = otpgen()
-
-        gmail = Gmail(settings.GMAIL_USER, settings.GMAIL_PASSWORD)
-        gmail.send_message(email, 'Vaccine Alert One Time Password', f'Please use OTP - {otp} to register for vaccine alert')
-
         encrypted_key = encrypt(otp).decode()
 
+        send_otp_email.apply_async((email, encrypted_key), expires=settings.OTP_EMAIL_EXPIRES)
+
         data = {
             'encrypted_key': encrypted_key
         }
@@ -115,6 +383,53 @@ def auth(request):
         return OK(data)
 
 
+def authorize_admin(request):
+    """Checks the admin API token sent as a bearer token
+    Args:
+        request: A Django HttpRequest
+    Raises:
+        Forbidden: If ADMIN_API_TOKEN is not configured or the token does not match
+    """
+
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    token = authorization[len('Bearer '):] if authorization.startswith('Bearer ') else ''
+
+    if not settings.ADMIN_API_TOKEN or not hmac.compare_digest(token.encode(), settings.ADMIN_API_TOKEN.encode()):
+        raise Forbidden()
+
+
+def locate_district(pincode, district=None):
+    """Validates a pincode and resolves its district from the pincode table
+    Args:
+        pincode: pincode sent by the user
+        district: district sent by the user, used when the pincode is not in the table
+    Returns:
+        district: CoWIN district id of the pincode
+    Raises:
+        BadRequest: If the pincode is malformed or, once the table is loaded, unknown. While the table is empty,
+                    if no district is sent along with the pincode
+    """
+
+    if not pincode:
+        return district
+
+    if not validate_pincode(str(pincode)):
+        raise BadRequest("Invalid Pincode")
+
+    location = pincode_table.lookup(pincode)
+
+    if location:
+        return str(location.district_id)
+
+    if len(pincode_table):
+        raise BadRequest("Invalid Pincode")
+
+    if not district:
+        raise BadRequest("District is required, pincodes can not be resolved at this moment")
+
+    return district
+
+
 @require_http_methods(["POST", "PATCH"])
 def register_user(request):
 
@@ -130,55 +445,60 @@ def register_user(request):
         if not email or not validate_email(email):
             raise BadRequest("Invalid Email Address")
 
-        user_details = UserDetails.objects.fetch_user_details(email)
-        if user_details:
-            raise BadRequest("User Alerady registered")
+        district = locate_district(pincode, request_data.get("district"))
 
-        if pincode and not validate_pincode(pincode):
-            raise BadRequest("Invalid Pincode")
+        if not UserDetails.objects.has_unique_email_index():
+            # without the index an already registered email would be inserted again
+            raise ServiceUnavailable("Registration is not available at this moment. Please try again later.")
 
         try:
 
             user_details = {
                 "email": request_data['email'],
-                "district": request_data.get("district"),
+                "district": district,
                 "pincode": request_data.get("pincode"),
                 "age": request_data["age"],
             }
 
             user_details = UserDetails.objects.insert_user_details(user_details)
 
-        except Exception:
+        except DuplicateKeyError:
+            raise BadRequest("User Alerady registered")
+
+        except (KeyError, ValidationError):
             raise BadRequest("Email, district, pincode, age are required")
 
         return OK({'data': user_details})
 
     if request.method == 'PATCH':
         email = request_data['email']
-        user_details = UserDetails.objects.fetch_user_details(email)
-
-        if (user_details['active'] == request_data['active'] and user_details.get("pincode", '') == request_data.get("pincode", '') and 
-                user_details['age'] == request_data['age'] and user_details.get("district", '') == request_data.get("district", '')):
-
-            raise BadRequest("Nothing to Update")
 
-        if not email or not validate_email(email) or not user_details:
+        if not email or not validate_email(email):
             raise BadRequest("Invalid Email Address")
 
-        if request_data.get("district", '') and validate_pincode(request_data.get("district", '')):
-            raise BadRequest("Invalid Pincode")
+        district = locate_district(request_data.get("pincode"), request_data.get("district"))
 
         try:
             user_details = {
-                "district": request_data.get("district"),
+                "district": district,
                 "pincode": request_data.get("pincode"),
                 "age": request_data["age"],
                 "active": request_data["active"]
             }
 
-            user_details = UserDetails.objects.update_user_details(email, user_details)
-
-        except Exception:
+        except KeyError:
             raise BadRequest("Email, district, pincode, age are required")
 
-        return OK(user_details)
+        updated_user_details = UserDetails.objects.update_user_details(email, user_details)
+
+        if not updated_user_details:
+            # the conditional update matched nothing, a second lookup only tells the two failures apart
+            if not UserDetails.objects.fetch_user_details(email):
+                raise BadRequest("Invalid Email Address")
+
+            raise BadRequest("Nothing to Update")
+
+        if updated_user_details.get('active'):
+            alert_open_sessions.delay(email)
+
+        return OK(updated_user_details)